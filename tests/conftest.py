@@ -0,0 +1,90 @@
+''' fixtures shared by the tests '''
+
+import configparser
+import os
+import queue
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tvh_radio    # pylint:disable=wrong-import-position
+
+
+@pytest.fixture
+def app_globals():
+    ''' the globals as the __main__ block sets them, with the default settings '''
+
+    settings = configparser.ConfigParser()
+    settings.add_section(tvh_radio.SETTINGS_SECTION)
+    # nothing is played or probed
+    settings.set(tvh_radio.SETTINGS_SECTION, tvh_radio.PLAYER_BACKEND, tvh_radio.PB_FAKE)
+    settings.set(tvh_radio.SETTINGS_SECTION, tvh_radio.TS_PROBE_SECS, '0')
+    tvh_radio.GLOBALS.clear()
+    tvh_radio.GLOBALS.update({
+        tvh_radio.G_CHAN_NUM_FUTURE: 0,
+        tvh_radio.G_CHAN_NAME_FUTURE: '',
+        tvh_radio.G_CHAN_NAME_PLAYING: '',
+        tvh_radio.G_CHAN_TAG: '',
+        tvh_radio.G_CHAN_UPDATES: queue.Queue(),
+        tvh_radio.G_CONFIG: tvh_radio.Config(settings),
+        tvh_radio.G_DBG_LEVEL: 0,
+        tvh_radio.G_EPG: None,
+        tvh_radio.G_EPG_CHANGES: None,
+        tvh_radio.G_EPG_RESULTS: [],
+        tvh_radio.G_EVENTS: None,
+        tvh_radio.G_LOOP: None,
+        tvh_radio.G_BG_TASKS: set(),
+        tvh_radio.G_KEY_STROKE: '',
+        tvh_radio.G_LOGOS: None,
+        tvh_radio.G_MY_SETTINGS: settings,
+        tvh_radio.G_PLAYER: None,
+        tvh_radio.G_PLAYER_PID: 0,
+        tvh_radio.G_PLAY_MODE: tvh_radio.PM_TV,
+        tvh_radio.G_PROFILES: [],
+        tvh_radio.G_PROFILE_STATS: {},
+        tvh_radio.G_QUALITY: None,
+        tvh_radio.G_QUIT_FLAG: False,
+        tvh_radio.G_RELAY: None,
+        tvh_radio.G_SEARCH_TEXT: None,
+        tvh_radio.G_STATUS: None,
+        tvh_radio.G_STOP_PLAYBACK: False,
+        tvh_radio.G_SUPERVISOR: None,
+        tvh_radio.G_WARMUP: None,
+    })
+    yield tvh_radio.GLOBALS
+    tvh_radio.GLOBALS.clear()
+
+
+@pytest.fixture
+def local_server():
+    ''' starts a local server with the request handler class given, standing in
+        for the TVH server or a logo host, and returns its URL; the servers are
+        shut down after the test '''
+
+    servers = []
+
+    def start(handler_class):
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append(httpd)
+        return f'http://127.0.0.1:{ httpd.server_address[1] }'
+
+    yield start
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def wait_for(condition, timeout=5.0):
+    ''' polls until the condition is true, or fails the test '''
+
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
@@ -0,0 +1,112 @@
+''' the channel table and keeping it up to date '''
+
+import asyncio
+
+import requests
+
+import tvh_radio
+
+
+def test_deleting_the_last_channel_of_the_tag_resets_it(app_globals):
+    ''' a tag which loses its last channel is no longer zapped through '''
+
+    chan_table = tvh_radio.ChannelTable([('One', '01' * 16, ['t1'], ''),
+                                         ('Two', '02' * 16, ['t2'], ''),
+                                         ('Three', '03' * 16, ['t2'], ''), ],
+                                        [('t1', 'Tag 1'), ('t2', 'Tag 2'), ])
+    app_globals[tvh_radio.G_CHAN_TAG] = 't1'
+    app_globals[tvh_radio.G_CHAN_UPDATES].put(('delete', '01' * 16, ))
+
+    (chan_table, chan_num, chan_view, view_pos) = tvh_radio.apply_chan_updates(chan_table, 0, 0)
+    assert app_globals[tvh_radio.G_CHAN_TAG] == ''
+    assert list(chan_view) == [0, 1]
+    assert chan_table.tag_order() == ['t2']
+    assert chan_view[view_pos] == chan_num
+
+
+def test_vanished_tag_is_reset(app_globals):
+    ''' a tag the server deleted is no longer zapped through '''
+
+    chan_table = tvh_radio.ChannelTable([('One', '01' * 16, ['t1'], ''), ], [('t1', 'Tag 1'), ])
+    app_globals[tvh_radio.G_CHAN_TAG] = 't1'
+    app_globals[tvh_radio.G_CHAN_UPDATES].put(('tags', [], ))
+    tvh_radio.apply_chan_updates(chan_table, 0, 0)
+    assert app_globals[tvh_radio.G_CHAN_TAG] == ''
+
+
+def test_comet_survives_an_unreachable_server(app_globals, monkeypatch):
+    ''' the listener keeps retrying when the notifications and the reload both fail '''
+
+    monkeypatch.setattr(tvh_radio, 'COMET_RETRY_SECS', 0.01)
+    app_globals[tvh_radio.G_CONFIG].ts_comet = True
+    calls = []
+
+    def unreachable(api_path, **_kwargs):
+        calls.append(api_path)
+        raise requests.exceptions.ConnectionError('unreachable')
+
+    monkeypatch.setattr(tvh_radio, 'tvh_api_get', unreachable)
+
+    async def scenario():
+        app_globals[tvh_radio.G_LOOP] = asyncio.get_running_loop()
+        app_globals[tvh_radio.G_EVENTS] = asyncio.Queue()
+        comet_task = asyncio.create_task(tvh_radio.comet_listen())
+        while calls.count(tvh_radio.TS_URL_CMT) < 3:
+            assert not comet_task.done(), comet_task.exception()
+            await asyncio.sleep(0.01)
+        app_globals[tvh_radio.G_QUIT_FLAG] = True
+        comet_task.cancel()
+
+    asyncio.run(scenario())
+    assert len([call for call in calls if call != tvh_radio.TS_URL_CMT]) >= 2
+
+
+class FakeResponse:
+    ''' enough of a requests response for the API calls '''
+
+    def __init__(self, status_code, reply):
+        self.status_code = status_code
+        self.content = b''
+        self.reply = reply
+
+    def json(self):
+        ''' the reply, or the error parsing it '''
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return self.reply
+
+
+def test_comet_survives_bad_channel_details(app_globals, monkeypatch):
+    ''' a malformed or incomplete details reply skips the change, the listener keeps going '''
+
+    app_globals[tvh_radio.G_CONFIG].ts_comet = True
+    calls = []
+    details_replies = [ValueError('not json'), {'entries': [{'params': []}]}, ]
+
+    def server(api_path, **_kwargs):
+        calls.append(api_path)
+        if api_path == tvh_radio.TS_URL_CMT:
+            return (api_path, FakeResponse(200, {
+                'boxid': 'box', 'messages': [{'notificationClass': 'channel', 'change': ['01' * 16]}], }))
+        if api_path == tvh_radio.TS_URL_IDL:
+            return (api_path, FakeResponse(200, details_replies[calls.count(api_path) % 2]))
+        return (api_path, FakeResponse(500, None))
+
+    monkeypatch.setattr(tvh_radio, 'tvh_api_get', server)
+
+    async def scenario():
+        app_globals[tvh_radio.G_LOOP] = asyncio.get_running_loop()
+        app_globals[tvh_radio.G_EVENTS] = asyncio.Queue()
+        comet_task = asyncio.create_task(tvh_radio.comet_listen())
+        while calls.count(tvh_radio.TS_URL_CMT) < 4:
+            assert not comet_task.done(), comet_task.exception()
+            await asyncio.sleep(0.01)
+        app_globals[tvh_radio.G_QUIT_FLAG] = True
+        comet_task.cancel()
+
+    asyncio.run(scenario())
+    assert calls.count(tvh_radio.TS_URL_IDL) >= 2
+    updates = []
+    while not app_globals[tvh_radio.G_CHAN_UPDATES].empty():
+        updates.append(app_globals[tvh_radio.G_CHAN_UPDATES].get())
+    assert not [update for update in updates if update[0] == 'update']
@@ -0,0 +1,49 @@
+''' applying edits to the settings file whilst the app runs '''
+
+import asyncio
+import os
+
+import tvh_radio
+
+
+def test_edited_play_mode_is_applied(app_globals, monkeypatch, tmp_path):
+    ''' a changed play mode switches mode, an edit of something else doesn't
+        undo a switch made with the v key '''
+
+    monkeypatch.setattr(tvh_radio, 'CONFIG_POLL_SECS', 0.01)
+    settings = app_globals[tvh_radio.G_MY_SETTINGS]
+    settings_file = str(tmp_path / 'settings.ini')
+    settings.set(tvh_radio.SETTINGS_SECTION, tvh_radio.PLAY_MODE, tvh_radio.PM_TV)
+    app_globals[tvh_radio.G_CONFIG] = tvh_radio.Config(settings)
+    app_globals[tvh_radio.G_PLAY_MODE] = tvh_radio.PM_TV
+
+    def edit(option, value, mtime):
+        settings.set(tvh_radio.SETTINGS_SECTION, option, value)
+        with open(settings_file, 'w', encoding='utf-8') as settings_handle:
+            settings.write(settings_handle)
+        os.utime(settings_file, (mtime, mtime, ))
+
+    async def wait_for_reload(config):
+        while app_globals[tvh_radio.G_CONFIG] is config:
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        edit(tvh_radio.PLAY_MODE, tvh_radio.PM_TV, 1000)
+        watch_task = asyncio.create_task(tvh_radio.config_watch(settings_file))
+        await asyncio.sleep(0.05)
+
+        edit(tvh_radio.PLAY_MODE, tvh_radio.PM_RADIO, 2000)
+        await asyncio.wait_for(wait_for_reload(app_globals[tvh_radio.G_CONFIG]), 5)
+        assert app_globals[tvh_radio.G_PLAY_MODE] == tvh_radio.PM_RADIO
+
+        # v pressed, then something else edited
+        app_globals[tvh_radio.G_PLAY_MODE] = tvh_radio.PM_TV
+        edit(tvh_radio.TS_PROBE_SECS, '1', 3000)
+        await asyncio.wait_for(wait_for_reload(app_globals[tvh_radio.G_CONFIG]), 5)
+        assert app_globals[tvh_radio.G_CONFIG].ts_probe_secs == 1
+        assert app_globals[tvh_radio.G_PLAY_MODE] == tvh_radio.PM_TV
+
+        app_globals[tvh_radio.G_QUIT_FLAG] = True
+        watch_task.cancel()
+
+    asyncio.run(scenario())
@@ -0,0 +1,66 @@
+''' the programme guide index '''
+
+import asyncio
+import threading
+import time
+
+import tvh_radio
+
+
+def programme(event_id, title, chan_uuid='01' * 16):
+    ''' a programme starting now, as get_tvh_epg_events returns it '''
+    now = int(time.time())
+    return (event_id, now, now + 3600, chan_uuid, title, '', '', )
+
+
+def test_search_matches_word_prefixes(app_globals):
+    ''' every word of the query must start a word of the programme '''
+
+    epg_index = tvh_radio.EpgIndex()
+    epg_index.add([programme(1, 'Evening News'), programme(2, 'Jazz Evening'),
+                   programme(3, 'Newsround'), ])
+    assert [result[0] for result in epg_index.search('news')] == [1, 3]
+    assert [result[0] for result in epg_index.search('even new')] == [1]
+    epg_index.apply(('remove', [1], ))
+    assert [result[0] for result in epg_index.search('news')] == [3]
+
+
+def test_changes_during_a_fetch_are_kept(app_globals, monkeypatch):
+    ''' changes which arrive whilst the whole guide is fetched are applied to
+        the new index, which was fetched before them '''
+
+    app_globals[tvh_radio.G_CONFIG].epg_days = 7
+    monkeypatch.setattr(tvh_radio, 'EPG_POLL_SECS', 0.01)
+    fetching = threading.Event()
+    release = threading.Event()
+
+    def load_epg_index(_epg_days):
+        fetching.set()
+        release.wait(5)
+        epg_index = tvh_radio.EpgIndex()
+        epg_index.add([programme(1, 'Old News'), programme(2, 'Jazz'), ])
+        return epg_index
+
+    monkeypatch.setattr(tvh_radio, 'load_epg_index', load_epg_index)
+
+    async def scenario():
+        app_globals[tvh_radio.G_LOOP] = asyncio.get_running_loop()
+        watch_task = asyncio.create_task(tvh_radio.epg_watch())
+        while not fetching.is_set():
+            await asyncio.sleep(0.01)
+
+        assert tvh_radio.epg_wanted()
+        tvh_radio.apply_epg_change(('remove', [1], ))
+        tvh_radio.apply_epg_change(('add', [programme(3, 'New News'), ], ))
+        release.set()
+        while app_globals[tvh_radio.G_EPG] is None:
+            await asyncio.sleep(0.01)
+
+        app_globals[tvh_radio.G_QUIT_FLAG] = True
+        watch_task.cancel()
+        epg_index = app_globals[tvh_radio.G_EPG]
+        assert [result[0] for result in epg_index.search('news')] == [3]
+        assert len(epg_index) == 2
+        assert app_globals[tvh_radio.G_EPG_CHANGES] is None
+
+    asyncio.run(scenario())
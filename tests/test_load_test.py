@@ -0,0 +1,79 @@
+''' the load tester, against a local server '''
+
+import os
+import re
+import subprocess
+import sys
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tvh_radio.py')
+
+
+class FakeTvhHandler(BaseHTTPRequestHandler):
+    ''' answers api/ok, and 404s everything else '''
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):   # pylint:disable=invalid-name
+        ''' implement the http GET method '''
+        body = b'{"entries": []}'
+        self.send_response(200 if self.path.startswith('/api/ok') else 404)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint:disable=redefined-builtin
+        pass
+
+
+@pytest.fixture
+def fake_tvh(local_server):
+    ''' a local server, returns its URL '''
+    return local_server(FakeTvhHandler)
+
+
+def run_load_test(tmp_path, *args):
+    ''' runs the load tester with an empty home directory, so no settings '''
+
+    env = dict(os.environ, HOME=str(tmp_path))
+    return subprocess.run([sys.executable, SCRIPT, '-l', *args], env=env, stdin=subprocess.DEVNULL,
+                          capture_output=True, text=True, timeout=60, check=False)
+
+
+def report(output, label):
+    ''' returns the request count, error count and percentile line of a target '''
+
+    match = re.search(f'=== { re.escape(label) }\nrequests (\\d+), errors (\\d+), .*\n(.*)', output)
+    assert match, output
+    return (int(match.group(1)), int(match.group(2)), match.group(3), )
+
+
+def test_load_test_counts_requests_and_errors(tmp_path, fake_tvh):
+    ''' runs without a settings file and reports each target '''
+
+    result = run_load_test(tmp_path, '--url', fake_tvh, '--clients', '2', '--duration', '0.5',
+                           '--endpoint', 'api/ok', '--endpoint', 'api/missing')
+
+    # any error fails the run
+    assert result.returncode == 1, result.stdout + result.stderr
+    (requests_ok, errors_ok, percentiles) = report(result.stdout, 'api/ok')
+    assert requests_ok > 0
+    assert errors_ok == 0
+    assert re.fullmatch(r'p50 [\d.]+ms, p95 [\d.]+ms, p99 [\d.]+ms, max [\d.]+ms', percentiles)
+    (requests_missing, errors_missing, _percentiles) = report(result.stdout, 'api/missing')
+    assert requests_missing == 0
+    assert errors_missing > 0
+    # the clients take the targets in turn
+    assert abs(errors_missing - requests_ok) <= 2
+
+
+def test_load_test_passes_without_errors(tmp_path, fake_tvh):
+    ''' a clean run exits 0 '''
+
+    result = run_load_test(tmp_path, '--url', fake_tvh, '--clients', '1', '--duration', '0.3',
+                           '--endpoint', 'api/ok')
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert report(result.stdout, 'api/ok')[0] > 0
@@ -0,0 +1,100 @@
+''' the logo cache, against a local server '''
+
+import io
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import tvh_radio
+from conftest import wait_for
+
+LOGOS = {}          # path => content
+SLOW_SECS = 5
+
+
+class LogoHandler(BaseHTTPRequestHandler):
+    ''' serves LOGOS, and /slow after a long wait '''
+
+    def do_GET(self):   # pylint:disable=invalid-name
+        ''' implement the http GET method '''
+        if self.path == '/slow':
+            time.sleep(SLOW_SECS)
+        body = LOGOS.get(self.path, b'slow logo')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint:disable=redefined-builtin
+        pass
+
+
+@pytest.fixture
+def logo_server(local_server):
+    ''' a local server, returns its URL '''
+    return local_server(LogoHandler)
+
+
+def test_close_does_not_wait_for_fetches(app_globals, logo_server, tmp_path):
+    ''' closing with a fetch in progress returns at once '''
+
+    logos = tvh_radio.LogoCache(str(tmp_path), 1024 * 1024, 1, None)
+    logos.fetch([f'{ logo_server }/slow'])
+    time.sleep(0.2)
+    started = time.monotonic()
+    logos.close()
+    assert time.monotonic() - started < 1
+    for fetcher in threading.enumerate():
+        if fetcher.name != 'MainThread' and fetcher.is_alive():
+            assert fetcher.daemon
+
+
+def test_evicts_the_least_recently_shown(app_globals, logo_server, tmp_path):
+    ''' a logo shown recently survives a fetched but unshown one '''
+
+    for logo_num in range(3):
+        LOGOS[f'/logo{ logo_num }'] = bytes([logo_num]) * 1000
+    urls = [f'{ logo_server }/logo{ logo_num }' for logo_num in range(3)]
+    logos = tvh_radio.LogoCache(str(tmp_path), 2500, 1, None)
+
+    logos.fetch(urls[:1])
+    wait_for(lambda: logos.path(urls[0]) is not None)
+    logos.fetch(urls[1:2])
+    wait_for(lambda: logos.path(urls[1]) is not None)
+    # showing the first makes the second the least recently used
+    time.sleep(0.01)
+    logos.path(urls[0])
+
+    logos.fetch(urls[2:])
+    wait_for(lambda: urls[2] in logos.urls)
+    assert logos.path(urls[0]) is not None
+    assert logos.path(urls[1]) is None
+    logos.close()
+
+
+@pytest.mark.skipif(tvh_radio.Image is None, reason='needs PIL')
+def test_thumbnail_made_later_is_counted(app_globals, logo_server, tmp_path):
+    ''' a thumbnail added to a logo cached without one counts against the cap '''
+
+    image_bytes = io.BytesIO()
+    tvh_radio.Image.new('RGB', (200, 200), 'red').save(image_bytes, format='PNG')
+    LOGOS['/red'] = image_bytes.getvalue()
+    url = f'{ logo_server }/red'
+
+    logos = tvh_radio.LogoCache(str(tmp_path), 1024 * 1024, 1, None)
+    logos.fetch([url])
+    wait_for(lambda: url in logos.urls and not logos.pending)
+    logos.close()
+    content_hash = logos.urls[url]['hash']
+    assert logos.blobs[content_hash]['size'] == len(LOGOS['/red'])
+
+    # the next run wants thumbnails, and the logo is due a check
+    logos = tvh_radio.LogoCache(str(tmp_path), 1024 * 1024, 1, (16, 16))
+    logos.urls[url]['checked'] = 0
+    logos.fetch([url])
+    wait_for(lambda: logos.urls[url]['checked'] > 0 and not logos.pending)
+    thumb_size = len(open(logos.thumb_path(content_hash), 'rb').read())
+    assert logos.blobs[content_hash]['size'] == len(LOGOS['/red']) + thumb_size
+    logos.close()
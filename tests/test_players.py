@@ -0,0 +1,179 @@
+''' the player backends '''
+
+import sys
+import time
+
+import pytest
+
+import tvh_radio
+
+
+AUDIO_PID = 0x101
+VIDEO_PID = 0x100
+PMT_PID = 0x1000
+
+
+def ts_packet(pid, payload, counter=0, unit_start=False):
+    ''' a transport stream packet carrying the payload, padded with stuffing
+        in an adaptation field so the payload ends the packet '''
+
+    header = bytes([tvh_radio.TS_SYNC_BYTE, (0x40 if unit_start else 0) | pid >> 8, pid & 0xff, ])
+    stuffing = tvh_radio.TS_PACKET_SIZE - 4 - len(payload)
+    if stuffing == 0:
+        return header + bytes([0x10 | counter]) + payload
+    adaptation = bytes([stuffing - 1]) + (b'\x00' + b'\xff' * (stuffing - 2) if stuffing > 1 else b'')
+    return header + bytes([0x30 | counter]) + adaptation + payload
+
+
+def psi_packet(pid, table_id, body):
+    ''' a packet carrying a whole PSI section, with a dummy CRC '''
+
+    section_length = 5 + len(body) + 4
+    section = bytes([table_id, 0xb0 | section_length >> 8, section_length & 0xff,
+                     0x00, 0x01, 0xc1, 0x00, 0x00, ]) + body + b'\x00' * 4
+    return ts_packet(pid, b'\x00' + section, unit_start=True)
+
+
+def pat_packet():
+    ''' the PAT of a stream of one program '''
+    return psi_packet(tvh_radio.TS_PID_PAT, tvh_radio.TS_TABLE_PAT,
+                      bytes([0x00, 0x01, 0xe0 | PMT_PID >> 8, PMT_PID & 0xff, ]))
+
+
+def pmt_packet():
+    ''' the PMT of a program of H.264 video and English MPEG audio '''
+    return psi_packet(PMT_PID, tvh_radio.TS_TABLE_PMT,
+                      bytes([0xe0 | VIDEO_PID >> 8, VIDEO_PID & 0xff, 0xf0, 0x00,
+                             0x1b, 0xe0 | VIDEO_PID >> 8, VIDEO_PID & 0xff, 0xf0, 0x00,
+                             0x03, 0xe0 | AUDIO_PID >> 8, AUDIO_PID & 0xff, 0xf0, 0x06,
+                             tvh_radio.TS_LANGUAGE_DESCRIPTOR, 4, ]) + b'eng\x00')
+
+
+def pes_packets(pid, data, first_counter=0):
+    ''' packets carrying the data in a PES packet, the first with its header '''
+
+    pes = tvh_radio.TS_PES_START + b'\xc0\x00\x00\x80\x00\x00' + data
+    chunks = [pes[offset:offset + 184] for offset in range(0, len(pes), 184)]
+    return b''.join(ts_packet(pid, chunk, (first_counter + num) & 0x0f, unit_start=num == 0)
+                    for (num, chunk) in enumerate(chunks))
+
+
+class RunningProcess:
+    ''' stands in for a player process which is still running '''
+
+    pid = 1234
+
+    def poll(self):
+        return None
+
+
+def test_mpv_refused_load_is_an_error(app_globals, monkeypatch, tmp_path):
+    ''' a loadfile which mpv rejects isn't reported as playing '''
+
+    player = tvh_radio.MpvIpcPlayer([], str(tmp_path / 'mpv.sock'))
+    player.player_proc = RunningProcess()
+    replies = {'loadfile': {'request_id': 1, 'error': 'invalid parameter'}, }
+    monkeypatch.setattr(player, 'command', lambda *args: replies[args[0]])
+    with pytest.raises(RuntimeError, match='invalid parameter'):
+        player.play('http://tvh.example.com/stream/channel/0')
+
+    replies['loadfile'] = {'request_id': 2, 'error': 'success'}
+    player.play('http://tvh.example.com/stream/channel/0')
+
+
+def test_demuxer_extracts_only_the_audio(app_globals):
+    ''' the PAT and PMT lead to the audio PID, whose payloads are all that's returned,
+        however the stream is split into chunks '''
+
+    audio = bytes(range(256)) * 2
+    stream = pat_packet() + pmt_packet() + pes_packets(VIDEO_PID, b'\xee' * 400) + \
+             pes_packets(AUDIO_PID, audio) + pes_packets(VIDEO_PID, b'\xee' * 400, 3)
+    demuxer = tvh_radio.TsDemuxer(0)
+    assert b''.join(demuxer.feed(stream[offset:offset + 100])
+                    for offset in range(0, len(stream), 100)) == audio
+    assert demuxer.pmt_pid == PMT_PID
+    assert demuxer.audio_streams == [(AUDIO_PID, 'mp2', 'eng', )]
+    assert demuxer.audio_pid == AUDIO_PID
+
+
+def test_demuxer_feeds_the_monitor(app_globals):
+    ''' the monitor counts the continuity errors from the demuxer's packets '''
+
+    monitor = tvh_radio.StreamMonitor('Radio 1')
+    demuxer = tvh_radio.TsDemuxer(0, monitor)
+    stream = pat_packet() + pmt_packet() + pes_packets(AUDIO_PID, b'\x01' * 400) + \
+             pes_packets(AUDIO_PID, b'\x02' * 400, 5)
+    demuxer.feed(stream)
+    assert monitor.totals['bytes'] == len(stream)
+    assert monitor.totals['cc_errors'] == 1
+    assert monitor.pending == b''
+
+
+def test_monitor_counts_continuity_errors_and_stalls(app_globals, monkeypatch, tmp_path):
+    ''' a gap in the counters is an error, a pause in the data is a stall, and
+        enough stalls have the supervisor step down to a lighter profile '''
+
+    clock = [100.0]
+    monkeypatch.setattr(tvh_radio.time, 'monotonic', lambda: clock[0])
+    monitor = tvh_radio.StreamMonitor('Radio 1')
+
+    monitor.feed(b''.join(ts_packet(AUDIO_PID, b'\x01' * 184, counter) for counter in range(3)))
+    clock[0] += 0.5
+    # counter 3 was lost
+    monitor.feed(ts_packet(AUDIO_PID, b'\x01' * 184, 4))
+    clock[0] += 2.5
+    monitor.feed(ts_packet(AUDIO_PID, b'\x01' * 184, 5))
+    summary = monitor.summary()
+    assert summary['cc_errors'] == 1
+    assert summary['stalls'] == 1
+    assert summary['max_gap_secs'] == 2.5
+    assert summary['stalled_secs'] == 0.0
+
+    # a pause still going on is reported before the data resumes
+    clock[0] += 3.0
+    assert monitor.summary()['stalled_secs'] == 3.0
+    assert monitor.summary()['stalls'] == 1
+
+    counter = 6
+    while monitor.summary()['stalls'] < tvh_radio.PROFILE_STEP_DOWN_STALLS:
+        monitor.feed(ts_packet(AUDIO_PID, b'\x01' * 184, counter))
+        counter += 1
+        clock[0] += tvh_radio.QUALITY_STALL_SECS
+    assert counter == 6 + tvh_radio.PROFILE_STEP_DOWN_STALLS - 1
+    assert monitor.totals['cc_errors'] == 1
+
+    player = tvh_radio.FakePlayer([])
+    monkeypatch.setattr(player, 'quality', monitor.summary)
+    app_globals[tvh_radio.G_PLAYER] = player
+    app_globals[tvh_radio.G_PLAYER_PID] = 1
+    supervisor = tvh_radio.PlaybackSupervisor(str(tmp_path))
+    profiles = tvh_radio.mode_profiles(tvh_radio.PM_TV)
+    supervisor.profile = profiles[0]
+    assert supervisor.lighter_profile() == profiles[1]
+
+
+# stands in for mpv: opens the IPC socket, then never answers
+HUNG_MPV = '''
+import socket, sys, time
+path = [arg for arg in sys.argv if arg.startswith('--input-ipc-server=')][0].split('=', 1)[1]
+server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+server.bind(path)
+server.listen(1)
+client = server.accept()[0]
+time.sleep(60)
+'''
+
+
+def test_mpv_which_stops_answering_is_killed(app_globals, monkeypatch, tmp_path):
+    ''' a command mpv doesn't answer fails in time, and leaves the player dead
+        so the supervisor restarts it '''
+
+    monkeypatch.setattr(tvh_radio, 'MPV_REPLY_TIMEOUT', 0.2)
+    player = tvh_radio.MpvIpcPlayer([sys.executable, '-c', HUNG_MPV], str(tmp_path / 'mpv.sock'))
+    started = time.monotonic()
+    with pytest.raises(ConnectionError, match='stopped answering'):
+        player.play('http://tvh.example.com/stream/channel/0')
+    assert time.monotonic() - started < tvh_radio.MPV_IPC_TIMEOUT
+    assert player.pid == 0
+    assert not player.is_playing()
+    player.close()
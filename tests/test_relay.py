@@ -0,0 +1,115 @@
+''' the stream relay, in front of a local server '''
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+import tvh_radio
+from conftest import wait_for
+
+CHUNK = b'\x47' + b'\xff' * (tvh_radio.TS_PACKET_SIZE - 1)
+
+
+class StallingTvh(BaseHTTPRequestHandler):
+    ''' sends a little of a stream, then nothing until the client hangs up,
+        except for channel 02 which keeps streaming '''
+
+    requests_seen = []
+    hung_up = threading.Event()
+
+    def do_GET(self):   # pylint:disable=invalid-name
+        ''' implement the http GET method '''
+        StallingTvh.requests_seen.append(self.path)
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/mp2t')
+        self.end_headers()
+        self.wfile.write(CHUNK * tvh_radio.RELAY_CHUNK_PACKETS * 2)
+        self.wfile.flush()
+        if '02' * 16 in self.path:
+            try:
+                while True:
+                    time.sleep(0.05)
+                    self.wfile.write(CHUNK * tvh_radio.RELAY_CHUNK_PACKETS)
+            except OSError:
+                StallingTvh.hung_up.set()
+                return
+        self.connection.settimeout(10)
+        try:
+            while self.connection.recv(1024):
+                pass
+        except OSError:
+            pass
+        StallingTvh.hung_up.set()
+
+    def log_message(self, format, *args):  # pylint:disable=redefined-builtin
+        pass
+
+
+@pytest.fixture
+def relay(app_globals, local_server, monkeypatch):
+    ''' a relay in front of a local server which stalls '''
+
+    StallingTvh.requests_seen = []
+    StallingTvh.hung_up.clear()
+    app_globals[tvh_radio.G_CONFIG].ts_url = local_server(StallingTvh)
+    app_globals[tvh_radio.G_PROFILES] = ['pass', ]
+    monkeypatch.setattr(tvh_radio, 'RELAY_LINGER_SECS', 0.2)
+    monkeypatch.setattr(tvh_radio, 'RELAY_POLL_SECS', 0.05)
+    monkeypatch.setattr(tvh_radio, 'PROBE_CONNECT_TIMEOUT', 1)
+
+    stream_relay = tvh_radio.StreamRelay(0, False)
+    yield stream_relay
+    stream_relay.close()
+
+
+def test_unknown_profile_is_refused(relay):
+    ''' a listener can't add parameters to the relay's request of the server '''
+
+    response = requests.get(relay.local_url('01' * 16, 'pass%26weight%3D9999'), timeout=5)
+    assert response.status_code == 400
+    assert not StallingTvh.requests_seen
+
+
+def test_bad_channel_ids_are_not_found(relay):
+    ''' only a whole channel uuid is relayed '''
+
+    for chan_uuid in ('0' * 31, '01' * 8, '01' * 17, ):
+        response = requests.get(relay.local_url(chan_uuid, 'pass'), timeout=5)
+        assert response.status_code == 404
+    assert not StallingTvh.requests_seen
+
+
+def test_local_url_quotes_the_profile(relay):
+    ''' a profile with URL syntax in its name reaches the relay intact '''
+
+    assert relay.local_url('01' * 16, 'a&b=c').endswith('?profile=a%26b%3Dc')
+
+
+def test_stalled_upstream_is_closed_after_the_last_listener(relay):
+    ''' an upstream without listeners is closed even if its stream has stalled '''
+
+    with requests.get(relay.local_url('01' * 16, 'pass'), stream=True, timeout=5) as response:
+        assert response.status_code == 200
+        next(response.iter_content(1024))
+    assert StallingTvh.requests_seen == [f'/{ tvh_radio.TS_URL_STR }/{ "01" * 16 }?profile=pass']
+
+    wait_for(lambda: not relay.upstreams)
+    # the server sees the subscription end
+    assert StallingTvh.hung_up.wait(3)
+
+
+def test_listeners_share_one_upstream(relay):
+    ''' two listeners to a channel use one server stream '''
+
+    first = requests.get(relay.local_url('02' * 16, 'pass'), stream=True, timeout=5)
+    second = requests.get(relay.local_url('02' * 16, 'pass'), stream=True, timeout=5)
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert next(first.iter_content(1024)) == next(second.iter_content(1024)) == CHUNK * 5 + CHUNK[:84]
+    first.close()
+    second.close()
+    assert len(StallingTvh.requests_seen) == 1
+    assert relay.shared == 1
@@ -0,0 +1,65 @@
+''' the memory mapped status block and its reader '''
+
+import tvh_radio
+
+
+def test_status_roundtrip(app_globals, tmp_path):
+    ''' what's published is what a reader sees '''
+
+    file_name = str(tmp_path / tvh_radio.STATUS_FILE)
+    status_block = tvh_radio.StatusBlock(file_name)
+    status_block.publish(player_pid=1234, kbps=320, cc_errors=2, stalled_ms=1500,
+                         play_mode=tvh_radio.PM_RADIO, chan_tag='Music',
+                         playing='Radio 1', future='Radio ' + 'é' * 200)
+
+    status = tvh_radio.read_status(file_name)
+    assert status['updated'] > 0
+    assert (status['player_pid'], status['kbps'], status['cc_errors'], status['stalled_ms'], ) == \
+           (1234, 320, 2, 1500, )
+    assert (status['play_mode'], status['chan_tag'], status['playing'], ) == \
+           (tvh_radio.PM_RADIO, 'Music', 'Radio 1', )
+    # cut to fit, on a character boundary
+    assert status['future'] == 'Radio ' + 'é' * 61
+    assert status_block.sequence == 2
+
+    # nothing changed, so nothing is written
+    status_block.publish(playing='Radio 1')
+    assert status_block.sequence == 2
+
+    status_block.close()
+    status = tvh_radio.read_status(file_name)
+    assert (status['player_pid'], status['playing'], status['future'], ) == (0, '', 'Radio ' + 'é' * 61, )
+
+
+def test_status_read_waits_for_a_write(app_globals, monkeypatch, tmp_path):
+    ''' an odd sequence means a write is in progress, so the reader retries,
+        and gives up if the write never finishes '''
+
+    file_name = str(tmp_path / tvh_radio.STATUS_FILE)
+    status_block = tvh_radio.StatusBlock(file_name)
+    status_block.publish(playing='Radio 1')
+    sequence_at = tvh_radio.STATUS_HEADER.size - tvh_radio.STATUS_SEQUENCE.size
+
+    def set_sequence(sequence):
+        status_block.block[sequence_at:tvh_radio.STATUS_HEADER.size] = tvh_radio.STATUS_SEQUENCE.pack(sequence)
+
+    # the writer finishes while the reader waits
+    set_sequence(status_block.sequence + 1)
+    waits = []
+
+    def finish_write(secs):
+        waits.append(secs)
+        set_sequence(status_block.sequence + 2)
+
+    monkeypatch.setattr(tvh_radio.time, 'sleep', finish_write)
+    assert tvh_radio.read_status(file_name)['playing'] == 'Radio 1'
+    assert len(waits) == 1
+
+    # the writer never finishes
+    set_sequence(status_block.sequence + 3)
+    waits.clear()
+    monkeypatch.setattr(tvh_radio.time, 'sleep', waits.append)
+    assert tvh_radio.read_status(file_name) is None
+    assert len(waits) == tvh_radio.STATUS_READ_TRIES
+
+    status_block.close()
@@ -0,0 +1,125 @@
+''' the playback supervisor, driving the fake player backend '''
+
+import asyncio
+
+import tvh_radio
+
+
+async def wait_for(condition, timeout=5.0):
+    ''' polls until the condition is true, or fails the test '''
+
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, 'timed out'
+        await asyncio.sleep(0.01)
+
+
+def test_play_crash_restart_stop(app_globals, monkeypatch, tmp_path):
+    ''' a player which dies unasked is restarted on the same channel, and one
+        told to stop isn't '''
+
+    monkeypatch.setattr(tvh_radio, 'SUPERVISOR_POLL_SECS', 0.05)
+    monkeypatch.setattr(tvh_radio, 'RESTART_BACKOFF_MIN', 0.1)
+    player = tvh_radio.FakePlayer([])
+    app_globals[tvh_radio.G_PLAYER] = player
+
+    async def scenario():
+        supervisor = tvh_radio.PlaybackSupervisor(str(tmp_path))
+        app_globals[tvh_radio.G_SUPERVISOR] = supervisor
+        supervisor.start()
+
+        supervisor.play('Radio 1', '0' * 32)
+        await wait_for(player.is_playing)
+        profile = tvh_radio.mode_profiles(tvh_radio.PM_TV)[0]
+        assert player.commands == [('play', tvh_radio.make_stream_url('0' * 32, profile), )]
+        assert app_globals[tvh_radio.G_CHAN_NAME_PLAYING] == 'Radio 1'
+
+        # the player dies on its own
+        player.stream_url = ''
+        await wait_for(lambda: len(player.commands) == 2)
+        assert player.commands[1][0] == 'play'
+        assert player.is_playing()
+        assert supervisor.restarts == 1
+        assert supervisor.chan_restarts == {'Radio 1': 1}
+
+        supervisor.stop()
+        await wait_for(lambda: not player.is_playing())
+        assert player.commands[-1] == ('stop', )
+        assert app_globals[tvh_radio.G_CHAN_NAME_PLAYING] == ''
+
+        # stopped on purpose, so not restarted
+        await asyncio.sleep(0.3)
+        assert [command[0] for command in player.commands] == ['play', 'play', 'stop']
+
+        await supervisor.quit()
+        assert player.commands[-1] == ('close', )
+        assert supervisor.restarts == 1
+
+    asyncio.run(scenario())
+
+
+def test_gives_up_when_the_budget_is_used(app_globals, monkeypatch, tmp_path):
+    ''' a player which keeps dying is given up on '''
+
+    monkeypatch.setattr(tvh_radio, 'SUPERVISOR_POLL_SECS', 0.02)
+    monkeypatch.setattr(tvh_radio, 'RESTART_BACKOFF_MIN', 0.01)
+    monkeypatch.setattr(tvh_radio, 'RESTART_BUDGET', 2)
+    player = tvh_radio.FakePlayer([])
+    # plays nothing, as if the player died as soon as it started
+    monkeypatch.setattr(player, 'is_playing', lambda: False)
+    app_globals[tvh_radio.G_PLAYER] = player
+
+    async def scenario():
+        supervisor = tvh_radio.PlaybackSupervisor(str(tmp_path))
+        app_globals[tvh_radio.G_SUPERVISOR] = supervisor
+        supervisor.start()
+        supervisor.play('Radio 1', '0' * 32)
+        await wait_for(lambda: supervisor.failures == 1)
+        assert supervisor.target is None
+        assert supervisor.restarts == 2
+        await supervisor.quit()
+
+    asyncio.run(scenario())
+
+
+def test_steps_down_when_stalling(app_globals, monkeypatch, tmp_path):
+    ''' a stream which keeps stalling is switched to the next lighter profile '''
+
+    player = tvh_radio.FakePlayer([])
+    app_globals[tvh_radio.G_PLAYER] = player
+    app_globals[tvh_radio.G_PLAYER_PID] = 1
+    supervisor = tvh_radio.PlaybackSupervisor(str(tmp_path))
+    profiles = tvh_radio.mode_profiles(tvh_radio.PM_TV)
+    supervisor.profile = profiles[0]
+
+    quality = {'kbps': 100, 'stalls': 0, }
+    monkeypatch.setattr(player, 'quality', lambda: quality)
+    assert supervisor.lighter_profile() is None
+
+    quality['stalls'] = tvh_radio.PROFILE_STEP_DOWN_STALLS
+    assert supervisor.lighter_profile() == profiles[1]
+    assert app_globals[tvh_radio.G_PROFILE_STATS][profiles[0]]['realtime'] == 0.0
+
+    # there's nothing lighter than the lightest
+    supervisor.profile = profiles[-1]
+    assert supervisor.lighter_profile() is None
+
+
+def test_default_profiles_step_down_to_lighter_ones(app_globals, monkeypatch, tmp_path):
+    ''' with the default settings each play mode steps down from the full stream '''
+
+    player = tvh_radio.FakePlayer([])
+    app_globals[tvh_radio.G_PLAYER] = player
+    app_globals[tvh_radio.G_PLAYER_PID] = 1
+    supervisor = tvh_radio.PlaybackSupervisor(str(tmp_path))
+    monkeypatch.setattr(player, 'quality', lambda: {'kbps': 100, 'stalls': tvh_radio.PROFILE_STEP_DOWN_STALLS, })
+
+    app_globals[tvh_radio.G_PLAY_MODE] = tvh_radio.PM_RADIO
+    supervisor.profile = 'pass'
+    assert supervisor.lighter_profile() == 'audio-only'
+    supervisor.profile = 'audio-only'
+    assert supervisor.lighter_profile() is None
+
+    app_globals[tvh_radio.G_PLAY_MODE] = tvh_radio.PM_TV
+    supervisor.profile = 'pass'
+    assert supervisor.lighter_profile() == 'webtv-h264-aac-mpegts'
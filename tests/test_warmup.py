@@ -0,0 +1,99 @@
+''' tuner warm-ups, against a local server which is slow to tune '''
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import tvh_radio
+from conftest import wait_for
+
+
+class SlowTvh(BaseHTTPRequestHandler):
+    ''' takes a while to answer a subscription, as tuning does, then holds it
+        until the client hangs up, counting the subscriptions open at once '''
+
+    lock = threading.Lock()
+    status = 200
+    open_now = 0
+    open_max = 0
+    hung_up = threading.Event()
+
+    def do_GET(self):   # pylint:disable=invalid-name
+        ''' implement the http GET method '''
+        with SlowTvh.lock:
+            SlowTvh.open_now += 1
+            SlowTvh.open_max = max(SlowTvh.open_max, SlowTvh.open_now)
+        try:
+            time.sleep(0.5)
+            self.send_response(SlowTvh.status)
+            self.send_header('Content-Type', 'video/mp2t')
+            self.end_headers()
+            self.wfile.flush()
+            self.connection.settimeout(10)
+            while self.connection.recv(1024):
+                pass
+        except OSError:
+            pass
+        finally:
+            with SlowTvh.lock:
+                SlowTvh.open_now -= 1
+            SlowTvh.hung_up.set()
+
+    def log_message(self, format, *args):  # pylint:disable=redefined-builtin
+        pass
+
+
+@pytest.fixture
+def warmup(app_globals, local_server):
+    ''' a warm-up of at most one channel, in front of the slow server '''
+
+    SlowTvh.status = 200
+    SlowTvh.open_now = 0
+    SlowTvh.open_max = 0
+    SlowTvh.hung_up.clear()
+    app_globals[tvh_radio.G_CONFIG].ts_url = local_server(SlowTvh)
+    app_globals[tvh_radio.G_CONFIG].warmup_max = 1
+
+    tuner_warmup = tvh_radio.TunerWarmup()
+    yield tuner_warmup
+    tuner_warmup.close()
+
+
+def test_quick_zaps_stay_within_the_limit(warmup):
+    ''' warm-ups let go while the server is still tuning count toward the limit '''
+
+    for chan in range(5):
+        warmup.warm_up([f'{ chan:02d}' * 16, ])
+        time.sleep(0.05)
+
+    wait_for(lambda: warmup.subscribers == 0)
+    assert SlowTvh.open_max == 1
+    assert warmup.started == 1
+    assert warmup.skipped == 4
+
+
+def test_playing_a_warm_channel_lets_its_warm_up_go(warmup):
+    ''' the player's subscription takes over from the warm-up '''
+
+    warmup.warm_up(['01' * 16, ])
+    wait_for(lambda: '01' * 16 in warmup.warmed_at)
+    warmup.played('01' * 16)
+
+    assert SlowTvh.hung_up.wait(5)
+    wait_for(lambda: warmup.subscribers == 0)
+    assert warmup.hits == 1
+
+
+def test_refused_warm_up_is_not_a_hit(warmup):
+    ''' a channel the server had no tuner for wasn't warm when played '''
+
+    SlowTvh.status = 503
+    warmup.warm_up(['01' * 16, ])
+    wait_for(lambda: warmup.subscribers == 0)
+    warmup.played('01' * 16)
+
+    assert warmup.refused == 1
+    assert warmup.plays == 1
+    assert warmup.hits == 0
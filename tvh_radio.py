@@ -6,26 +6,44 @@ This is a multi-mode radio app for a Pi, for streaming from the internet or from
 '''
 
 import argparse
+from array import array
+import asyncio
+from bisect import bisect_left
 import configparser
 import datetime
+import hashlib
+import heapq
+import io
 import json
+import math
+import mmap
 import os
+import queue
 import re
+import select
 #import stat
+import shlex
 import signal
+import socket
+import struct
 import sys
 import subprocess
 import time
-from threading import Event, Thread
-import select
+from threading import Event, Lock, Thread, Timer
 import tty
 import termios
 
 import urllib
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import BaseHTTPRequestHandler, HTTPServer, SimpleHTTPRequestHandler, ThreadingHTTPServer
 import requests
 from requests.auth import HTTPDigestAuth
 
+# optional, only needed to make logo thumbnails
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
 # requires making code less readable:
 # Xpylint:disable=bad-whitespace
 # pylint:disable=too-many-branches
@@ -45,13 +63,41 @@ from requests.auth import HTTPDigestAuth
 #GOOGLE_TTS = 'http://translate.google.com/translate_tts?ie=UTF-8&client=tw-ob&tl=en&q='
 #G_TTS_UA = 'VLC/3.0.2 LibVLC/3.0.2'
 
-KEYBOARD_POLL_TIMEOUT = 0.5
+CONFIG_POLL_SECS = 1                # how often to check if the settings file changed
+COMET_POLL_TIMEOUT = 60             # seconds, TVH answers a long poll well within this
+COMET_RETRY_SECS = 10               # wait after the notification stream breaks
+
+LOAD_TEST_CLIENTS = 4               # concurrent clients in a load test
+LOAD_TEST_SECS = 10.0               # how long a load test runs for
+LOAD_TEST_TIMEOUT = 30              # seconds before a load test request is an error
+LOAD_TEST_PERCENTILES = (50, 95, 99, )
+
+LOGO_DIR = 'logos'                  # in the settings directory
+LOGO_INDEX = 'index.json'           # in the logo directory
+LOGO_REVALIDATE_SECS = 86400        # ask the server if a logo changed after this long
+LOGO_FETCH_TIMEOUT = 20
+
+EPG_PAGE_EVENTS = 2000              # programmes fetched per request of the guide
+EPG_MAX_EVENTS = 100000             # don't index more programmes than this
+EPG_REFRESH_SECS = 3600             # how often the whole guide is fetched again
+EPG_POLL_SECS = 60                  # how often the guide watcher checks a fetch is due
+EPG_MAX_RESULTS = 9                 # search results shown, chosen with keys 1 to 9
+EPG_FETCH_TIMEOUT = 30              # seconds to wait for a page of the guide
+EPG_WORD_RE = re.compile(r'\w\w+')  # words of two or more letters are indexed
 
 # string constants
 TS_URL_CHN = 'api/channel/grid'
 TS_URL_STR = 'stream/channel'
 TS_URL_PEG = 'api/passwd/entry/grid'
+TS_URL_PRL = 'api/profile/list'
+TS_URL_CTG = 'api/channeltag/grid'
+TS_URL_CMT = 'comet/poll'
+TS_URL_IDL = 'api/idnode/load'
+TS_URL_PLS = 'playlist/channels'
+TS_URL_EPG = 'api/epg/events/grid'
+TS_URL_EPL = 'api/epg/events/load'
 TS_MAX_CHANS = 1600 # don't fetch more than this number of channels
+TS_UUID_BYTES = 16  # TVH uuids are 32 hex digits
 
 # name of Tvheadend Server parameters
 TS_URL = 'ts_url'
@@ -60,9 +106,112 @@ TS_PASS = 'ts_pass'
 TS_PAUTH = 'ts_pauth'
 TS_AUTH_TYPE='ts_auth_type'         # digest or plain authentication
 TS_CHN_LIMIT = 'ts_chn_lim'         # see TS_MAX_CHANS
-TS_PROFILE = 'pass'                 # use audio-only or pass
+TS_PROFILE = 'pass'                 # used if none of the configured profiles exist
+TS_PROFILES_RADIO = 'ts_profiles_radio' # profiles for radio mode, heaviest first
+TS_PROFILES_TV = 'ts_profiles_tv'   # profiles for TV mode, heaviest first
+TS_PROBE_SECS = 'ts_probe_secs'     # how long to measure a profile, 0 to never probe
+TS_COMET = 'ts_comet'               # 1 to follow channel changes pushed by the server
+EPG_DAYS = 'epg_days'               # days of programme guide to search, 0 to disable
+
+PLAY_MODE = 'play_mode'             # radio or tv
+
+LOGO_CACHE_MB = 'logo_cache_mb'     # size cap of the logo cache, 0 to disable it
+LOGO_FETCHERS = 'logo_fetchers'     # how many logos to fetch at the same time
+LOGO_THUMB_SIZE = 'logo_thumb_size' # e.g. 64x64, or blank for no thumbnails
+
+# Play Modes, choose which list of stream profiles is used
+PM_RADIO = 'radio'
+PM_TV = 'tv'
+
+PROFILE_PROBE_TTL = 300             # seconds a profile measurement is trusted for
+PROFILE_MIN_REALTIME = 0.95         # a profile must arrive at this fraction of real time
+PROFILE_STEP_DOWN_STALLS = 3        # stalls within the quality window which make the
+                                    # supervisor switch to a lighter profile
+PROBE_CONNECT_TIMEOUT = 10          # seconds to wait for the server to start a stream
+
+# MPEG transport stream constants
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+TS_PCR_HZ = 90000                   # the PCR base ticks at 90kHz
+TS_PCR_WRAP = 1 << 33
+TS_PID_PAT = 0x0000
+TS_PID_NULL = 0x1fff                # stuffing, has no continuity counter
+TS_TABLE_PAT = 0x00
+TS_TABLE_PMT = 0x02
+TS_PES_START = b'\x00\x00\x01'
+
+# PMT stream types which are audio, and the codec each carries
+TS_AUDIO_TYPES = {
+    0x03: 'mp2',                    # MPEG-1 audio
+    0x04: 'mp2',                    # MPEG-2 audio
+    0x0f: 'aac',                    # AAC in ADTS
+    0x11: 'aac-latm',               # AAC in LATM, DVB-T2 HD services
+    0x81: 'ac3',                    # ATSC AC3
+}
+TS_TYPE_PRIVATE = 0x06              # DVB private data, audio if it has a codec descriptor
+TS_AUDIO_DESCRIPTORS = {
+    0x6a: 'ac3',
+    0x7a: 'eac3',
+    0x7c: 'aac',
+}
+TS_LANGUAGE_DESCRIPTOR = 0x0a
 
 PLAYER_COMMAND = 'player_command'
+PLAYER_BACKEND = 'player_backend'   # spawn, mpv, demux or fake
+DEMUX_PLAYER_COMMAND = 'demux_player_command'
+
+# player backends
+PB_SPAWN = 'spawn'                  # a new player process for every stream
+PB_MPV = 'mpv'                      # one long lived mpv, controlled over its IPC socket
+PB_DEMUX = 'demux'                  # the app demuxes the audio and pipes it to a light player
+PB_FAKE = 'fake'                    # no player, just records what it was told to do
+
+MPV_IPC_SOCKET = 'mpv.sock'         # in the settings directory
+MPV_IPC_TIMEOUT = 5                 # seconds to wait for mpv to create its socket
+MPV_REPLY_TIMEOUT = 5               # seconds to wait for mpv to answer a command
+
+DEMUX_CHUNK_PACKETS = 348           # demux about 64KB of stream at a time
+DEMUX_STOP_TIMEOUT = 2              # seconds to wait for the demux thread to finish
+
+RELAY_PORT = 'relay_port'           # port of the stream relay, 0 to disable it
+RELAY_PUBLIC = 'relay_public'       # relay to the LAN or to localhost only
+RELAY_CHUNK_PACKETS = 32            # relay about 6KB of stream at a time
+RELAY_QUEUE_CHUNKS = 256            # chunks a consumer may fall behind before it's dropped
+RELAY_LINGER_SECS = 3               # keep an upstream without consumers this long, for zapping back
+RELAY_POLL_SECS = 1                 # how often a waiting consumer checks it's still wanted
+RELAY_SEND_TIMEOUT = 10             # seconds a listener may stop reading before it's disconnected
+
+WARMUP_MAX = 'warmup_max'           # how many channels may be warmed up at once, 0 to disable
+WARMUP_SECS = 10                    # how long a warm-up subscription is held open
+WARMUP_DELAY_SECS = 0.5             # the future channel must stay put this long to be warmed up
+WARMUP_WEIGHT = 1                   # TVH subscription weight, the lowest, so anyone watching wins
+
+QUALITY_FILE = 'quality.json'       # per channel stream quality, in the settings directory
+QUALITY_WINDOW_SECS = 60            # the rolling quality summary covers this many seconds
+QUALITY_STALL_SECS = 2.0            # no stream data for this long is a stall
+QUALITY_SAVE_SECS = 30              # how often the quality summaries are saved
+
+# the status block, a memory mapped file which other programs, e.g. a display
+# driver, can poll for what's playing; a sequence number which is odd whilst
+# the block is being written lets readers spot a torn read and retry
+STATUS_FILE = 'status.mmap'         # in the settings directory
+STATUS_MAGIC = b'TVHR'
+STATUS_VERSION = 1
+STATUS_HEADER = struct.Struct('<4sHHI')     # magic, version, body size, sequence
+STATUS_SEQUENCE = struct.Struct('<I')       # the sequence, at the end of the header
+# updated, player pid, kbit/s, continuity errors, stalled ms, play mode,
+# channel tag, playing channel, future channel
+STATUS_BODY = struct.Struct('<dIIII8s64s128s128s')
+STATUS_FIELDS = ('updated', 'player_pid', 'kbps', 'cc_errors', 'stalled_ms',
+                 'play_mode', 'chan_tag', 'playing', 'future', )
+STATUS_READ_TRIES = 1000            # a reader gives up if it's always mid write
+
+SUPERVISOR_POLL_SECS = 1            # how often the playback supervisor checks the player
+RESTART_BACKOFF_MIN = 1             # seconds before the first restart of a failed player
+RESTART_BACKOFF_MAX = 32            # the delay doubles on each failure up to this
+RESTART_BUDGET = 5                  # give up after this many restarts...
+RESTART_WINDOW = 600                # ...within this many seconds
+RESTART_STABLE_SECS = 60            # playing this long resets the backoff
 
 #WEB_PORT = 'web_port'              # default web port, 0 to disable, 8080 suggested
 #WEB_PUBLIC = 'web_public'          # listen on all interfaces or localhost
@@ -123,6 +272,57 @@ SETTINGS_DEFAULTS = {
               'editing the user to set persistent auth on, then saving, then re-edit ' \
               'and scroll down to see the persistent auth value',
     },
+    TS_PROFILES_RADIO: {
+        TITLE: 'Radio stream profiles',
+        DFLT: 'pass,audio-only',
+        HELP: 'Comma separated TVH stream profiles to use in radio mode, heaviest first;\n' \
+              'a lighter profile is used if the network can\'t keep up with a heavier one',
+    },
+    TS_PROFILES_TV: {
+        TITLE: 'TV stream profiles',
+        DFLT: 'pass,webtv-h264-aac-mpegts',
+        HELP: 'Comma separated TVH stream profiles to use in TV mode, heaviest first',
+    },
+    TS_PROBE_SECS: {
+        TITLE: 'Profile probe seconds',
+        DFLT: '2',
+        HELP: 'Seconds spent measuring whether the network can sustain a stream profile\n' \
+              'before playing it, results are remembered for a few minutes; 0 disables',
+    },
+    TS_COMET: {
+        TITLE: 'Follow channel changes',
+        DFLT: '1',
+        HELP: 'Set to 1 to keep the channel list up to date from the server\'s change\n' \
+              'notifications, 0 to only fetch it at start up',
+    },
+    EPG_DAYS: {
+        TITLE: 'Programme guide days to search',
+        DFLT: '7',
+        HELP: 'How many days ahead of the programme guide the / key searches, the guide\n' \
+              'is downloaded in the background; 0 disables searching',
+    },
+    PLAY_MODE: {
+        TITLE: 'Play mode, radio or tv',
+        DFLT: PM_TV,
+        HELP: 'Chooses between the radio and TV stream profiles, the v key toggles it',
+    },
+    LOGO_CACHE_MB: {
+        TITLE: 'Logo cache size in MB',
+        DFLT: '5',
+        HELP: 'Channel logos are downloaded in the background and kept in\n' \
+              f'~/{ SETTINGS_DIR }/{ LOGO_DIR }, up to this size; 0 disables the logo cache',
+    },
+    LOGO_FETCHERS: {
+        TITLE: 'Logo fetchers',
+        DFLT: '2',
+        HELP: 'How many logos are downloaded at the same time',
+    },
+    LOGO_THUMB_SIZE: {
+        TITLE: 'Logo thumbnail size',
+        DFLT: '',
+        HELP: 'If set, e.g. 64x64, logos are scaled to fit once when downloaded, for small\n' \
+              'displays; needs the python3 PIL (pillow) module',
+    },
     PLAYER_COMMAND: {
         TITLE: 'Player',
         DFLT: '/usr/bin/omxplayer.bin -o alsa --threshold 2',
@@ -131,6 +331,42 @@ SETTINGS_DEFAULTS = {
               '"/usr/bin/omxplayer.bin -o alsa --threshold 2" or\n' \
               '"vlc -I dummy --novideo --play-and-exit"',
     },
+    PLAYER_BACKEND: {
+        TITLE: 'Player backend, spawn, mpv, demux or fake',
+        DFLT: PB_SPAWN,
+        HELP: 'spawn starts the player command for every channel, mpv keeps one mpv\n' \
+              'running and switches channels over its IPC socket, so the player command\n' \
+              'must be mpv, e.g. "/usr/bin/mpv --no-video", demux extracts the audio from\n' \
+              'the stream and pipes it to the demux player command, and fake plays nothing',
+    },
+    DEMUX_PLAYER_COMMAND: {
+        TITLE: 'Demux player',
+        DFLT: 'mpg123 -q -',
+        HELP: 'Command which plays audio piped to its stdin, for the demux player backend;\n' \
+              'mpg123 plays MPEG audio, for AAC or AC3 radio try:\n' \
+              '"ffplay -nodisp -autoexit -loglevel error -"',
+    },
+    WARMUP_MAX: {
+        TITLE: 'Tuner warm-ups',
+        DFLT: '0',
+        HELP: 'How many of the channels likely to be played next, the future channel and\n' \
+              'its neighbours, are subscribed to briefly so the server tunes them before p\n' \
+              'is pressed; warm-ups give way to real viewers, but each may use a tuner,\n' \
+              'so keep it below the number of tuners, or 0 to disable',
+    },
+    RELAY_PORT: {
+        TITLE: 'Stream relay port',
+        DFLT: '0',
+        HELP: 'If not 0, channels are played through a relay on this port which holds one\n' \
+              'server subscription per channel and shares it with every listener, e.g.\n' \
+              'other players given http://this-host:port/stream/channel/<uuid>;\n' \
+              'restart tvh_radio after changing it',
+    },
+    RELAY_PUBLIC: {
+        TITLE: 'Stream relay public',
+        DFLT: '0',
+        HELP: 'Set to 1 to relay to other machines on the LAN, otherwise it\'s localhost only',
+    },
     #WEB_PORT: {
     #    TITLE: 'Web Port',
     #    DFLT: '8080',
@@ -159,18 +395,22 @@ RM_TEXT = {
 # Chunks of text
 HELP_TEXT = '''=== Help
 ? - help
+a - next audio track
 d - down a channel
 e - edit streams list
 h - help
+i - info, show the playback status
 f - favourite or unfavourite a channel
 F - favourites list
-m - mode change - TVH, stream or favourites
+m - mode change - cycle through all channels and each channel tag
+/ - search the programme guide, then 1 to 9 plays a result
 p - play/stop channel
 q - quit
 s - speak current channel name
 s - speak next channel name
 t - speak time
 u - up a channel
+v - toggle between radio and TV play modes
 '''
 
 #VALID_WEB_COMMANDS = ('d', 'f', 'F', 'm', 'p', 's', 'S', 't', 'u', )
@@ -245,14 +485,34 @@ GLOBALS = {}
 G_CHAN_NAME_FUTURE = 'channel name future'
 G_CHAN_NUM_FUTURE = 'channel number future'
 G_CHAN_NAME_PLAYING = 'channel name playing'
+G_CHAN_TAG      = 'channel tag'
+G_CHAN_UPDATES  = 'channel updates'
+G_CONFIG        = 'parsed settings'
 G_DBG_LEVEL     = 'debug_level'
+G_EPG           = 'programme guide index'
+G_EPG_CHANGES   = 'programme guide changes during a fetch'
+G_EPG_RESULTS   = 'programme search results'
 G_EVENT         = 'event handler'
+G_EVENTS        = 'event queue'
 G_KEY_STROKE    = 'key_stroke'
+G_LOOP          = 'event loop'
+G_LOGOS         = 'logo cache'
 G_MY_SETTINGS   = 'my settings'
+G_PLAYER        = 'player backend'
 G_PLAYER_PID    = 'player_pid'
+G_PLAY_MODE     = 'play mode'
+G_PROFILES      = 'stream profiles on server'
+G_PROFILE_STATS = 'stream profile measurements'
+G_QUALITY       = 'stream quality log'
 G_QUIT_FLAG     = 'quit_flag'
+G_RELAY         = 'stream relay'
+G_SEARCH_TEXT   = 'search being typed'
+G_STATUS        = 'status block'
 G_RADIO_MODE    = 'radio_mode'
 G_STOP_PLAYBACK = 'stop playback'
+G_BG_TASKS      = 'background tasks'
+G_SUPERVISOR    = 'playback supervisor'
+G_WARMUP        = 'tuner warm-up'
 
 
 ##########################################################################################
@@ -263,30 +523,153 @@ def print_help():
     print(HELP_TEXT)
 
 ##########################################################################################
-def api_test_func():
-    ''' secret function for testing the TVH API in various ways '''
+def tvh_api_get(api_path, **kwargs):
+    ''' makes a GET request of the TVH server with the configured authentication,
+        api_path is relative to the server URL and may include a query string
+        returns a tuple of the full URL and the response '''
 
     global GLOBALS
 
-    ts_url = GLOBALS[G_MY_SETTINGS][SETTINGS_SECTION][TS_URL]
-    ts_auth_type = GLOBALS[G_MY_SETTINGS][SETTINGS_SECTION][TS_AUTH_TYPE]
-    ts_user = GLOBALS[G_MY_SETTINGS][SETTINGS_SECTION][TS_USER]
-    ts_pass = GLOBALS[G_MY_SETTINGS][SETTINGS_SECTION][TS_PASS]
-    ts_query = f'{ ts_url }/{ TS_URL_PEG }'
+    config = GLOBALS[G_CONFIG]
+    ts_query = f'{ config.ts_url }/{ api_path }'
+    ts_response = requests.get(ts_query, auth=config.auth, **kwargs)
 
-    if ts_auth_type == 'plain':
-        ts_response = requests.get(ts_query, auth=(ts_user, ts_pass))
-    else:
-        ts_response = requests.get(ts_query, auth=HTTPDigestAuth(ts_user, ts_pass))
+    return (ts_query, ts_response)
 
-    print(f'<!-- api_test_func URL { ts_query } -->')
-    if ts_response.status_code != 200:
-        print(f'>Error code { ts_response.status_code }\n{ ts_response.content }')
-        return
 
-    ts_json = ts_response.json()
-    #if GLOBALS[G_DBG_LEVEL] > 0:
-    print(json.dumps(ts_json, sort_keys=True, indent=4, separators=(',', ': ')))
+##########################################################################################
+def api_test_func(targets, clients, duration):
+    ''' secret function for testing the TVH API in various ways, now a load test:
+        each of the clients repeatedly requests the targets in turn for duration
+        seconds, then the throughput and latency of each target is printed
+
+        targets is a list of (label, URL, is_stream) tuples; API requests are timed
+        until the whole response arrives, streams until the first data arrives,
+        as that's the delay a listener hears
+        returns a dict of label => {'latencies': [seconds], 'errors': count} '''
+
+    global GLOBALS
+
+    print(f'<!-- api_test_func { clients } clients for { duration } seconds -->')
+    for (label, url, _is_stream) in targets:
+        print(f'<!-- api_test_func { label } URL { url } -->')
+
+    deadline = time.monotonic() + duration
+    client_results = [{} for _client in range(clients)]
+    client_threads = [Thread(target=load_test_client, args=(targets, deadline, client_result, ))
+                      for client_result in client_results]
+    start = time.monotonic()
+    for client_thread in client_threads:
+        client_thread.start()
+    for client_thread in client_threads:
+        client_thread.join()
+    elapsed = time.monotonic() - start
+
+    # merge the clients' results, they were kept apart to avoid locking
+    results = {label: {'latencies': [], 'errors': 0, } for (label, _url, _is_stream) in targets}
+    for client_result in client_results:
+        for (label, result) in client_result.items():
+            results[label]['latencies'].extend(result['latencies'])
+            results[label]['errors'] += result['errors']
+
+    print_load_report(results, elapsed)
+    return results
+
+
+##########################################################################################
+def load_test_client(targets, deadline, results):
+    ''' one load test client, with its own HTTP session so connections are reused '''
+
+    global GLOBALS
+
+    auth = GLOBALS[G_CONFIG].auth
+    if isinstance(auth, HTTPDigestAuth):
+        # digest auth keeps per-thread nonce state, so each client needs its own
+        auth = HTTPDigestAuth(auth.username, auth.password)
+
+    with requests.Session() as session:
+        session.auth = auth
+        target_num = 0
+        while time.monotonic() < deadline and not GLOBALS[G_QUIT_FLAG]:
+            (label, url, is_stream) = targets[target_num % len(targets)]
+            target_num += 1
+            result = results.setdefault(label, {'latencies': [], 'errors': 0, })
+
+            start = time.perf_counter()
+            try:
+                response = session.get(url, stream=is_stream, timeout=LOAD_TEST_TIMEOUT)
+                if is_stream:
+                    next(response.iter_content(chunk_size=TS_PACKET_SIZE), b'')
+                else:
+                    _content = response.content
+                response.close()
+                if response.status_code != 200:
+                    result['errors'] += 1
+                    continue
+            except requests.exceptions.RequestException:
+                result['errors'] += 1
+                continue
+            result['latencies'].append(time.perf_counter() - start)
+
+
+##########################################################################################
+def print_load_report(results, elapsed):
+    ''' prints throughput, latency percentiles and a latency histogram per target '''
+
+    for (label, result) in results.items():
+        latencies = sorted(result['latencies'])
+        print(f'=== { label }')
+        print(f'requests { len(latencies) }, errors { result["errors"] }, '
+              f'{ len(latencies) / elapsed:.1f} req/s')
+        if not latencies:
+            continue
+
+        # nearest rank percentiles
+        pcent_texts = []
+        for pcent in LOAD_TEST_PERCENTILES:
+            rank = max(1, math.ceil(len(latencies) * pcent / 100))
+            pcent_texts.append(f'p{ pcent } { latencies[rank - 1] * 1000:.1f}ms')
+        print(', '.join(pcent_texts) + f', max { latencies[-1] * 1000:.1f}ms')
+
+        # histogram with power of two millisecond buckets
+        buckets = {}
+        for latency in latencies:
+            bucket = 1
+            while bucket < latency * 1000:
+                bucket *= 2
+            buckets[bucket] = buckets.get(bucket, 0) + 1
+        biggest = max(buckets.values())
+        for (bucket, count) in sorted(buckets.items()):
+            print(f'{ "<=" + str(bucket) + "ms":>10} { count:7d} { "#" * max(1, count * 50 // biggest) }')
+
+
+##########################################################################################
+def load_test_main(args):
+    ''' runs the load test from the command line arguments '''
+
+    global GLOBALS
+
+    if args.url:
+        # e.g. a local test server
+        GLOBALS[G_CONFIG].ts_url = args.url.rstrip('/')
+
+    targets = [(endpoint, f'{ GLOBALS[G_CONFIG].ts_url }/{ endpoint }', False, )
+               for endpoint in (args.endpoint or [TS_URL_PEG, ])]
+
+    if args.streams > 0:
+        chan_table = get_tvh_chan_urls()
+        profile = mode_profiles(GLOBALS[G_CONFIG].play_mode)[0]
+        for chan_num in range(min(args.streams, len(chan_table))):
+            targets.append((f'stream { chan_table.name(chan_num) }',
+                            chan_table.stream_url(chan_num, profile), True, ))
+
+    if args.clients < 1 or args.duration <= 0 or not targets:
+        print('Error, a load test needs at least one client, target and second')
+        sys.exit(1)
+
+    results = api_test_func(targets, args.clients, args.duration)
+    if any(result['errors'] for result in results.values()):
+        sys.exit(1)
 
 
 ##########################################################################################
@@ -441,68 +824,1148 @@ def read_list_file(file_name):
 #    return tts_file_name
 
 
+##########################################################################################
+class ChannelTable:
+    ''' a compact, sorted table of channels for small Pis with big channel grids;
+        names are interned and kept in a list, uuids are packed as raw bytes into
+        one bytearray, and stream URLs are only built when a channel is played;
+        icon URLs are kept for the logo cache, interned as most are alike
+
+        channel tag membership is kept as one sorted array of channel numbers per
+        tag, built once per load, so zapping within a tag is just indexing '''
+
+    __slots__ = ('names', 'uuids', 'icons', 'tag_names', 'tag_members', )
+
+    def __init__(self, channels=None, tags=None):
+        ''' channels is a list of (name, uuid, tag uuids, icon URL) tuples, which is
+            sorted in place; tags is a list of (tag uuid, tag name) tuples in display order '''
+
+        self.names = []
+        self.uuids = bytearray()
+        self.icons = []
+        self.tag_names = dict(tags) if tags else {}     # tag uuid => tag name
+        self.tag_members = {}                           # tag uuid => array of channel numbers
+        if channels:
+            channels.sort()
+            for (chan_num, (chan_name, chan_uuid, chan_tags, chan_icon)) in enumerate(channels):
+                self.names.append(sys.intern(chan_name))
+                self.uuids += bytes.fromhex(chan_uuid)
+                self.icons.append(sys.intern(chan_icon))
+                for tag_uuid in chan_tags:
+                    # ignore disabled and internal tags
+                    if tag_uuid in self.tag_names:
+                        if tag_uuid not in self.tag_members:
+                            self.tag_members[tag_uuid] = array('I')
+                        self.tag_members[tag_uuid].append(chan_num)
+
+    def __len__(self):
+        return len(self.names)
+
+    def name(self, chan_num):
+        ''' returns the name of the channel at the index '''
+        return self.names[chan_num]
+
+    def uuid(self, chan_num):
+        ''' returns the uuid of the channel at the index, as TVH writes it '''
+        return self.uuids[chan_num * TS_UUID_BYTES:(chan_num + 1) * TS_UUID_BYTES].hex()
+
+    def icon(self, chan_num):
+        ''' returns the icon URL of the channel at the index, '' if it has none,
+            which may be relative to the TVH server URL '''
+        return self.icons[chan_num]
+
+    def stream_url(self, chan_num, profile):
+        ''' returns the URL to stream the channel at the index with a profile '''
+        return make_stream_url(self.uuid(chan_num), profile)
+
+    def items(self):
+        ''' yields (name, uuid) pairs in channel order, like dict.items() '''
+        for chan_num, chan_name in enumerate(self.names):
+            yield (chan_name, self.uuid(chan_num))
+
+    def find(self, chan_uuid):
+        ''' returns the channel number of a uuid, or None if it isn't in the table '''
+        raw_uuid = bytes.fromhex(chan_uuid)
+        offset = self.uuids.find(raw_uuid)
+        while offset >= 0:
+            if offset % TS_UUID_BYTES == 0:
+                return offset // TS_UUID_BYTES
+            offset = self.uuids.find(raw_uuid, offset + 1)
+        return None
+
+    def remove(self, chan_num):
+        ''' removes a channel, renumbering the ones after it '''
+        del self.names[chan_num]
+        del self.icons[chan_num]
+        del self.uuids[chan_num * TS_UUID_BYTES:(chan_num + 1) * TS_UUID_BYTES]
+        for tag_uuid, members in list(self.tag_members.items()):
+            members = array('I', (member - (member > chan_num) for member in members
+                                  if member != chan_num))
+            if members:
+                self.tag_members[tag_uuid] = members
+            else:
+                del self.tag_members[tag_uuid]
+
+    def insert(self, chan_name, chan_uuid, chan_tags, chan_icon):
+        ''' inserts a channel in name order, renumbering the ones after it
+            returns the new channel's number '''
+        chan_num = bisect_left(self.names, chan_name)
+        self.names.insert(chan_num, sys.intern(chan_name))
+        self.icons.insert(chan_num, sys.intern(chan_icon))
+        self.uuids[chan_num * TS_UUID_BYTES:chan_num * TS_UUID_BYTES] = bytes.fromhex(chan_uuid)
+        for tag_uuid, members in self.tag_members.items():
+            self.tag_members[tag_uuid] = array('I', (member + (member >= chan_num)
+                                                     for member in members))
+        for tag_uuid in chan_tags:
+            if tag_uuid in self.tag_names:
+                members = self.tag_members.setdefault(tag_uuid, array('I'))
+                members.insert(bisect_left(members, chan_num), chan_num)
+        return chan_num
+
+    def set_tags(self, tags):
+        ''' replaces the tag names, forgetting the members of tags which have gone '''
+        self.tag_names = dict(tags)
+        for tag_uuid in list(self.tag_members):
+            if tag_uuid not in self.tag_names:
+                del self.tag_members[tag_uuid]
+
+    def tag_order(self):
+        ''' returns the uuids of the tags which have channels, in display order '''
+        return [tag_uuid for tag_uuid in self.tag_names if tag_uuid in self.tag_members]
+
+    def tag_name(self, tag_uuid):
+        ''' returns the name of a tag, '' meaning all channels '''
+        if tag_uuid == '':
+            return 'all channels'
+        return self.tag_names.get(tag_uuid, tag_uuid)
+
+    def view(self, tag_uuid):
+        ''' returns the sorted channel numbers in a tag, or all of them for tag '' '''
+        if tag_uuid == '' or tag_uuid not in self.tag_members:
+            return range(len(self.names))
+        return self.tag_members[tag_uuid]
+
+    @staticmethod
+    def view_position(chan_view, chan_num):
+        ''' returns the position of a channel in a view, or None if it isn't there '''
+        view_pos = bisect_left(chan_view, chan_num)
+        if view_pos < len(chan_view) and chan_view[view_pos] == chan_num:
+            return view_pos
+        return None
+
+    def memory_footprint(self):
+        ''' returns the approximate number of bytes used by the table '''
+        return sys.getsizeof(self.names) + sys.getsizeof(self.uuids) + \
+               sum(sys.getsizeof(chan_name) for chan_name in self.names) + \
+               sys.getsizeof(self.icons) + \
+               sum(sys.getsizeof(chan_icon) for chan_icon in set(self.icons)) + \
+               sum(sys.getsizeof(members) for members in self.tag_members.values())
+
+
+##########################################################################################
+def get_tvh_chan_tags():
+    ''' gets the enabled, non-internal channel tags (bouquets) from the server
+        returns a list of (tag uuid, tag name) tuples in the server's tag order,
+        or None on failure, which isn't the same as there being no tags '''
+
+    global GLOBALS
+
+    try:
+        (ts_query, ts_response) = tvh_api_get(f'{ TS_URL_CTG }?limit={ TS_MAX_CHANS }')
+        print(f'<!-- get_tvh_chan_tags URL { ts_query } -->')
+        if ts_response.status_code != 200:
+            print('>Error code %d\n%s' % (ts_response.status_code, ts_response.content, ))
+            return None
+        tags_json = ts_response.json()
+    except (requests.exceptions.RequestException, ValueError) as req_exc:
+        print(f'Warning, failed to get channel tags: { req_exc }')
+        return None
+
+    tag_entries = [entry for entry in tags_json.get('entries', [])
+                   if entry.get('enabled', True) and not entry.get('internal', False)
+                   and 'uuid' in entry]
+    tag_entries.sort(key=lambda entry: (entry.get('index', 0), entry.get('name', '')))
+
+    return [(entry['uuid'], entry.get('name', entry['uuid'])) for entry in tag_entries]
+
+
 ##########################################################################################
 def get_tvh_chan_urls():
-    ''' gets the channel listing and generates an ordered dict
-        returns dict: key = channel name, value = stream URL
+    ''' gets the channel listing and generates a ChannelTable sorted by name,
+        which makes the stream URLs at play time
     '''
 
     global GLOBALS
 
-    ts_url = GLOBALS[G_MY_SETTINGS][SETTINGS_SECTION][TS_URL]
-    ts_auth_type = GLOBALS[G_MY_SETTINGS][SETTINGS_SECTION][TS_AUTH_TYPE]
-    ts_user = GLOBALS[G_MY_SETTINGS][SETTINGS_SECTION][TS_USER]
-    ts_pass = GLOBALS[G_MY_SETTINGS][SETTINGS_SECTION][TS_PASS]
-    ts_query = f'{ ts_url }/{ TS_URL_CHN }?limit={ GLOBALS[G_MY_SETTINGS][SETTINGS_SECTION][TS_CHN_LIMIT] }'
-
-    if ts_auth_type == 'plain':
-        ts_response = requests.get(ts_query, auth=(ts_user, ts_pass))
-    else:
-        ts_response = requests.get(ts_query, auth=HTTPDigestAuth(ts_user, ts_pass))
+    (ts_query, ts_response) = \
+        tvh_api_get(f'{ TS_URL_CHN }?limit={ GLOBALS[G_CONFIG].ts_chn_lim }')
 
     print(f'<!-- get_tvh_chan_urls URL { ts_query } -->')
     if ts_response.status_code != 200:
         print('>Error code %d\n%s' % (ts_response.status_code, ts_response.content, ))
-        return {}
+        return ChannelTable()
 
     ts_json = ts_response.json()
     if GLOBALS[G_DBG_LEVEL] > 1:
         print(json.dumps(ts_json, sort_keys=True, indent=4, separators=(',', ': ')) )
 
-    if TS_PAUTH in GLOBALS[G_MY_SETTINGS][SETTINGS_SECTION]:
-        ts_pauth = '&AUTH=%s' % (GLOBALS[G_MY_SETTINGS][SETTINGS_SECTION][TS_PAUTH], )
-    else:
-        ts_pauth = ''
+    tags = get_tvh_chan_tags() or []
 
-
-    chan_map = {}  #  channel-name =>stream-url
+    channels = []  #  (channel-name, channel-uuid, channel-tag-uuids, channel-icon-url)
+    name_index = {}  # channel-name => position in channels
     if 'entries' in ts_json:
         # grab all channel info
         name_unknown = 0
         #number_unknown = -1
         for entry in ts_json['entries']:
-            # start building a dict with channel name as key
+            if len(entry.get('uuid', '')) != TS_UUID_BYTES * 2:
+                print(f'Warning, skipping channel with bad uuid { entry.get("uuid") }')
+                continue
+
             if 'name' in entry:
-                if 'name-not-set' in entry['name']:
-                    #chan_name = str(entry['number'])   # number not unique
-                    chan_name = 'uuid-' + entry['uuid']
-                else:
-                    chan_name = entry['name']
+                chan_name = tvh_chan_name(entry['name'], entry['uuid'])
             else:
                 chan_name = 'unknown ' + str(name_unknown)
                 name_unknown += 1
 
-            chan_map[chan_name] = '%s/%s/%s?profile=%s%s' % \
-                                  (GLOBALS[G_MY_SETTINGS][SETTINGS_SECTION][TS_URL],
-                                   TS_URL_STR,
-                                   entry['uuid'],
-                                   TS_PROFILE,
-                                   ts_pauth, )
+            # names are unique, as when this was a dict the last one wins
+            chan_tags = entry.get('tags', [])
+            chan_icon = tvh_chan_icon(entry)
+            if chan_name in name_index:
+                channels[name_index[chan_name]] = (chan_name, entry['uuid'], chan_tags, chan_icon, )
+            else:
+                name_index[chan_name] = len(channels)
+                channels.append((chan_name, entry['uuid'], chan_tags, chan_icon, ))
+
+    # done with the raw grid, which is by far the biggest thing in memory
+    del ts_json
+    chan_table = ChannelTable(channels, tags)
+
+    if GLOBALS[G_DBG_LEVEL] > 0:
+        print(f'Debug, { len(chan_table) } channels and { len(chan_table.tag_members) } tags '
+              f'in { chan_table.memory_footprint() } bytes')
+
+    return chan_table
+
+
+##########################################################################################
+def tvh_chan_name(name, chan_uuid):
+    ''' returns the name to show for a channel, using the uuid if TVH has no name '''
+
+    if 'name-not-set' in name:
+        #chan_name = str(entry['number'])   # number not unique
+        return 'uuid-' + chan_uuid
+    return name
+
+
+##########################################################################################
+def tvh_chan_icon(entry):
+    ''' returns the icon URL of a channel grid entry or idnode, '' if there isn't one;
+        the public URL goes through the server's image cache, so is preferred '''
+
+    return entry.get('icon_public_url') or entry.get('icon') or ''
+
+
+##########################################################################################
+def get_tvh_chan_details(chan_uuids):
+    ''' loads the name, tags and icon of channels which the server said have changed
+        returns a list of (uuid, name, tag uuids, icon URL) tuples, or None on failure '''
+
+    try:
+        (ts_query, ts_response) = tvh_api_get(TS_URL_IDL, params={'uuid': json.dumps(chan_uuids), })
+        if ts_response.status_code != 200:
+            print(f'Warning, { ts_query } returned { ts_response.status_code }')
+            return None
+
+        details = []
+        for entry in ts_response.json().get('entries', []):
+            params = {param['id']: param.get('value') for param in entry.get('params', [])
+                      if 'id' in param}
+            chan_name = tvh_chan_name(params.get('name') or 'unknown', entry['uuid'])
+            details.append((entry['uuid'], chan_name, params.get('tags') or [],
+                            tvh_chan_icon(params), ))
+    except (requests.exceptions.RequestException, ValueError, KeyError) as req_exc:
+        print(f'Warning, failed to load channel details: { req_exc }')
+        return None
+
+    return details
+
+
+##########################################################################################
+async def comet_listen():
+    ''' subscribes to the server's comet notifications and queues channel and
+        channel tag changes for radio_app to apply, so the list stays current
+        without downloading the whole grid; if the notification stream breaks,
+        fetches the whole list instead and subscribes again '''
+
+    global GLOBALS
+
+    def queue_update(update):
+        GLOBALS[G_CHAN_UPDATES].put(update)
+        GLOBALS[G_EVENTS].put_nowait(('chan_updates', ))
+
+    async def reload_table():
+        # the server may be unreachable, in which case the next poll tries again
+        try:
+            new_table = await asyncio.to_thread(get_tvh_chan_urls)
+        except (requests.exceptions.RequestException, ValueError) as reload_err:
+            print(f'Warning, failed to reload the channel list, { reload_err }')
+            return
+        if len(new_table):
+            queue_update(('table', new_table, ))
+
+    boxid = ''
+    while not GLOBALS[G_QUIT_FLAG]:
+        if not GLOBALS[G_CONFIG].ts_comet:
+            await asyncio.sleep(COMET_RETRY_SECS)
+            continue
+
+        try:
+            # without a boxid the server creates a mailbox and replies at once,
+            # with one it holds the request until there's news; the long poll
+            # runs in a daemon thread so quitting doesn't wait for it
+            params = {'boxid': boxid, 'immediate': 0, } if boxid else {'immediate': 1, }
+            (ts_query, ts_response) = await run_in_daemon_thread(
+                lambda: tvh_api_get(TS_URL_CMT, params=params, timeout=COMET_POLL_TIMEOUT))
+            if ts_response.status_code != 200:
+                raise ValueError(f'{ ts_query } returned { ts_response.status_code }')
+            comet_json = ts_response.json()
+            if 'boxid' not in comet_json:
+                raise ValueError('no boxid in comet reply')
+        except (requests.exceptions.RequestException, ValueError) as comet_err:
+            if GLOBALS[G_QUIT_FLAG]:
+                break
+            print(f'Warning, channel notifications broke, { comet_err }')
+            await asyncio.sleep(COMET_RETRY_SECS)
+            boxid = ''
+            # anything could have changed whilst we weren't listening
+            print('Info, reloading the channel list')
+            await reload_table()
+            continue
+
+        if boxid != comet_json['boxid']:
+            boxid = comet_json['boxid']
+            if GLOBALS[G_DBG_LEVEL]: print(f'Debug, comet mailbox { boxid }')
+
+        changed_uuids = []
+        changed_events = []
+        for message in comet_json.get('messages', []):
+            notification_class = message.get('notificationClass')
+            if notification_class == 'channel':
+                for chan_uuid in message.get('delete', []):
+                    queue_update(('delete', chan_uuid, ))
+                changed_uuids.extend(message.get('create', []))
+                changed_uuids.extend(message.get('change', []))
+            elif notification_class == 'channeltag':
+                tags = await asyncio.to_thread(get_tvh_chan_tags)
+                # keep the tags we have rather than losing them all
+                if tags is not None:
+                    queue_update(('tags', tags, ))
+            elif notification_class == 'epg' and epg_wanted():
+                apply_epg_change(('remove', message.get('delete', []), ))
+                changed_events.extend(message.get('create', []))
+                changed_events.extend(message.get('update', []))
+
+        if changed_uuids:
+            details = await asyncio.to_thread(get_tvh_chan_details, sorted(set(changed_uuids)))
+            if details is None:
+                # notifications may have been lost, so start afresh
+                boxid = ''
+                await reload_table()
+            else:
+                for (chan_uuid, chan_name, chan_tags, chan_icon) in details:
+                    queue_update(('update', chan_uuid, chan_name, chan_tags, chan_icon, ))
+
+        if changed_events and epg_wanted():
+            epg_events = await asyncio.to_thread(get_tvh_epg_events, sorted(set(changed_events)))
+            if epg_events:
+                cutoff = time.time() + GLOBALS[G_CONFIG].epg_days * 86400
+                apply_epg_change(('add', [epg_event for epg_event in epg_events if epg_event[1] < cutoff], ))
+
+
+##########################################################################################
+def get_tvh_epg_events(event_ids=None):
+    ''' gets programmes from the server's guide, the listed event ids, or else the
+        whole guide a page at a time
+        returns a list of (event id, start, stop, channel uuid, title, subtitle,
+        description) tuples, or None on failure '''
+
+    global GLOBALS
+
+    epg_events = []
+    offset = 0
+    while True:
+        if event_ids is None:
+            params = {'start': offset, 'limit': EPG_PAGE_EVENTS, }
+            api_path = TS_URL_EPG
+        else:
+            params = {'eventId': json.dumps(event_ids), }
+            api_path = TS_URL_EPL
+        try:
+            (ts_query, ts_response) = tvh_api_get(api_path, params=params, timeout=EPG_FETCH_TIMEOUT)
+            if ts_response.status_code != 200:
+                print(f'Warning, { ts_query } returned { ts_response.status_code }')
+                return None
+            epg_json = ts_response.json()
+        except (requests.exceptions.RequestException, ValueError) as epg_err:
+            print(f'Warning, failed to get the programme guide: { epg_err }')
+            return None
+
+        entries = epg_json.get('entries', [])
+        for entry in entries:
+            if 'eventId' in entry and 'channelUuid' in entry:
+                epg_events.append((entry['eventId'], entry.get('start', 0), entry.get('stop', 0),
+                                   entry['channelUuid'], entry.get('title') or '',
+                                   entry.get('subtitle') or '',
+                                   entry.get('description') or entry.get('summary') or '', ))
+
+        offset += len(entries)
+        if event_ids is not None or not entries or offset >= epg_json.get('totalCount', 0) or \
+           offset >= EPG_MAX_EVENTS:
+            break
+
+    if GLOBALS[G_DBG_LEVEL]: print(f'Debug, got { len(epg_events) } programmes from the guide')
+    return epg_events
+
+
+##########################################################################################
+class EpgIndex:
+    ''' an inverted index of the programme guide, mapping each word of the titles
+        and descriptions to the programmes containing it, so a week of programmes
+        on every channel can be searched in milliseconds; programmes are added,
+        changed and removed one at a time as the server reports them, and drop
+        out once they've finished '''
+
+    def __init__(self):
+        self.events = {}                # event id => (start, stop, channel uuid, title, subtitle, words)
+        self.postings = {}              # word => set of event ids
+        self.expiry = []                # heap of (stop, event id)
+        self.words = None               # the sorted words, for prefix matches, None if stale
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, epg_events):
+        ''' adds programmes, replacing any with the same event id '''
+
+        for (event_id, start, stop, chan_uuid, title, subtitle, description) in epg_events:
+            self.remove(event_id)
+            # the same words crop up in thousands of programmes, so share them
+            words = tuple(set(sys.intern(word) for word in
+                              EPG_WORD_RE.findall(f'{ title } { subtitle } { description }'.lower())))
+            self.events[event_id] = (start, stop, chan_uuid, title, subtitle, words, )
+            for word in words:
+                if word not in self.postings:
+                    self.postings[word] = set()
+                    self.words = None
+                self.postings[word].add(event_id)
+            heapq.heappush(self.expiry, (stop, event_id, ))
+
+    def remove(self, event_id):
+        ''' removes a programme, if it's in the index '''
+
+        entry = self.events.pop(event_id, None)
+        if entry is None:
+            return
+        for word in entry[5]:
+            event_ids = self.postings[word]
+            event_ids.discard(event_id)
+            if not event_ids:
+                del self.postings[word]
+                self.words = None
+
+    def apply(self, change):
+        ''' applies a change from the server, ('remove', event ids) or
+            ('add', programmes) '''
+
+        if change[0] == 'remove':
+            for event_id in change[1]:
+                self.remove(event_id)
+        else:
+            self.add(change[1])
+
+    def expire(self, now):
+        ''' removes the programmes which finished before now '''
+
+        while self.expiry and self.expiry[0][0] <= now:
+            (stop, event_id) = heapq.heappop(self.expiry)
+            entry = self.events.get(event_id)
+            # skip heap entries left behind by a changed stop time
+            if entry is not None and entry[1] == stop:
+                self.remove(event_id)
+
+    def search(self, query):
+        ''' finds the programmes with every word of the query, each word matching
+            the start of words in the guide, so "new" finds "news"
+            returns a list of (event id, start, stop, channel uuid, title, subtitle),
+            programmes with the query in their titles first, then soonest first '''
+
+        self.expire(time.time())
+        terms = EPG_WORD_RE.findall(query.lower())
+        if not terms:
+            return []
+        if self.words is None:
+            self.words = sorted(self.postings)
+
+        matches = None
+        for term in terms:
+            term_matches = set()
+            word_pos = bisect_left(self.words, term)
+            while word_pos < len(self.words) and self.words[word_pos].startswith(term):
+                term_matches |= self.postings[self.words[word_pos]]
+                word_pos += 1
+            matches = term_matches if matches is None else matches & term_matches
+            if not matches:
+                return []
+
+        def rank(event_id):
+            title = self.events[event_id][3].lower()
+            return (not all(term in title for term in terms), self.events[event_id][0], )
+
+        return [(event_id, *self.events[event_id][:5], ) for event_id in sorted(matches, key=rank)]
+
+
+def load_epg_index(epg_days):
+    ''' fetches the guide and indexes the programmes starting within epg_days
+        returns an EpgIndex, or None on failure '''
+
+    epg_events = get_tvh_epg_events()
+    if epg_events is None:
+        return None
+    cutoff = time.time() + epg_days * 86400
+    epg_index = EpgIndex()
+    epg_index.add(epg_event for epg_event in epg_events if epg_event[1] < cutoff)
+    return epg_index
+
+
+def epg_wanted():
+    ''' returns True if the server's guide changes are wanted, because there's an
+        index or one is being loaded '''
+
+    global GLOBALS
+
+    return GLOBALS[G_EPG] is not None or GLOBALS[G_EPG_CHANGES] is not None
+
+
+def apply_epg_change(change):
+    ''' applies a change from the server to the guide index, and keeps it for
+        the index being loaded, if there is one, as that may have been fetched
+        before the change '''
+
+    global GLOBALS
+
+    if GLOBALS[G_EPG_CHANGES] is not None:
+        GLOBALS[G_EPG_CHANGES].append(change)
+    if GLOBALS[G_EPG] is not None:
+        GLOBALS[G_EPG].apply(change)
+
+
+async def epg_watch():
+    ''' keeps the programme guide index current; the whole guide is fetched and
+        indexed in a daemon thread, so a big guide doesn't hold up the keyboard,
+        and again every EPG_REFRESH_SECS; in between the comet listener applies
+        the server's changes '''
+
+    global GLOBALS
+
+    loaded = 0.0
+    while not GLOBALS[G_QUIT_FLAG]:
+        if not GLOBALS[G_CONFIG].epg_days:
+            GLOBALS[G_EPG] = None
+        elif GLOBALS[G_EPG] is None or time.monotonic() - loaded >= EPG_REFRESH_SECS:
+            # keep the changes which arrive whilst the guide is fetched
+            GLOBALS[G_EPG_CHANGES] = []
+            try:
+                epg_index = await run_in_daemon_thread(load_epg_index, GLOBALS[G_CONFIG].epg_days)
+                if epg_index is not None:
+                    for change in GLOBALS[G_EPG_CHANGES]:
+                        epg_index.apply(change)
+                    GLOBALS[G_EPG] = epg_index
+                    loaded = time.monotonic()
+                    print(f'Info, the programme guide has { len(epg_index) } programmes to search')
+            finally:
+                GLOBALS[G_EPG_CHANGES] = None
+        await asyncio.sleep(EPG_POLL_SECS)
+
+
+def search_key(key):
+    ''' adds a key to the search being typed, echoing it, as the terminal
+        doesn't echo keys
+        returns the search when return is pressed, '' if escape cancelled it,
+        or None whilst typing '''
+
+    global GLOBALS
+
+    if key in ('\n', '\r', ):
+        query = GLOBALS[G_SEARCH_TEXT]
+        GLOBALS[G_SEARCH_TEXT] = None
+        print()
+        return query
+    if key == '\x1b':
+        GLOBALS[G_SEARCH_TEXT] = None
+        print(' - cancelled')
+        return ''
+    if key in ('\x7f', '\b', ):
+        if GLOBALS[G_SEARCH_TEXT]:
+            GLOBALS[G_SEARCH_TEXT] = GLOBALS[G_SEARCH_TEXT][:-1]
+            print('\b \b', end='', flush=True)
+    elif key.isprintable():
+        GLOBALS[G_SEARCH_TEXT] += key
+        print(key, end='', flush=True)
+    return None
+
+
+def search_epg(query, chan_table):
+    ''' searches the programme guide and lists the results, numbered so they
+        can be played
+        returns the channel uuids of the results, in order '''
+
+    global GLOBALS
+
+    if GLOBALS[G_EPG] is None:
+        print('Warning, the programme guide isn\'t loaded yet, or searching is disabled')
+        return []
+
+    search_start = time.monotonic()
+    found = GLOBALS[G_EPG].search(query)
+    if GLOBALS[G_DBG_LEVEL]:
+        print(f'Debug, search found { len(found) } programmes in '
+              f'{ round((time.monotonic() - search_start) * 1000, 1) }ms')
+
+    results = []
+    for (event_id, start, stop, chan_uuid, title, subtitle) in found:
+        chan_num = chan_table.find(chan_uuid)
+        if chan_num is None:
+            continue
+        results.append(chan_uuid)
+        when = datetime.datetime.fromtimestamp(start).strftime('%a %H:%M')
+        until = datetime.datetime.fromtimestamp(stop).strftime('%H:%M')
+        subtitle = f' - { subtitle }' if subtitle else ''
+        print(f'{ len(results) } { when }-{ until } { chan_table.name(chan_num) }: { title }{ subtitle }')
+        if len(results) == EPG_MAX_RESULTS:
+            break
+
+    if not results:
+        print(f'Nothing found for "{ query }"')
+    elif len(found) > len(results):
+        print(f'...and { len(found) - len(results) } more')
+    return results
+
+
+##########################################################################################
+def apply_chan_updates(chan_table, chan_num, view_pos):
+    ''' applies the queued channel changes to the channel table, or replaces it
+        after a full reload, keeping the future channel where possible
+        returns a tuple of the channel table, future channel number, the view
+        of the current tag and the position in that view '''
+
+    global GLOBALS
+
+    chan_uuid = chan_table.uuid(chan_num)
+    while True:
+        try:
+            update = GLOBALS[G_CHAN_UPDATES].get_nowait()
+        except queue.Empty:
+            break
+
+        if update[0] == 'table':
+            chan_table = update[1]
+            GLOBALS[G_LOGOS].fetch(chan_table.icons)
+        elif update[0] == 'tags':
+            chan_table.set_tags(update[1])
+        elif update[0] == 'delete':
+            old_num = chan_table.find(update[1])
+            # never empty the table, there'd be nothing to zap
+            if old_num is not None and len(chan_table) > 1:
+                print(f'Info, channel { chan_table.name(old_num) } deleted')
+                chan_table.remove(old_num)
+        elif update[0] == 'update':
+            (_update, new_uuid, new_name, new_tags, new_icon) = update
+            old_num = chan_table.find(new_uuid)
+            if old_num is not None:
+                chan_table.remove(old_num)
+            else:
+                print(f'Info, channel { new_name } added')
+            chan_table.insert(new_name, new_uuid, new_tags, new_icon)
+            GLOBALS[G_LOGOS].fetch([new_icon, ])
+
+    if GLOBALS[G_DBG_LEVEL]:
+        print(f'Debug, { len(chan_table) } channels after updates')
+
+    # find the future channel again, it may have moved or gone
+    # the tag may have gone, or lost its last channel
+    if GLOBALS[G_CHAN_TAG] not in chan_table.tag_members:
+        GLOBALS[G_CHAN_TAG] = ''
+    chan_view = chan_table.view(GLOBALS[G_CHAN_TAG])
+    new_num = chan_table.find(chan_uuid)
+    new_pos = None if new_num is None else chan_table.view_position(chan_view, new_num)
+    if new_pos is None:
+        # stay at about the same place in the list
+        new_pos = min(view_pos, len(chan_view) - 1)
+    chan_num = chan_view[new_pos]
+
+    return (chan_table, chan_num, chan_view, new_pos)
+
+
+##########################################################################################
+class LogoCache:
+    ''' a disk cache of channel logos, so anything showing them never waits for or
+        repeatedly downloads them
+
+        logos are fetched in the background by a few daemon threads and stored
+        by the SHA-256 of their content, so channels sharing a logo share a file;
+        cached logos are revalidated with the server's ETag or Last-Modified date
+        once they are a day old, the least recently used logos are deleted when
+        the cache is over its size cap, and if a thumbnail size is configured each
+        logo is scaled once as it arrives '''
+
+    def __init__(self, cache_dir, cap_bytes, fetchers, thumb_size):
+        self.cache_dir = cache_dir
+        self.cap_bytes = cap_bytes
+        self.thumb_size = thumb_size
+        if thumb_size and Image is None:
+            print('Warning, logo thumbnails need the python3 PIL (pillow) module')
+            self.thumb_size = None
+
+        self.lock = Lock()
+        self.urls = {}          # icon URL => {hash, etag, modified, checked}
+        self.blobs = {}         # content hash => {size, used}
+        self.pending = set()    # icon URLs being fetched
+        self.fetch_queue = None # icon URLs waiting for a fetcher, None when closed
+        self.fetchers = fetchers
+        if cap_bytes <= 0:
+            return
+
+        os.makedirs(cache_dir, exist_ok=True)
+        # daemons, so quitting never waits for a slow server
+        self.fetch_queue = queue.Queue()
+        for _fetcher in range(fetchers):
+            Thread(target=self.fetcher, args=(self.fetch_queue, ), daemon=True).start()
+        try:
+            with open(os.path.join(cache_dir, LOGO_INDEX), 'r') as index_handle:
+                index = json.load(index_handle)
+            self.urls = index.get('urls', {})
+            self.blobs = index.get('blobs', {})
+        except (OSError, ValueError):
+            pass
+
+        # forget anything whose file has gone
+        self.blobs = {content_hash: blob for (content_hash, blob) in self.blobs.items()
+                      if os.path.isfile(self.blob_path(content_hash))}
+        self.urls = {icon_url: entry for (icon_url, entry) in self.urls.items()
+                     if entry.get('hash') in self.blobs}
+
+    def blob_path(self, content_hash):
+        ''' returns the file name of a logo '''
+        return os.path.join(self.cache_dir, content_hash)
+
+    def thumb_path(self, content_hash):
+        ''' returns the file name of a logo's thumbnail '''
+        return os.path.join(self.cache_dir, '%s-%dx%d.png' % (content_hash, *self.thumb_size, ))
+
+    def path(self, icon_url):
+        ''' returns the file name of a cached logo, or its thumbnail if they're
+            configured, or None if it isn't cached (yet) '''
+
+        with self.lock:
+            entry = self.urls.get(icon_url)
+            if entry is None:
+                return None
+            self.blobs[entry['hash']]['used'] = time.time()
+            if self.thumb_size and os.path.isfile(self.thumb_path(entry['hash'])):
+                return self.thumb_path(entry['hash'])
+            return self.blob_path(entry['hash'])
+
+    def fetch(self, icon_urls):
+        ''' fetches, or revalidates, logos in the background '''
+
+        with self.lock:
+            if self.fetch_queue is None:
+                return
+            for icon_url in set(icon_urls):
+                if icon_url and icon_url not in self.pending:
+                    self.pending.add(icon_url)
+                    self.fetch_queue.put(icon_url)
+
+    def fetcher(self, fetch_queue):
+        ''' a fetcher thread, until it's given None '''
+
+        while True:
+            icon_url = fetch_queue.get()
+            if icon_url is None:
+                break
+            self.fetch_one(icon_url)
+
+    def fetch_one(self, icon_url):
+        ''' fetches a logo unless the cached copy is fresh, runs in the pool '''
+
+        try:
+            with self.lock:
+                entry = dict(self.urls.get(icon_url, {}))
+            if entry and time.time() - entry['checked'] < LOGO_REVALIDATE_SECS:
+                return
+
+            # ask the server to send the logo only if it changed
+            headers = {}
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('modified'):
+                headers['If-Modified-Since'] = entry['modified']
+
+            if re.match(r'https?://', icon_url):
+                response = requests.get(icon_url, headers=headers, timeout=LOGO_FETCH_TIMEOUT)
+            else:
+                (_query, response) = tvh_api_get(icon_url, headers=headers, timeout=LOGO_FETCH_TIMEOUT)
+
+            if response.status_code == 304 and entry:
+                with self.lock:
+                    if icon_url in self.urls:
+                        self.urls[icon_url]['checked'] = time.time()
+                return
+            if response.status_code != 200:
+                if GLOBALS[G_DBG_LEVEL]:
+                    print(f'Debug, logo { icon_url } returned { response.status_code }')
+                return
+
+            content_hash = hashlib.sha256(response.content).hexdigest()
+            if not os.path.isfile(self.blob_path(content_hash)):
+                write_file_atomic(self.blob_path(content_hash), response.content)
+            # the logo may already be cached without a thumbnail
+            size = len(response.content)
+            if self.thumb_size:
+                if not os.path.isfile(self.thumb_path(content_hash)):
+                    self.make_thumb(content_hash, response.content)
+                if os.path.isfile(self.thumb_path(content_hash)):
+                    size += os.path.getsize(self.thumb_path(content_hash))
+
+            with self.lock:
+                self.urls[icon_url] = {'hash': content_hash,
+                                       'etag': response.headers.get('ETag', ''),
+                                       'modified': response.headers.get('Last-Modified', ''),
+                                       'checked': time.time(), }
+                # fetching isn't using, path() marks a logo used when it's shown
+                blob = self.blobs.setdefault(content_hash, {'used': time.time(), })
+                blob['size'] = size
+                self.evict()
+        except (requests.exceptions.RequestException, OSError) as fetch_err:
+            if GLOBALS[G_DBG_LEVEL]:
+                print(f'Debug, failed to fetch logo { icon_url }: { fetch_err }')
+        finally:
+            with self.lock:
+                self.pending.discard(icon_url)
+                # save once a batch of fetches is done, not after every logo
+                if not self.pending:
+                    self.save()
+
+    def make_thumb(self, content_hash, content):
+        ''' scales a logo to fit the thumbnail size, returns the thumbnail's size '''
+
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                image.thumbnail(self.thumb_size)
+                if image.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', ):
+                    image = image.convert('RGBA')
+                thumb_bytes = io.BytesIO()
+                image.save(thumb_bytes, format='PNG')
+        except (OSError, ValueError) as image_err:
+            print(f'Warning, can\'t make a thumbnail of logo { content_hash }: { image_err }')
+            return 0
+
+        write_file_atomic(self.thumb_path(content_hash), thumb_bytes.getvalue())
+        return len(thumb_bytes.getvalue())
+
+    def evict(self):
+        ''' deletes the least recently used logos until the cache fits its cap,
+            must be called with the lock held '''
+
+        total = sum(blob['size'] for blob in self.blobs.values())
+        for content_hash in sorted(self.blobs, key=lambda content_hash: self.blobs[content_hash]['used']):
+            if total <= self.cap_bytes:
+                break
+            total -= self.blobs.pop(content_hash)['size']
+            for file_name in (self.blob_path(content_hash),
+                              self.thumb_path(content_hash) if self.thumb_size else None, ):
+                if file_name and os.path.isfile(file_name):
+                    os.unlink(file_name)
+            for icon_url in [icon_url for (icon_url, entry) in self.urls.items()
+                             if entry['hash'] == content_hash]:
+                del self.urls[icon_url]
+            if GLOBALS[G_DBG_LEVEL]:
+                print(f'Debug, evicted logo { content_hash }')
+
+    def save(self):
+        ''' writes the index, must be called with the lock held '''
+
+        try:
+            write_file_atomic(os.path.join(self.cache_dir, LOGO_INDEX),
+                              json.dumps({'urls': self.urls, 'blobs': self.blobs, }).encode('utf-8'))
+        except OSError as save_err:
+            print(f'Warning, failed to save the logo index: { save_err }')
+
+    def close(self):
+        ''' abandons queued fetches and saves the index; fetches in progress are
+            left to the daemon threads, which die with the app '''
+
+        with self.lock:
+            if self.fetch_queue is None:
+                return
+            # drop what's queued, then tell each fetcher to stop
+            while True:
+                try:
+                    self.pending.discard(self.fetch_queue.get_nowait())
+                except queue.Empty:
+                    break
+            for _fetcher in range(self.fetchers):
+                self.fetch_queue.put(None)
+            self.fetch_queue = None
+            self.save()
+
+
+##########################################################################################
+def write_file_atomic(file_name, data):
+    ''' writes a file via a temporary file and a rename, so a reader never sees
+        half a file, and a crash never leaves one '''
+
+    temp_name = f'{ file_name }.tmp{ os.getpid() }.{ id(data) }'
+    with open(temp_name, 'wb') as temp_handle:
+        temp_handle.write(data)
+    os.replace(temp_name, file_name)
+
+
+##########################################################################################
+def make_stream_url(chan_uuid, profile):
+    ''' builds the URL to stream a channel with a stream profile '''
+
+    global GLOBALS
+
+    config = GLOBALS[G_CONFIG]
+    return '%s/%s/%s?profile=%s%s' % \
+           (config.ts_url,
+            TS_URL_STR,
+            chan_uuid,
+            urllib.parse.quote(profile, safe=''),
+            config.ts_pauth_query, )
+
+
+##########################################################################################
+def get_tvh_profiles():
+    ''' gets the names of the stream profiles the server has
+        returns a list, empty if the server couldn't be asked '''
+
+    global GLOBALS
 
+    try:
+        (ts_query, ts_response) = tvh_api_get(TS_URL_PRL)
+    except requests.exceptions.RequestException as req_exc:
+        print(f'Warning, failed to get stream profiles: { req_exc }')
+        return []
+
+    print(f'<!-- get_tvh_profiles URL { ts_query } -->')
+    if ts_response.status_code != 200:
+        print('>Error code %d\n%s' % (ts_response.status_code, ts_response.content, ))
+        return []
+
+    profiles = [entry['val'] for entry in ts_response.json().get('entries', []) if 'val' in entry]
     if GLOBALS[G_DBG_LEVEL] > 0:
-        print(json.dumps(chan_map, sort_keys=True, indent=4, separators=(',', ': ')) )
+        print(f'Debug, server stream profiles are { ", ".join(profiles) }')
+
+    return profiles
+
+
+##########################################################################################
+def check_tvh_pauth():
+    ''' checks the server accepts the persistent auth token, which the players
+        use instead of a password, by fetching the channel playlist with only
+        the token
+        returns True or False, or None if there's no token or no answer '''
+
+    global GLOBALS
+
+    config = GLOBALS[G_CONFIG]
+    if not config.ts_pauth_query:
+        return None
+
+    ts_query = f'{ config.ts_url }/{ TS_URL_PLS }?{ config.ts_pauth_query[1:] }'
+    try:
+        # only the status matters, so don't download the playlist
+        with requests.get(ts_query, stream=True, timeout=PROBE_CONNECT_TIMEOUT) as ts_response:
+            status_code = ts_response.status_code
+    except requests.exceptions.RequestException as req_exc:
+        print(f'Warning, failed to check the persistent auth token: { req_exc }')
+        return None
+
+    if status_code in (401, 403):
+        print('Error, the server refused the persistent auth token, the player won\'t '
+              'be able to play channels, check the P.A.T. setting')
+        return False
+    if GLOBALS[G_DBG_LEVEL]: print(f'Debug, persistent auth token check got code { status_code }')
+    return status_code == 200
+
+
+##########################################################################################
+def mode_profiles(play_mode):
+    ''' returns the list of profiles configured for the play mode, heaviest first,
+        leaving out any the server doesn't have '''
+
+    global GLOBALS
+
+    if play_mode == PM_RADIO:
+        wanted = GLOBALS[G_CONFIG].ts_profiles_radio
+    else:
+        wanted = GLOBALS[G_CONFIG].ts_profiles_tv
+
+    profiles = [profile for profile in wanted
+                if not GLOBALS[G_PROFILES] or profile in GLOBALS[G_PROFILES]]
+
+    if not profiles:
+        profiles.append(TS_PROFILE)
+
+    return profiles
+
+
+##########################################################################################
+def ts_pcr(packet):
+    ''' returns the PCR base of a transport stream packet in 90kHz ticks,
+        or None if the packet doesn't carry one '''
+
+    # adaptation field present, long enough, with the PCR flag set
+    if packet[3] & 0x20 and packet[4] >= 7 and packet[5] & 0x10:
+        return (packet[6] << 25) | (packet[7] << 17) | (packet[8] << 9) | \
+               (packet[9] << 1) | (packet[10] >> 7)
+    return None
+
+
+##########################################################################################
+def probe_stream(stream_url, probe_secs):
+    ''' reads a stream for probe_secs after the first data arrives, and measures
+        the throughput and how fast the stream's own clock (PCR) advanced
+        compared to the wall clock; a stream the network can't sustain falls
+        behind real time
+        returns a tuple of kbit/s and the real time ratio, which is None if the
+        stream had no PCR, or (0, 0.0) if the stream failed '''
+
+    try:
+        ts_response = requests.get(stream_url, stream=True, timeout=PROBE_CONNECT_TIMEOUT)
+    except requests.exceptions.RequestException as req_exc:
+        print(f'Warning, probe of { stream_url } failed: { req_exc }')
+        return (0, 0.0)
+
+    total_bytes = 0
+    pending = b''
+    pcr_pid = None
+    pcr_first = None
+    pcr_last = None
+    time_first = None
+    try:
+        if ts_response.status_code != 200:
+            print(f'Warning, probe of { stream_url } got code { ts_response.status_code }')
+            return (0, 0.0)
+
+        for chunk in ts_response.iter_content(chunk_size=TS_PACKET_SIZE * 64):
+            now = time.monotonic()
+            if time_first is None:
+                # exclude the time the server took to tune
+                time_first = now
+            total_bytes += len(chunk)
+
+            pending += chunk
+            # resynchronise if not on a packet boundary
+            sync = pending.find(bytes((TS_SYNC_BYTE, )))
+            if sync < 0:
+                pending = b''
+                continue
+            offset = sync
+            while offset + TS_PACKET_SIZE <= len(pending):
+                packet = pending[offset:offset + TS_PACKET_SIZE]
+                offset += TS_PACKET_SIZE
+                if packet[0] != TS_SYNC_BYTE:
+                    continue
+                pcr = ts_pcr(packet)
+                if pcr is None:
+                    continue
+                pid = ((packet[1] & 0x1f) << 8) | packet[2]
+                if pcr_pid is None:
+                    pcr_pid = pid
+                    pcr_first = (pcr, now)
+                if pid == pcr_pid:
+                    pcr_last = (pcr, now)
+            pending = pending[offset:]
+
+            if now - time_first >= probe_secs:
+                break
+    except requests.exceptions.RequestException as req_exc:
+        print(f'Warning, probe of { stream_url } failed: { req_exc }')
+        return (0, 0.0)
+    finally:
+        ts_response.close()
+
+    if time_first is None:
+        return (0, 0.0)
+
+    elapsed = max(time.monotonic() - time_first, 0.001)
+    kbps = int(total_bytes * 8 / elapsed / 1000)
+
+    realtime = None
+    if pcr_first and pcr_last and pcr_last[1] > pcr_first[1]:
+        stream_secs = ((pcr_last[0] - pcr_first[0]) % TS_PCR_WRAP) / TS_PCR_HZ
+        realtime = stream_secs / (pcr_last[1] - pcr_first[1])
+
+    return (kbps, realtime)
+
+
+##########################################################################################
+def choose_profile(chan_uuid, play_mode):
+    ''' chooses the heaviest profile for the play mode which the network can sustain,
+        probing profiles which haven't been measured recently; falls back to the
+        lightest profile if none can be sustained '''
+
+    global GLOBALS
 
-    return dict(sorted(chan_map.items()))
+    profiles = mode_profiles(play_mode)
+    probe_secs = GLOBALS[G_CONFIG].ts_probe_secs
+    if probe_secs <= 0 or len(profiles) == 1:
+        return profiles[0]
+
+    for profile in profiles:
+        stats = GLOBALS[G_PROFILE_STATS].get(profile)
+        if stats is None or time.monotonic() - stats['when'] > PROFILE_PROBE_TTL:
+            (kbps, realtime) = probe_stream(make_stream_url(chan_uuid, profile), probe_secs)
+            stats = {'kbps': kbps, 'realtime': realtime, 'when': time.monotonic(), }
+            GLOBALS[G_PROFILE_STATS][profile] = stats
+            if GLOBALS[G_DBG_LEVEL]:
+                print(f'Debug, profile { profile } measured { kbps }kbit/s, real time ratio { realtime }')
+
+        # no PCR means it can't be judged, so give it the benefit of the doubt
+        if stats['kbps'] > 0 and (stats['realtime'] is None or
+                                  stats['realtime'] >= PROFILE_MIN_REALTIME):
+            return profile
+
+        print(f'Info, network can\'t sustain profile { profile }, trying a lighter one')
+
+    return profiles[-1]
+
+
+##########################################################################################
+def warn_missing_profiles():
+    ''' warns about configured profiles which the server doesn't have, once when
+        the server's profiles or the settings are loaded, rather than on every play '''
+
+    global GLOBALS
+
+    if not GLOBALS[G_PROFILES]:
+        return
+    config = GLOBALS[G_CONFIG]
+    for profile in dict.fromkeys(config.ts_profiles_radio + config.ts_profiles_tv):
+        if profile not in GLOBALS[G_PROFILES]:
+            print(f'Warning, server has no stream profile "{ profile }", it won\'t be used')
+
+
+def forget_profile_stats(profile):
+    ''' discards a profile measurement, so it's probed again next time it's wanted '''
+
+    global GLOBALS
+
+    GLOBALS[G_PROFILE_STATS].pop(profile, None)
 
 
 ##########################################################################################
@@ -543,9 +2006,199 @@ def check_load_config_file(settings_dir, settings_file):
     #print('Debug, check_load_config_file TVH url is %s'
     #      % (GLOBALS[G_MY_SETTINGS][SETTINGS_SECTION][TS_URL], ) )
 
+    try:
+        GLOBALS[G_CONFIG] = Config(GLOBALS[G_MY_SETTINGS])
+    except ValueError as val_err:
+        error_text = 'Error, invalid settings in "%s"\n%s' % (settings_file, val_err, )
+        return(-1, error_text)
+
     return (0, 'OK')
 
 
+##########################################################################################
+class Config:
+    ''' the settings, parsed and validated once, so the rest of the app doesn't
+        keep re-reading and re-splitting strings; a reload makes a new Config
+        which replaces the old one in GLOBALS in a single assignment
+
+        raises ValueError listing every invalid setting '''
+
+    __slots__ = ('ts_url', 'ts_chn_lim', 'auth', 'ts_pauth_query',
+                 'ts_profiles_radio', 'ts_profiles_tv', 'ts_probe_secs', 'ts_comet', 'epg_days',
+                 'play_mode', 'player_argv', 'player_backend', 'demux_player_argv',
+                 'logo_cache_bytes', 'logo_fetchers', 'logo_thumb_size',
+                 'relay_port', 'relay_public', 'warmup_max', )
+
+    def __init__(self, settings):
+        problems = []
+
+        def get(setting):
+            # settings files which predate a setting get its default
+            return settings.get(SETTINGS_SECTION, setting,
+                                fallback=SETTINGS_DEFAULTS[setting][DFLT]).strip()
+
+        self.ts_url = get(TS_URL).rstrip('/')
+        if not re.match(r'https?://[^/]+', self.ts_url):
+            problems.append(f'{ TS_URL } "{ self.ts_url }" is not an http or https URL')
+
+        try:
+            self.ts_chn_lim = int(get(TS_CHN_LIMIT))
+            if self.ts_chn_lim < 1:
+                raise ValueError
+        except ValueError:
+            problems.append(f'{ TS_CHN_LIMIT } "{ get(TS_CHN_LIMIT) }" is not a positive number')
+
+        ts_auth_type = get(TS_AUTH_TYPE)
+        if ts_auth_type == 'plain':
+            self.auth = (get(TS_USER), get(TS_PASS), )
+        elif ts_auth_type == 'digest':
+            self.auth = HTTPDigestAuth(get(TS_USER), get(TS_PASS))
+        else:
+            problems.append(f'{ TS_AUTH_TYPE } "{ ts_auth_type }" is not digest or plain')
+
+        if settings.has_option(SETTINGS_SECTION, TS_PAUTH):
+            self.ts_pauth_query = '&AUTH=%s' % (get(TS_PAUTH), )
+        else:
+            self.ts_pauth_query = ''
+
+        self.ts_profiles_radio = tuple(profile.strip() for profile in get(TS_PROFILES_RADIO).split(',')
+                                       if profile.strip())
+        self.ts_profiles_tv = tuple(profile.strip() for profile in get(TS_PROFILES_TV).split(',')
+                                    if profile.strip())
+
+        try:
+            self.ts_probe_secs = float(get(TS_PROBE_SECS))
+        except ValueError:
+            problems.append(f'{ TS_PROBE_SECS } "{ get(TS_PROBE_SECS) }" is not a number')
+
+        self.ts_comet = get(TS_COMET) == '1'
+
+        try:
+            self.epg_days = float(get(EPG_DAYS))
+            if self.epg_days < 0:
+                raise ValueError
+        except ValueError:
+            problems.append(f'{ EPG_DAYS } "{ get(EPG_DAYS) }" is not a number of days')
+
+        self.play_mode = get(PLAY_MODE)
+        if self.play_mode not in (PM_RADIO, PM_TV):
+            problems.append(f'{ PLAY_MODE } "{ self.play_mode }" is not { PM_RADIO } or { PM_TV }')
+
+        # honour shell quoting, so players with spaces in arguments work
+        try:
+            self.player_argv = shlex.split(get(PLAYER_COMMAND))
+            if not self.player_argv:
+                problems.append(f'{ PLAYER_COMMAND } is empty')
+        except ValueError as val_err:
+            problems.append(f'{ PLAYER_COMMAND } can\'t be split, { val_err }')
+
+        self.player_backend = get(PLAYER_BACKEND)
+        if self.player_backend not in (PB_SPAWN, PB_MPV, PB_DEMUX, PB_FAKE):
+            problems.append(f'{ PLAYER_BACKEND } "{ self.player_backend }" is not '
+                            f'{ PB_SPAWN }, { PB_MPV }, { PB_DEMUX } or { PB_FAKE }')
+
+        try:
+            self.demux_player_argv = shlex.split(get(DEMUX_PLAYER_COMMAND))
+            if not self.demux_player_argv and self.player_backend == PB_DEMUX:
+                problems.append(f'{ DEMUX_PLAYER_COMMAND } is empty')
+        except ValueError as val_err:
+            problems.append(f'{ DEMUX_PLAYER_COMMAND } can\'t be split, { val_err }')
+
+        try:
+            self.logo_cache_bytes = int(float(get(LOGO_CACHE_MB)) * 1024 * 1024)
+            if self.logo_cache_bytes < 0:
+                raise ValueError
+        except ValueError:
+            problems.append(f'{ LOGO_CACHE_MB } "{ get(LOGO_CACHE_MB) }" is not a size in MB')
+
+        try:
+            self.logo_fetchers = int(get(LOGO_FETCHERS))
+            if self.logo_fetchers < 1:
+                raise ValueError
+        except ValueError:
+            problems.append(f'{ LOGO_FETCHERS } "{ get(LOGO_FETCHERS) }" is not a positive number')
+
+        thumb_match = re.fullmatch(r'(\d+)x(\d+)', get(LOGO_THUMB_SIZE))
+        if thumb_match:
+            self.logo_thumb_size = (int(thumb_match.group(1)), int(thumb_match.group(2)), )
+        elif get(LOGO_THUMB_SIZE) == '':
+            self.logo_thumb_size = None
+        else:
+            problems.append(f'{ LOGO_THUMB_SIZE } "{ get(LOGO_THUMB_SIZE) }" is not like 64x64')
+
+        try:
+            self.relay_port = int(get(RELAY_PORT))
+            if not 0 <= self.relay_port <= 65535:
+                raise ValueError
+        except ValueError:
+            problems.append(f'{ RELAY_PORT } "{ get(RELAY_PORT) }" is not a port number or 0')
+
+        self.relay_public = get(RELAY_PUBLIC) == '1'
+
+        try:
+            self.warmup_max = int(get(WARMUP_MAX))
+            if self.warmup_max < 0:
+                raise ValueError
+        except ValueError:
+            problems.append(f'{ WARMUP_MAX } "{ get(WARMUP_MAX) }" is not a number of channels')
+
+        if problems:
+            raise ValueError('\n'.join(problems))
+
+    @property
+    def player_backend_argv(self):
+        ''' the command the chosen player backend runs '''
+        if self.player_backend == PB_DEMUX:
+            return self.demux_player_argv
+        return self.player_argv
+
+
+##########################################################################################
+async def config_watch(settings_file):
+    ''' periodic job which watches the settings file and applies edits whilst the
+        app runs; a stream which is playing carries on, the new settings are used
+        the next time something is played or fetched; invalid edits are ignored '''
+
+    global GLOBALS
+
+    def file_signature():
+        try:
+            config_stat = os.stat(settings_file)
+            return (config_stat.st_mtime_ns, config_stat.st_size, )
+        except OSError:
+            return None
+
+    last_signature = file_signature()
+    while not GLOBALS[G_QUIT_FLAG]:
+        await asyncio.sleep(CONFIG_POLL_SECS)
+        signature = file_signature()
+        if signature is None or signature == last_signature:
+            continue
+        last_signature = signature
+
+        new_settings = configparser.ConfigParser()
+        try:
+            if not new_settings.read(settings_file):
+                raise ValueError('unreadable')
+            new_config = Config(new_settings)
+        except (ValueError, configparser.Error) as cfg_err:
+            print(f'Warning, ignoring invalid edit to "{ settings_file }"\n{ cfg_err }')
+            continue
+
+        old_config = GLOBALS[G_CONFIG]
+        GLOBALS[G_MY_SETTINGS] = new_settings
+        GLOBALS[G_CONFIG] = new_config
+        if GLOBALS[G_PLAYER] is not None:
+            GLOBALS[G_PLAYER].play_cmd_array = new_config.player_backend_argv
+        print(f'Info, reloaded settings from "{ settings_file }"')
+        # as if v had been pressed, only if the setting changed, so an edit of
+        # something else doesn't undo v
+        if new_config.play_mode != old_config.play_mode:
+            GLOBALS[G_PLAY_MODE] = new_config.play_mode
+            print(f'Play mode now { GLOBALS[G_PLAY_MODE] }, '
+                  f'profiles { ", ".join(mode_profiles(GLOBALS[G_PLAY_MODE])) }')
+        warn_missing_profiles()
+
 
 ##########################################################################################
 # settings_editor
@@ -611,89 +2264,1624 @@ def play_file(audio_file_name):
 
     global GLOBALS
 
-    play_cmd = GLOBALS[G_MY_SETTINGS].get(SETTINGS_SECTION, PLAYER_COMMAND)
-    play_cmd_array = play_cmd.split()
-    play_cmd_array.append(audio_file_name)
+    play_cmd_array = GLOBALS[G_CONFIG].player_argv + [audio_file_name, ]
     #print('Debug, play command is "%s"' % ('" "'.join(play_cmd_array), ))
 
     subprocess.call(play_cmd_array)
 
 
 ##########################################################################################
-# play_channel
-def play_channel(stream_url):
-    ''' starts playing stream in a sub process
-        if it sees STOP_PLAYBACK then it kills the player '''
+class PlayerBackend:
+    ''' base class of the things which can play a stream URL
+        play() replaces whatever is playing, stop() leaves the backend ready
+        to play again, close() releases everything when the app quits '''
 
-    global GLOBALS
+    name = 'none'
+
+    def __init__(self, play_cmd_array):
+        self.play_cmd_array = play_cmd_array
+
+    @property
+    def pid(self):
+        ''' the process id of the player, or 0 '''
+        return 0
+
+    def play(self, stream_url):
+        ''' start playing the stream, replacing any current stream '''
+        raise NotImplementedError
+
+    def stop(self):
+        ''' stop playing '''
+        raise NotImplementedError
+
+    def is_playing(self):
+        ''' True if a stream is playing '''
+        raise NotImplementedError
+
+    def next_audio(self):
+        ''' switch to the next audio track, if the stream has several '''
+        print(f'Info, the { self.name } player backend can\'t change audio tracks')
+
+    def quality(self):
+        ''' the rolling quality summary of the stream playing, or None if the
+            backend doesn't see the stream data '''
+        return None
+
+    def close(self):
+        ''' stop playing and release all resources '''
+        self.stop()
+
+
+##########################################################################################
+class SpawnPlayer(PlayerBackend):
+    ''' the original behaviour, a new player process per stream, which is killed to stop '''
+
+    name = PB_SPAWN
+
+    def __init__(self, play_cmd_array):
+        super().__init__(play_cmd_array)
+        self.player_proc = None
+
+    @property
+    def pid(self):
+        if self.is_playing():
+            return self.player_proc.pid
+        return 0
+
+    def play(self, stream_url):
+        self.stop()
+        play_cmd_array = self.play_cmd_array + [stream_url, ]
+        print('Debug, play command is "%s"' % ('" "'.join(play_cmd_array), ))
+        self.player_proc = subprocess.Popen(play_cmd_array, shell=False)
+        if GLOBALS[G_DBG_LEVEL]: print('Debug, player pid %d' % (self.player_proc.pid, ))
+
+    def stop(self):
+        if self.is_playing():
+            self.player_proc.kill()
+            self.player_proc.wait()
+        self.player_proc = None
+
+    def is_playing(self):
+        return self.player_proc is not None and self.player_proc.poll() is None
+
+
+##########################################################################################
+class MpvIpcPlayer(PlayerBackend):
+    ''' one long lived mpv process, told which stream to play over its JSON IPC socket,
+        which saves the process start up and decoder initialisation on every zap '''
+
+    name = PB_MPV
+
+    def __init__(self, play_cmd_array, socket_path):
+        super().__init__(play_cmd_array)
+        self.socket_path = socket_path
+        self.player_proc = None
+        self.ipc_sock = None
+        self.ipc_file = None
+        self.request_id = 0
+
+    @property
+    def pid(self):
+        if self.player_proc is not None and self.player_proc.poll() is None:
+            return self.player_proc.pid
+        return 0
+
+    def start(self):
+        ''' starts mpv idling and connects to its IPC socket '''
+
+        self.disconnect()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        play_cmd_array = self.play_cmd_array + ['--idle=yes',
+                                                f'--input-ipc-server={ self.socket_path }', ]
+        print('Debug, mpv command is "%s"' % ('" "'.join(play_cmd_array), ))
+        self.player_proc = subprocess.Popen(play_cmd_array, shell=False)
+        if GLOBALS[G_DBG_LEVEL]: print('Debug, mpv pid %d' % (self.player_proc.pid, ))
+
+        # mpv creates the socket shortly after starting
+        deadline = time.monotonic() + MPV_IPC_TIMEOUT
+        while True:
+            try:
+                self.ipc_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.ipc_sock.connect(self.socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                self.ipc_sock.close()
+                self.ipc_sock = None
+                if self.player_proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f'mpv IPC socket { self.socket_path } never appeared')
+                time.sleep(0.1)
+        self.ipc_sock.settimeout(MPV_REPLY_TIMEOUT)
+        self.ipc_file = self.ipc_sock.makefile('rwb')
+
+    def disconnect(self):
+        ''' closes the IPC socket, if open '''
+
+        if self.ipc_file:
+            self.ipc_file.close()
+            self.ipc_file = None
+        if self.ipc_sock:
+            self.ipc_sock.close()
+            self.ipc_sock = None
+
+    def command(self, *args):
+        ''' sends a command to mpv and returns the reply, skipping over any events
+            which mpv sends on the same socket; an mpv which doesn't answer in
+            time is killed, so the supervisor restarts it '''
+
+        self.request_id += 1
+        request = {'command': list(args), 'request_id': self.request_id, }
+        try:
+            self.ipc_file.write(json.dumps(request).encode('utf-8') + b'\n')
+            self.ipc_file.flush()
+            while True:
+                line = self.ipc_file.readline()
+                if not line:
+                    raise ConnectionError('mpv closed its IPC socket')
+                reply = json.loads(line)
+                if reply.get('request_id') == self.request_id:
+                    if GLOBALS[G_DBG_LEVEL] > 1: print(f'Debug, mpv { args } -> { reply }')
+                    return reply
+        except socket.timeout as ipc_err:
+            print(f'Warning, mpv didn\'t answer { args[0] } within { MPV_REPLY_TIMEOUT }s, killing it')
+            self.player_proc.kill()
+            self.player_proc.wait()
+            self.disconnect()
+            raise ConnectionError('mpv stopped answering') from ipc_err
+
+    def play(self, stream_url):
+        # (re)start mpv if it was never started or has died
+        if self.pid == 0:
+            self.start()
+        print(f'Debug, mpv loading { stream_url }')
+        reply = self.command('loadfile', stream_url, 'replace')
+        if reply.get('error') != 'success':
+            raise RuntimeError(f'mpv refused to load { stream_url }: { reply.get("error") }')
+
+    def stop(self):
+        if self.pid != 0:
+            self.command('stop')
+
+    def next_audio(self):
+        if self.pid != 0:
+            self.command('cycle', 'audio')
+
+    def is_playing(self):
+        if self.pid == 0:
+            return False
+        try:
+            return self.command('get_property', 'idle-active').get('data') is False
+        except (ConnectionError, OSError, ValueError):
+            return False
+
+    def close(self):
+        if self.pid != 0:
+            try:
+                self.command('quit')
+            except (ConnectionError, OSError, ValueError):
+                self.player_proc.kill()
+            self.player_proc.wait()
+        self.disconnect()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+##########################################################################################
+class StreamMonitor:
+    ''' watches the stream data go past without changing it, counting transport
+        stream continuity counter errors, which are lost or corrupted packets,
+        measuring the bitrate and the gaps between arrivals each second, and
+        counting stalls, when no data arrives for a while
+
+        fed by the thread reading the stream, summarised by the event loop '''
+
+    def __init__(self, chan_name):
+        self.chan_name = chan_name
+        self.lock = Lock()
+        self.pending = b''              # an incomplete packet from the last chunk
+        self.counters = {}              # pid => last continuity counter
+        self.last_arrival = None
+        self.second = None              # the one second bucket being filled
+        self.bucket = None              # [bytes, cc errors, stalls, max gap]
+        self.seconds = []               # (second, bytes, cc errors, stalls, max gap) in the window
+        # totals since they were last taken for the quality log
+        self.totals = {'secs': 0.0, 'bytes': 0, 'cc_errors': 0, 'stalls': 0,
+                       'stall_secs': 0.0, 'max_gap_secs': 0.0, }
+
+    def feed(self, data, cc_errors=None):
+        ''' accounts for a chunk of the stream as it arrives; a caller which has
+            already split the chunk into packets passes the continuity errors
+            it counted with check_counter, so the chunk isn't scanned again '''
+
+        now = time.monotonic()
+        if cc_errors is None:
+            cc_errors = self.count_cc_errors(data)
+
+        with self.lock:
+            gap = 0.0 if self.last_arrival is None else now - self.last_arrival
+            self.last_arrival = now
+            stalled = gap >= QUALITY_STALL_SECS
+            if stalled and GLOBALS[G_DBG_LEVEL]:
+                print(f'Debug, { self.chan_name } stalled for { round(gap, 1) }s')
+            if cc_errors and GLOBALS[G_DBG_LEVEL]:
+                print(f'Debug, { self.chan_name } has { cc_errors } continuity errors')
+
+            second = int(now)
+            if second != self.second:
+                self.close_second()
+                self.second = second
+                self.bucket = [0, 0, 0, 0.0]
+            self.bucket[0] += len(data)
+            self.bucket[1] += cc_errors
+            self.bucket[2] += stalled
+            self.bucket[3] = max(self.bucket[3], gap)
+
+            self.totals['secs'] += gap
+            self.totals['bytes'] += len(data)
+            self.totals['cc_errors'] += cc_errors
+            if stalled:
+                self.totals['stalls'] += 1
+                self.totals['stall_secs'] += gap
+            self.totals['max_gap_secs'] = max(self.totals['max_gap_secs'], gap)
+
+    def count_cc_errors(self, data):
+        ''' returns how many packets in the chunk have a continuity counter which
+            doesn't follow on from the last packet of their PID '''
+
+        pending = self.pending + data
+        cc_errors = 0
+        offset = pending.find(TS_SYNC_BYTE)
+        if offset < 0:
+            offset = len(pending)
+        last = len(pending) - TS_PACKET_SIZE
+        while offset <= last:
+            if pending[offset] != TS_SYNC_BYTE:
+                offset = pending.find(TS_SYNC_BYTE, offset + 1)
+                if offset < 0:
+                    offset = len(pending)
+                continue
+
+            pid = ((pending[offset + 1] & 0x1f) << 8) | pending[offset + 2]
+            cc_errors += self.check_counter(pending, offset, pid)
+            offset += TS_PACKET_SIZE
+
+        self.pending = pending[offset:]
+        return cc_errors
+
+    def check_counter(self, pending, offset, pid):
+        ''' returns 1 if the continuity counter of the packet at the offset
+            doesn't follow on from the last packet of its PID, else 0 '''
+
+        flags = pending[offset + 3]
+        # the counter only advances on packets with a payload
+        if pid == TS_PID_NULL or not flags & 0x10:
+            return 0
+        counter = flags & 0x0f
+        last_counter = self.counters.get(pid)
+        self.counters[pid] = counter
+        # a flagged discontinuity is expected, one repeat is allowed
+        discontinuity = flags & 0x20 and pending[offset + 4] and pending[offset + 5] & 0x80
+        if last_counter is not None and not discontinuity and \
+           counter not in (last_counter, (last_counter + 1) & 0x0f):
+            return 1
+        return 0
+
+    def close_second(self):
+        ''' moves the second being filled into the window, must be called with
+            the lock held '''
+
+        if self.second is not None:
+            self.seconds.append((self.second, *self.bucket, ))
+        while self.seconds and self.seconds[0][0] <= int(time.monotonic()) - QUALITY_WINDOW_SECS:
+            del self.seconds[0]
+
+    def summary(self):
+        ''' returns the quality over the rolling window as a dict '''
+
+        with self.lock:
+            now = time.monotonic()
+            # include the last second, even though it's not over
+            seconds = self.seconds + ([(self.second, *self.bucket, )] if self.bucket else [])
+            seconds = [sec for sec in seconds if sec[0] > int(now) - QUALITY_WINDOW_SECS]
+            stalled_secs = 0.0
+            if self.last_arrival is not None and now - self.last_arrival >= QUALITY_STALL_SECS:
+                stalled_secs = now - self.last_arrival
+
+        span = max(1, int(now) - seconds[0][0] + 1) if seconds else 1
+        return {
+            'window_secs': span,
+            'kbps': int(sum(sec[1] for sec in seconds) * 8 / span / 1000),
+            # the first and last seconds are partial, so ignore them
+            'kbps_min': int(min(sec[1] for sec in seconds[1:-1]) * 8 / 1000) if len(seconds) > 2 else None,
+            'cc_errors': sum(sec[2] for sec in seconds),
+            'stalls': sum(sec[3] for sec in seconds),
+            'max_gap_secs': round(max((sec[4] for sec in seconds), default=0.0), 3),
+            'stalled_secs': round(stalled_secs, 1),
+        }
+
+    def take_totals(self):
+        ''' returns the totals since they were last taken, and resets them '''
+
+        with self.lock:
+            totals = self.totals
+            self.totals = dict.fromkeys(totals, 0)
+        return totals
+
+
+def format_quality(summary):
+    ''' describes a stream quality summary in a line '''
+
+    text = f'{ summary["kbps"] }kbit/s, '
+    if summary['kbps_min'] is not None:
+        text += f'lowest { summary["kbps_min"] }kbit/s, '
+    text += f'{ summary["cc_errors"] } continuity errors, { summary["stalls"] } stalls, ' \
+            f'longest gap { summary["max_gap_secs"] }s, over { summary["window_secs"] }s'
+    if summary['stalled_secs']:
+        text += f', stalled for { summary["stalled_secs"] }s now'
+    return text
+
+
+##########################################################################################
+class QualityLog:
+    ''' the stream quality of each channel, accumulated over every time it's
+        played and kept in a JSON file, so dropouts can be compared between
+        channels and over days; the file is only rewritten every so often '''
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.lock = Lock()
+        self.last_save = time.monotonic()
+        try:
+            with open(file_name, 'r') as quality_handle:
+                self.channels = json.load(quality_handle)
+        except (OSError, ValueError):
+            self.channels = {}
+
+    def record(self, monitor, force_save=False):
+        ''' adds a monitor's totals and latest summary to its channel's entry and
+            saves the file, if it's due '''
+
+        if not force_save and time.monotonic() - self.last_save < QUALITY_SAVE_SECS:
+            return
+
+        totals = monitor.take_totals()
+        summary = monitor.summary()
+        if GLOBALS[G_DBG_LEVEL]:
+            print(f'Debug, { monitor.chan_name } quality { format_quality(summary) }')
+        with self.lock:
+            entry = self.channels.setdefault(monitor.chan_name, {})
+            for (key, value) in totals.items():
+                if key == 'max_gap_secs':
+                    entry[key] = round(max(entry.get(key, 0.0), value), 3)
+                else:
+                    entry[key] = round(entry.get(key, 0) + value, 3)
+            entry['last_summary'] = summary
+            entry['updated'] = datetime.datetime.now().isoformat(timespec='seconds')
+
+            self.last_save = time.monotonic()
+            try:
+                write_file_atomic(self.file_name, json.dumps(self.channels, indent=1).encode('utf-8'))
+            except OSError as save_err:
+                print(f'Warning, failed to save the stream quality: { save_err }')
+
+    def describe(self, chan_name):
+        ''' describes the accumulated quality of a channel in a line, or returns
+            None if it's never been monitored '''
+
+        with self.lock:
+            entry = self.channels.get(chan_name)
+            if not entry or not entry.get('secs'):
+                return None
+            kbps = int(entry['bytes'] * 8 / entry['secs'] / 1000)
+            return f'{ kbps }kbit/s, { entry["cc_errors"] } continuity errors, ' \
+                   f'{ entry["stalls"] } stalls totalling { entry["stall_secs"] }s, ' \
+                   f'longest gap { entry["max_gap_secs"] }s, over { int(entry["secs"] / 60) } ' \
+                   f'minutes played, last { entry["updated"] }'
+
+
+##########################################################################################
+class TsDemuxer:
+    ''' extracts one audio elementary stream from a transport stream; the PAT gives
+        the PID of the service's PMT, the PMT lists its audio streams, and the
+        payloads of the chosen audio PID's packets are returned with their PES
+        headers stripped; packets of every other PID are skipped unparsed, other
+        than checking their continuity for the stream monitor, if there is one '''
+
+    def __init__(self, audio_index, monitor=None):
+        self.audio_index = audio_index  # which of the audio streams to extract
+        self.monitor = monitor          # fed each chunk once it has been split into packets
+        self.audio_streams = []         # (pid, codec, language) from the PMT
+        self.audio_pid = None
+        self.pmt_pid = None
+        self.pmt_version = None
+        self.in_pes = False             # False until the start of a PES is seen
+        self.pending = b''              # an incomplete packet from the last chunk
+        self.sections = {}              # pid => incomplete PSI section
+
+    def feed(self, data):
+        ''' demuxes a chunk of the stream, returns the audio bytes found in it '''
+
+        pending = self.pending + data
+        view = memoryview(pending)
+        monitor = self.monitor
+        audio = []
+        cc_errors = 0
+        offset = 0
+        last = len(pending) - TS_PACKET_SIZE
+        while offset <= last:
+            if pending[offset] != TS_SYNC_BYTE:
+                # lost sync, skip to the next sync byte
+                offset = pending.find(TS_SYNC_BYTE, offset + 1)
+                if offset < 0:
+                    offset = len(pending)
+                continue
+
+            pid = ((pending[offset + 1] & 0x1f) << 8) | pending[offset + 2]
+            if monitor is not None:
+                cc_errors += monitor.check_counter(pending, offset, pid)
+            if pid in (self.audio_pid, self.pmt_pid, TS_PID_PAT):
+                flags = pending[offset + 3]
+                start = offset + 4
+                if flags & 0x20:
+                    # skip the adaptation field
+                    start += 1 + pending[start]
+                end = offset + TS_PACKET_SIZE
+                # has a payload, isn't scrambled
+                if flags & 0x10 and not flags & 0xc0 and start < end:
+                    unit_start = pending[offset + 1] & 0x40
+                    if pid == self.audio_pid:
+                        self.audio_payload(view[start:end], unit_start, audio)
+                    else:
+                        self.section_payload(pid, view[start:end], unit_start)
+            offset += TS_PACKET_SIZE
+
+        self.pending = pending[offset:]
+        if monitor is not None:
+            monitor.feed(data, cc_errors)
+        return b''.join(audio)
+
+    def audio_payload(self, payload, unit_start, audio):
+        ''' appends the audio in a packet of the audio PID to the list '''
+
+        if unit_start:
+            if payload[:3] != TS_PES_START or len(payload) < 9:
+                self.in_pes = False
+                return
+            self.in_pes = True
+            payload = payload[9 + payload[8]:]
+        if self.in_pes:
+            audio.append(payload)
+
+    def section_payload(self, pid, payload, unit_start):
+        ''' gathers the PAT or PMT section, which may span packets, and parses it
+            once complete '''
+
+        if unit_start:
+            # skip the pointer field
+            section = bytes(payload[1 + payload[0]:])
+        elif pid in self.sections:
+            section = self.sections[pid] + bytes(payload)
+        else:
+            return
+
+        if len(section) >= 3:
+            section_length = 3 + (((section[1] & 0x0f) << 8) | section[2])
+            if len(section) >= section_length:
+                self.sections.pop(pid, None)
+                if pid == TS_PID_PAT:
+                    self.parse_pat(section[:section_length])
+                else:
+                    self.parse_pmt(section[:section_length])
+                return
+        self.sections[pid] = section
+
+    def parse_pat(self, section):
+        ''' finds the PMT PID of the first program, a TVH channel stream has one '''
+
+        if section[0] != TS_TABLE_PAT:
+            return
+        # program entries run from after the header to before the CRC
+        for offset in range(8, len(section) - 4, 4):
+            program = (section[offset] << 8) | section[offset + 1]
+            if program != 0:    # 0 is the network PID, not a program
+                pmt_pid = ((section[offset + 2] & 0x1f) << 8) | section[offset + 3]
+                if pmt_pid != self.pmt_pid:
+                    self.pmt_pid = pmt_pid
+                    self.pmt_version = None
+                return
+
+    def parse_pmt(self, section):
+        ''' lists the audio streams of the program and chooses one '''
+
+        if section[0] != TS_TABLE_PMT or len(section) < 16:
+            return
+        version = (section[5] >> 1) & 0x1f
+        if version == self.pmt_version:
+            return
+        self.pmt_version = version
+
+        audio_streams = []
+        offset = 12 + (((section[10] & 0x0f) << 8) | section[11])
+        while offset + 5 <= len(section) - 4:
+            stream_type = section[offset]
+            pid = ((section[offset + 1] & 0x1f) << 8) | section[offset + 2]
+            info_length = ((section[offset + 3] & 0x0f) << 8) | section[offset + 4]
+            descriptors = section[offset + 5:offset + 5 + info_length]
+            offset += 5 + info_length
+
+            codec = TS_AUDIO_TYPES.get(stream_type)
+            language = ''
+            desc_offset = 0
+            while desc_offset + 2 <= len(descriptors):
+                tag = descriptors[desc_offset]
+                body = descriptors[desc_offset + 2:desc_offset + 2 + descriptors[desc_offset + 1]]
+                desc_offset += 2 + len(body)
+                if tag == TS_LANGUAGE_DESCRIPTOR and len(body) >= 3:
+                    language = body[:3].decode('latin-1')
+                elif stream_type == TS_TYPE_PRIVATE and tag in TS_AUDIO_DESCRIPTORS:
+                    codec = TS_AUDIO_DESCRIPTORS[tag]
+            if codec:
+                audio_streams.append((pid, codec, language, ))
+
+        self.audio_streams = audio_streams
+        if not audio_streams:
+            print('Warning, the stream has no audio which can be demuxed')
+            self.audio_pid = None
+            return
+        self.audio_index %= len(audio_streams)
+        (pid, codec, language, ) = audio_streams[self.audio_index]
+        if pid != self.audio_pid:
+            self.audio_pid = pid
+            self.in_pes = False
+            print(f'Info, audio track { self.audio_index + 1 }/{ len(audio_streams) }, '
+                  f'{ codec } { language or "unknown language" }')
+
+
+##########################################################################################
+class DemuxPlayer(PlayerBackend):
+    ''' reads the stream itself and pipes just the audio of the chosen track to a
+        light audio player reading its stdin, so a small machine doesn't spend CPU
+        on the player demuxing video it never shows '''
+
+    name = PB_DEMUX
+
+    def __init__(self, play_cmd_array):
+        super().__init__(play_cmd_array)
+        self.player_proc = None
+        self.ts_response = None
+        self.demuxer = None
+        self.pump_thread = None
+        self.monitor = None
+        self.stream_url = ''
+        self.audio_index = 0
+        self.stopping = False
+
+    @property
+    def pid(self):
+        if self.is_playing():
+            return self.player_proc.pid
+        return 0
+
+    def play(self, stream_url):
+        self.stop()
+        # a different channel starts on its first audio track
+        if stream_url.split('?')[0] != self.stream_url.split('?')[0]:
+            self.audio_index = 0
+        self.stream_url = stream_url
+
+        ts_response = requests.get(stream_url, stream=True, timeout=PROBE_CONNECT_TIMEOUT)
+        if ts_response.status_code != 200:
+            ts_response.close()
+            raise RuntimeError(f'{ stream_url } returned code { ts_response.status_code }')
+
+        print('Debug, demux player command is "%s"' % ('" "'.join(self.play_cmd_array), ))
+        try:
+            self.player_proc = subprocess.Popen(self.play_cmd_array, stdin=subprocess.PIPE,
+                                                shell=False)
+        except OSError:
+            ts_response.close()
+            raise
+        if GLOBALS[G_DBG_LEVEL]: print('Debug, demux player pid %d' % (self.player_proc.pid, ))
+
+        self.ts_response = ts_response
+        self.monitor = StreamMonitor(GLOBALS[G_CHAN_NAME_PLAYING] or stream_url)
+        self.demuxer = TsDemuxer(self.audio_index, self.monitor)
+        self.stopping = False
+        self.pump_thread = Thread(target=self.pump,
+                                  args=(ts_response, self.demuxer, self.monitor, self.player_proc, ),
+                                  daemon=True)
+        self.pump_thread.start()
+
+    def pump(self, ts_response, demuxer, monitor, player_proc):
+        ''' the thread which reads the stream and feeds the player its audio;
+            when the stream ends the player's stdin is closed, so it exits and
+            the supervisor sees the failure '''
+
+        try:
+            for chunk in ts_response.iter_content(chunk_size=TS_PACKET_SIZE * DEMUX_CHUNK_PACKETS):
+                # feeds the monitor too
+                audio = demuxer.feed(chunk)
+                # the relay logs the quality of what it relays
+                if GLOBALS[G_QUALITY] is not None and GLOBALS[G_RELAY] is None:
+                    GLOBALS[G_QUALITY].record(monitor)
+                if audio:
+                    player_proc.stdin.write(audio)
+        # closing the stream or the player to stop it ends up here too
+        except (OSError, ValueError, AttributeError) as pump_err:
+            if not self.stopping:
+                print(f'Warning, demuxing stopped: { pump_err }')
+        finally:
+            ts_response.close()
+            try:
+                player_proc.stdin.close()
+            except OSError:
+                pass
+            if GLOBALS[G_QUALITY] is not None and GLOBALS[G_RELAY] is None:
+                GLOBALS[G_QUALITY].record(monitor, force_save=True)
+
+    def stop(self):
+        self.stopping = True
+        if self.ts_response is not None:
+            self.ts_response.close()
+        if self.player_proc is not None:
+            if self.player_proc.poll() is None:
+                self.player_proc.kill()
+            self.player_proc.wait()
+        if self.pump_thread is not None:
+            # it's a daemon, so if it's stuck in a read it's left to die
+            self.pump_thread.join(DEMUX_STOP_TIMEOUT)
+        self.player_proc = None
+        self.ts_response = None
+        self.pump_thread = None
+        self.monitor = None
+
+    def is_playing(self):
+        return self.player_proc is not None and self.player_proc.poll() is None
+
+    def quality(self):
+        if self.monitor is None:
+            return None
+        return self.monitor.summary()
+
+    def next_audio(self):
+        if self.demuxer is None or len(self.demuxer.audio_streams) < 2:
+            print('Info, the stream has only one audio track')
+            return
+        # the player may need a different decoder, so start afresh on the new track
+        self.audio_index = (self.demuxer.audio_index + 1) % len(self.demuxer.audio_streams)
+        self.play(self.stream_url)
+
+
+##########################################################################################
+class FakePlayer(PlayerBackend):
+    ''' plays nothing, but records what it was asked to do, for testing '''
+
+    name = PB_FAKE
+
+    def __init__(self, play_cmd_array):
+        super().__init__(play_cmd_array)
+        self.commands = []
+        self.stream_url = ''
+
+    def play(self, stream_url):
+        self.commands.append(('play', stream_url, ))
+        self.stream_url = stream_url
+
+    def stop(self):
+        self.commands.append(('stop', ))
+        self.stream_url = ''
+
+    def is_playing(self):
+        return self.stream_url != ''
+
+    def next_audio(self):
+        self.commands.append(('audio', ))
 
-    url = stream_url
+    def close(self):
+        self.commands.append(('close', ))
+        self.stream_url = ''
 
-    play_cmd = GLOBALS[G_MY_SETTINGS].get(SETTINGS_SECTION, PLAYER_COMMAND)
-    play_cmd_array = play_cmd.split()
-    play_cmd_array.append(url)
-    print('Debug, play command is "%s"' % ('" "'.join(play_cmd_array), ))
 
-    player_proc = subprocess.Popen(play_cmd_array, shell=False)
-    GLOBALS[G_PLAYER_PID] = player_proc.pid
-    if GLOBALS[G_DBG_LEVEL]: print('Debug, player pid %d' % (player_proc.pid, ))
+##########################################################################################
+def make_player_backend(settings_dir):
+    ''' creates the player backend chosen in the settings '''
+
+    global GLOBALS
+
+    play_cmd_array = GLOBALS[G_CONFIG].player_backend_argv
+    backend = GLOBALS[G_CONFIG].player_backend
 
-    player_active = True
+    if backend == PB_MPV:
+        return MpvIpcPlayer(play_cmd_array, os.path.join(settings_dir, MPV_IPC_SOCKET))
+    if backend == PB_DEMUX:
+        return DemuxPlayer(play_cmd_array)
+    if backend == PB_FAKE:
+        return FakePlayer(play_cmd_array)
+    return SpawnPlayer(play_cmd_array)
 
-    # we check every second if the player is running or told to kill it
-    while player_active:
+##########################################################################################
+class RelayConsumer:
+    ''' one listener to a relayed stream, with a bounded queue of chunks so a
+        listener which can't keep up is dropped instead of holding up the rest;
+        a None chunk means the stream ended '''
+
+    def __init__(self, address):
+        self.address = address
+        self.chunks = queue.Queue(RELAY_QUEUE_CHUNKS)
+        self.dropped = False
+
+
+class RelayUpstream:
+    ''' one stream from the server, read by its own thread and copied to each
+        consumer's queue; it ends when it's had no consumers for a while '''
+
+    def __init__(self, relay, chan_uuid, profile):
+        self.relay = relay
+        self.chan_uuid = chan_uuid
+        self.profile = profile
+        self.consumers = []             # changed with the relay's lock held
+        self.ended = False
+        self.idle_since = None
+        self.ts_response = None
+        self.monitor = StreamMonitor(relay.chan_name(chan_uuid))
+        self.thread = Thread(target=self.run, daemon=True)
+
+    def run(self):
+        ''' the thread which reads the stream from the server '''
+
+        try:
+            stream_url = make_stream_url(self.chan_uuid, self.profile)
+            self.ts_response = requests.get(stream_url, stream=True, timeout=PROBE_CONNECT_TIMEOUT)
+            if self.ts_response.status_code != 200:
+                print(f'Warning, relay stream { self.monitor.chan_name } returned code '
+                      f'{ self.ts_response.status_code }')
+                return
+            for chunk in self.ts_response.iter_content(chunk_size=TS_PACKET_SIZE * RELAY_CHUNK_PACKETS):
+                self.monitor.feed(chunk)
+                if GLOBALS[G_QUALITY] is not None:
+                    GLOBALS[G_QUALITY].record(self.monitor)
+                if not self.fan_out(chunk):
+                    break
+        # closing the relay, or the upstream, closes the stream, which ends up here too
+        except (requests.exceptions.RequestException, OSError, ValueError, AttributeError) as relay_err:
+            if not self.relay.closing and not self.ended:
+                print(f'Warning, relay stream { self.monitor.chan_name } stopped: { relay_err }')
+        finally:
+            if self.ts_response is not None:
+                self.ts_response.close()
+            self.relay.upstream_ended(self)
+            if GLOBALS[G_QUALITY] is not None:
+                GLOBALS[G_QUALITY].record(self.monitor, force_save=True)
+
+    def fan_out(self, chunk):
+        ''' copies a chunk to every consumer, dropping those whose queue is full
+            returns False once the upstream has been idle long enough to end '''
+
+        dropped = []
+        with self.relay.lock:
+            for consumer in list(self.consumers):
+                try:
+                    consumer.chunks.put_nowait(chunk)
+                except queue.Full:
+                    consumer.dropped = True
+                    self.consumers.remove(consumer)
+                    dropped.append(consumer.address)
+            self.relay.dropped += len(dropped)
+            if dropped and not self.consumers:
+                self.relay.linger(self)
+
+            now = time.monotonic()
+            if self.consumers:
+                self.idle_since = None
+            elif self.idle_since is None:
+                self.idle_since = now
+            elif now - self.idle_since >= RELAY_LINGER_SECS:
+                # ended under the lock, so nobody subscribes to it from now on
+                self.relay.forget(self)
+
+        for address in dropped:
+            print(f'Warning, relay dropped { address } from { self.monitor.chan_name }, it fell behind')
+        return not self.ended
+
+    def close(self):
+        ''' closes the server stream; closing waits for a read in progress, which
+            takes until the read timeout if the stream has stalled, so it's done
+            in a thread of its own '''
+
+        if self.ts_response is not None:
+            Thread(target=self.ts_response.close, daemon=True).start()
+
+
+class StreamRelay:
+    ''' holds one server subscription per channel and profile and shares it with
+        every listener, the local player and other players on the LAN, through a
+        small HTTP server with the same stream paths as the TVH server, so two
+        listeners to a channel use one tuner and one stream's bandwidth '''
+
+    def __init__(self, port, public):
+        self.lock = Lock()
+        self.upstreams = {}             # (channel uuid, profile) => RelayUpstream
+        self.chan_table = None          # for naming channels, set by radio_app
+        self.closing = False
+        self.listeners = 0              # consumers served, ever
+        self.shared = 0                 # consumers which joined an upstream already open
+        self.dropped = 0                # consumers dropped for falling behind
+        bind_host = '' if public else '127.0.0.1'
+        self.httpd = ThreadingHTTPServer((bind_host, port), RelayRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.relay = self
+        self.port = self.httpd.server_address[1]
+        self.thread = Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def local_url(self, chan_uuid, profile):
+        ''' builds the URL for the local player to stream a channel through the relay '''
+        return f'http://127.0.0.1:{ self.port }/{ TS_URL_STR }/{ chan_uuid }' \
+               f'?profile={ urllib.parse.quote(profile, safe="") }'
+
+    def chan_name(self, chan_uuid):
+        ''' names a channel for messages and the quality log '''
+
+        chan_table = self.chan_table
+        chan_num = chan_table.find(chan_uuid) if chan_table is not None else None
+        if chan_num is None:
+            return chan_uuid
+        return chan_table.name(chan_num)
+
+    def subscribe(self, chan_uuid, profile, address):
+        ''' adds a consumer of a channel, opening its upstream if it's not open '''
+
+        consumer = RelayConsumer(address)
+        with self.lock:
+            upstream = self.upstreams.get((chan_uuid, profile, ))
+            if upstream is None:
+                upstream = RelayUpstream(self, chan_uuid, profile)
+                self.upstreams[(chan_uuid, profile, )] = upstream
+                upstream.thread.start()
+            else:
+                self.shared += 1
+            upstream.consumers.append(consumer)
+            upstream.idle_since = None
+            self.listeners += 1
+        if GLOBALS[G_DBG_LEVEL]:
+            print(f'Debug, relay { address } joined { upstream.monitor.chan_name } profile { profile }')
+        return consumer
+
+    def unsubscribe(self, consumer):
+        ''' removes a consumer, its upstream lingers on in case it's wanted again '''
+
+        with self.lock:
+            for upstream in self.upstreams.values():
+                if consumer in upstream.consumers:
+                    upstream.consumers.remove(consumer)
+                    if not upstream.consumers:
+                        self.linger(upstream)
+
+    def linger(self, upstream):
+        ''' starts the wait after an upstream's last consumer left, must be
+            called with the lock held; the wait is timed rather than checked as
+            data arrives, as a stalled stream may not send any '''
+
+        upstream.idle_since = time.monotonic()
+        linger_timer = Timer(RELAY_LINGER_SECS, self.reap, args=(upstream, ))
+        linger_timer.daemon = True
+        linger_timer.start()
+
+    def reap(self, upstream):
+        ''' closes an upstream which has had no consumers for the linger time '''
+
+        with self.lock:
+            if upstream.consumers or upstream.ended or upstream.idle_since is None or \
+               time.monotonic() - upstream.idle_since < RELAY_LINGER_SECS:
+                return
+            self.forget(upstream)
+        if GLOBALS[G_DBG_LEVEL]: print(f'Debug, relay closing idle { upstream.monitor.chan_name }')
+        upstream.close()
+
+    def forget(self, upstream):
+        ''' ends an upstream so no more consumers join it, must be called with the
+            lock held '''
+
+        upstream.ended = True
+        if self.upstreams.get((upstream.chan_uuid, upstream.profile, )) is upstream:
+            del self.upstreams[(upstream.chan_uuid, upstream.profile, )]
+
+    def upstream_ended(self, upstream):
+        ''' tells an upstream's consumers that its stream has ended '''
+
+        with self.lock:
+            self.forget(upstream)
+            for consumer in upstream.consumers:
+                try:
+                    consumer.chunks.put_nowait(None)
+                except queue.Full:
+                    consumer.dropped = True
+            upstream.consumers = []
+
+    def quality(self, chan_uuid):
+        ''' returns the quality summary of a channel being relayed, or None '''
+
+        with self.lock:
+            for ((upstream_uuid, _profile), upstream) in self.upstreams.items():
+                if upstream_uuid == chan_uuid:
+                    return upstream.monitor.summary()
+        return None
+
+    def status(self):
+        ''' returns a line describing the relay, for the info key '''
+
+        with self.lock:
+            streams = len(self.upstreams)
+            consumers = sum(len(upstream.consumers) for upstream in self.upstreams.values())
+        return f'port { self.port }, { streams } streams to { consumers } listeners now, ' \
+               f'{ self.listeners } listeners of which { self.shared } shared a stream, ' \
+               f'{ self.dropped } dropped for falling behind'
+
+    def close(self):
+        ''' stops serving and closes every upstream '''
+
+        self.closing = True
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        with self.lock:
+            upstreams = list(self.upstreams.values())
+        for upstream in upstreams:
+            upstream.close()
+
+
+class RelayRequestHandler(BaseHTTPRequestHandler):
+    ''' serves a relayed channel to one listener, waiting for the first chunk
+        before answering so a channel the server won't stream gets an error '''
+
+    timeout = RELAY_SEND_TIMEOUT
+
+    def do_GET(self):   # pylint:disable=invalid-name
+        ''' implement the http GET method '''
+
+        relay = self.server.relay
+        request = urllib.parse.urlsplit(self.path)
+        path_match = re.fullmatch(f'/{ TS_URL_STR }/([0-9a-f]{{{ TS_UUID_BYTES * 2 }}})', request.path)
+        if not path_match:
+            self.send_error(404)
+            return
+        profiles = urllib.parse.parse_qs(request.query).get('profile')
+        profile = profiles[0] if profiles else mode_profiles(GLOBALS[G_PLAY_MODE])[0]
+        # the upstream is asked for with our credentials, so only pass on known profiles
+        config = GLOBALS[G_CONFIG]
+        known_profiles = GLOBALS[G_PROFILES] or \
+                         (*config.ts_profiles_radio, *config.ts_profiles_tv, TS_PROFILE, )
+        if profile not in known_profiles:
+            self.send_error(400, 'Unknown stream profile')
+            return
+
+        consumer = relay.subscribe(path_match.group(1), profile, self.client_address[0])
         try:
-            # poll for playback process to end
-            player_proc.wait(timeout=1)
-            # only gets here if playback process ended
-            #print('Debug, player finished')
-            player_active = False
-            GLOBALS[G_STOP_PLAYBACK] = False
-            GLOBALS[G_PLAYER_PID] = 0
-
-        # if the player is still running this exception is called
-        except subprocess.TimeoutExpired:
+            chunk = consumer.chunks.get(timeout=PROBE_CONNECT_TIMEOUT * 2)
+            if chunk is None:
+                self.send_error(502, 'The TVH server did not stream the channel')
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'video/mp2t')
+            self.end_headers()
+            while True:
+                self.wfile.write(chunk)
+                chunk = self.next_chunk(consumer)
+                if chunk is None:
+                    return
+        except queue.Empty:
+            self.send_error(504, 'The TVH server did not start the stream')
+        # the listener went away
+        except OSError:
             pass
-            #print('Debug, player still running')
+        finally:
+            relay.unsubscribe(consumer)
+
+    def next_chunk(self, consumer):
+        ''' waits for the next chunk, returns None if the stream ended or the
+            listener was dropped '''
+
+        while not consumer.dropped and not self.server.relay.closing:
+            try:
+                return consumer.chunks.get(timeout=RELAY_POLL_SECS)
+            except queue.Empty:
+                if self.listener_gone():
+                    return None
+        return None
+
+    def listener_gone(self):
+        ''' returns True if the listener has hung up, which writing would notice,
+            but a stalled stream has nothing to write '''
+
+        try:
+            if not select.select([self.connection], [], [], 0)[0]:
+                return False
+            return self.connection.recv(1, socket.MSG_PEEK) == b''
+        except OSError:
+            return True
+
+    def log_message(self, format, *args):  # pylint:disable=redefined-builtin
+        ''' only logs requests when debugging '''
+        if GLOBALS[G_DBG_LEVEL]:
+            print(f'Debug, relay { self.client_address[0] } { format % args }')
+
+
+def make_play_url(chan_uuid, profile):
+    ''' builds the URL the player streams a channel from, through the relay if
+        there is one '''
+
+    global GLOBALS
+
+    if GLOBALS[G_RELAY] is not None:
+        return GLOBALS[G_RELAY].local_url(chan_uuid, profile)
+    return make_stream_url(chan_uuid, profile)
+
+
+def playing_quality():
+    ''' returns the quality summary of the stream playing, measured by the player
+        backend or, for players which read the stream themselves, by the relay,
+        or None if neither knows '''
 
-        # kill the player on demand
-        if GLOBALS[G_STOP_PLAYBACK]:
-            #print('Debug, killing player process')
-            player_proc.kill()
+    global GLOBALS
+
+    if GLOBALS[G_PLAYER] is None:
+        return None
+    quality = GLOBALS[G_PLAYER].quality()
+    if quality is None and GLOBALS[G_RELAY] is not None and GLOBALS[G_SUPERVISOR] is not None \
+       and GLOBALS[G_SUPERVISOR].target is not None and GLOBALS[G_PLAYER_PID]:
+        quality = GLOBALS[G_RELAY].quality(GLOBALS[G_SUPERVISOR].target[1])
+    return quality
+
+
+##########################################################################################
+class TunerWarmup:
+    ''' opens short lived subscriptions to the channels likely to be played next,
+        so the server has tuned their muxes by the time p is pressed; the
+        stream is never read, the subscriptions have the lowest weight so the
+        server takes their tuners back for anyone really watching, and at most
+        warmup_max are open at once, counting those let go but still waiting
+        on the server; channels no longer likely are let go, as is the channel
+        played '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.warming = {}               # channel uuid => Event which ends its warm-up
+        self.warmed_at = {}             # channel uuid => when its last warm-up was subscribed
+        self.subscribers = 0            # threads subscribed or subscribing, which hold tuners
+        self.timer = None
+        self.started = 0
+        self.refused = 0                # the server had no tuner, or failed
+        self.skipped = 0                # left out, the limit was reached
+        self.plays = 0
+        self.hits = 0                   # plays of a channel warmed just before
+
+    def schedule(self, chan_uuids):
+        ''' warms up the channels, most likely first, once the future channel
+            has stopped changing, so zapping quickly past channels doesn't
+            subscribe to each of them '''
+
+        global GLOBALS
+
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = GLOBALS[G_LOOP].call_later(WARMUP_DELAY_SECS, self.warm_up, chan_uuids)
+
+    def warm_up(self, chan_uuids):
+        ''' lets go of warm-ups which are no longer likely and starts the rest,
+            up to the limit '''
+
+        global GLOBALS
+
+        self.timer = None
+        warmup_max = GLOBALS[G_CONFIG].warmup_max
+        target = GLOBALS[G_SUPERVISOR].target if GLOBALS[G_SUPERVISOR] is not None else None
+        # the channel playing is already tuned
+        chan_uuids = [chan_uuid for chan_uuid in chan_uuids if target is None or chan_uuid != target[1]]
+        profile = mode_profiles(GLOBALS[G_PLAY_MODE])[0]
+
+        with self.lock:
+            for chan_uuid in list(self.warming):
+                if chan_uuid not in chan_uuids:
+                    self.warming.pop(chan_uuid).set()
+            for chan_uuid in chan_uuids:
+                if chan_uuid in self.warming:
+                    continue
+                if self.subscribers >= warmup_max:
+                    if warmup_max:
+                        self.skipped += 1
+                    continue
+                finished = Event()
+                self.warming[chan_uuid] = finished
+                self.started += 1
+                self.subscribers += 1
+                Thread(target=self.subscribe, args=(chan_uuid, profile, finished, ), daemon=True).start()
+
+    def subscribe(self, chan_uuid, profile, finished):
+        ''' the thread which holds one warm-up subscription open, without
+            reading it, until it times out or is let go '''
+
+        stream_url = f'{ make_stream_url(chan_uuid, profile) }&weight={ WARMUP_WEIGHT }'
+        try:
+            with requests.get(stream_url, stream=True, timeout=PROBE_CONNECT_TIMEOUT) as ts_response:
+                if ts_response.status_code != 200:
+                    with self.lock:
+                        self.refused += 1
+                    if GLOBALS[G_DBG_LEVEL]:
+                        print(f'Debug, warm-up of { chan_uuid } returned code { ts_response.status_code }')
+                else:
+                    # only a subscription the server accepted tuned anything
+                    with self.lock:
+                        self.warmed_at[chan_uuid] = time.monotonic()
+                    finished.wait(WARMUP_SECS)
+        except requests.exceptions.RequestException as warm_err:
+            with self.lock:
+                self.refused += 1
+            if GLOBALS[G_DBG_LEVEL]: print(f'Debug, warm-up of { chan_uuid } failed: { warm_err }')
+        finally:
+            with self.lock:
+                self.subscribers -= 1
+                if self.warming.get(chan_uuid) is finished:
+                    del self.warming[chan_uuid]
+
+    def played(self, chan_uuid):
+        ''' counts a channel being played, and whether it had been warmed up, and
+            lets go of its warm-up as the player's subscription takes over '''
+
+        with self.lock:
+            if chan_uuid in self.warming:
+                self.warming.pop(chan_uuid).set()
+            self.plays += 1
+            now = time.monotonic()
+            if chan_uuid in self.warmed_at and now - self.warmed_at[chan_uuid] < WARMUP_SECS:
+                self.hits += 1
+            # only recent warm-ups can be hits
+            self.warmed_at = {warm_uuid: warmed_at for (warm_uuid, warmed_at) in self.warmed_at.items()
+                              if now - warmed_at < WARMUP_SECS}
+
+    def status(self):
+        ''' returns a line describing the warm-ups, for the info key '''
+
+        with self.lock:
+            return f'{ len(self.warming) } warming now, { self.subscribers } subscribed, ' \
+                   f'{ self.started } started, ' \
+                   f'{ self.hits } of { self.plays } plays were warm, { self.refused } refused, ' \
+                   f'{ self.skipped } skipped at the limit of { GLOBALS[G_CONFIG].warmup_max }'
+
+    def close(self):
+        ''' lets go of every warm-up '''
+
+        if self.timer is not None:
+            self.timer.cancel()
+        with self.lock:
+            for finished in self.warming.values():
+                finished.set()
+            self.warming = {}
+
+
+def warmup_candidates(chan_table, chan_view, view_pos, direction):
+    ''' returns the uuids of the channels likely to be played next, most likely
+        first: the future channel, the next one in the direction of travel,
+        then the one behind '''
+
+    candidates = []
+    for pos in (view_pos, view_pos + direction, view_pos - direction, ):
+        if 0 <= pos < len(chan_view):
+            chan_uuid = chan_table.uuid(chan_view[pos])
+            if chan_uuid not in candidates:
+                candidates.append(chan_uuid)
+    return candidates
+
+
+##########################################################################################
+class PlaybackSupervisor:
+    ''' one long lived task which owns the player backend and is told what to do
+        through a queue; the player backend's blocking calls, and choosing a
+        profile, run in worker threads one at a time so they never block the
+        keyboard; if the player dies when it wasn't told to stop, e.g. on a
+        network hiccup, it's restarted on the same channel after a delay which
+        doubles with each failure, until the restart budget is used up '''
+
+    def __init__(self, settings_dir):
+        self.settings_dir = settings_dir
+        self.commands = asyncio.Queue()
+        self.task = None
+        self.target = None              # (channel name, channel uuid) wanted playing
+        self.profile = ''
+        self.started = 0.0              # when the player was last started
+        self.backoff = RESTART_BACKOFF_MIN
+        self.restart_times = []         # recent restarts, for the budget
+        self.restarts = 0               # restarts since the app started
+        self.chan_restarts = {}         # channel name => restarts
+        self.failures = 0               # times the budget ran out
+
+    def start(self):
+        ''' starts the supervisor task '''
+        self.task = asyncio.create_task(self.run())
+
+    def play(self, chan_name, chan_uuid):
+        ''' asks for a channel to be played '''
+        if GLOBALS[G_WARMUP] is not None:
+            GLOBALS[G_WARMUP].played(chan_uuid)
+        self.target = (chan_name, chan_uuid, )
+        self.commands.put_nowait(('play', chan_name, chan_uuid, ))
+
+    def stop(self):
+        ''' asks for playback to stop, which isn't a failure '''
+        self.target = None
+        self.commands.put_nowait(('stop', ))
+
+    def next_audio(self):
+        ''' asks for the next audio track of the channel playing '''
+        self.commands.put_nowait(('audio', ))
+
+    async def quit(self):
+        ''' stops playback, closes the player and waits for the task to end '''
+        if self.task is not None and not self.task.done():
+            self.target = None
+            self.commands.put_nowait(('quit', ))
+            await self.task
+
+    def status(self):
+        ''' returns a line describing the supervisor, for the info key '''
+        return f'restarts { self.restarts }, gave up { self.failures } times, ' \
+               f'by channel { self.chan_restarts }'
+
+    def start_player(self, chan_name, chan_uuid, profile=None):
+        ''' plays the channel with the profile, or one it chooses, swapping the
+            backend first if a settings edit chose a different one '''
+
+        global GLOBALS
+
+        if GLOBALS[G_PLAYER].name != GLOBALS[G_CONFIG].player_backend:
+            GLOBALS[G_PLAYER].close()
+            GLOBALS[G_PLAYER] = make_player_backend(self.settings_dir)
+            print(f'Info, now using the { GLOBALS[G_PLAYER].name } player backend')
+
+        self.profile = profile or choose_profile(chan_uuid, GLOBALS[G_PLAY_MODE])
+        print(f'Info, using stream profile { self.profile }')
+        GLOBALS[G_CHAN_NAME_PLAYING] = chan_name
+        try:
+            GLOBALS[G_PLAYER].play(make_play_url(chan_uuid, self.profile))
+        except (OSError, RuntimeError, ValueError) as play_err:
+            print(f'Error, failed to start the player: { play_err }')
+        GLOBALS[G_PLAYER_PID] = GLOBALS[G_PLAYER].pid
+        self.started = time.monotonic()
+
+    def change_audio(self):
+        ''' switches the player to the next audio track '''
+
+        global GLOBALS
+
+        try:
+            GLOBALS[G_PLAYER].next_audio()
+        except (OSError, RuntimeError, ValueError) as audio_err:
+            print(f'Warning, failed to change the audio track: { audio_err }')
+        GLOBALS[G_PLAYER_PID] = GLOBALS[G_PLAYER].pid
+
+    def stop_player(self):
+        ''' stops the player '''
+
+        global GLOBALS
+
+        try:
+            GLOBALS[G_PLAYER].stop()
+        except (OSError, ValueError) as stop_err:
+            print(f'Warning, failed to stop the player cleanly: { stop_err }')
+        GLOBALS[G_CHAN_NAME_PLAYING] = ''
+        GLOBALS[G_PLAYER_PID] = 0
+
+    def lighter_profile(self):
+        ''' returns the next lighter profile if the stream playing keeps stalling,
+            which a player can often ride out without failing, else None '''
+
+        global GLOBALS
+
+        quality = playing_quality()
+        if quality is None or quality['stalls'] < PROFILE_STEP_DOWN_STALLS:
+            return None
+        profiles = mode_profiles(GLOBALS[G_PLAY_MODE])
+        if self.profile not in profiles[:-1]:
+            return None
+        # so choosing a profile skips it until it's measured again
+        GLOBALS[G_PROFILE_STATS][self.profile] = {'kbps': quality['kbps'], 'realtime': 0.0,
+                                                  'when': time.monotonic(), }
+        return profiles[profiles.index(self.profile) + 1]
+
+    def player_failed(self, chan_name):
+        ''' handles the player dying unasked; returns the seconds to wait before
+            restarting it, or None if the restart budget is used up '''
+
+        global GLOBALS
+
+        now = time.monotonic()
+        if now - self.started > RESTART_STABLE_SECS:
+            self.backoff = RESTART_BACKOFF_MIN
+        self.restart_times = [when for when in self.restart_times if now - when < RESTART_WINDOW]
+        # the network may no longer sustain the profile, so measure it again
+        forget_profile_stats(self.profile)
+
+        GLOBALS[G_PLAYER_PID] = 0
+        if len(self.restart_times) >= RESTART_BUDGET:
+            print(f'Error, player keeps failing on { chan_name }, giving up')
+            self.failures += 1
+            self.target = None
+            GLOBALS[G_CHAN_NAME_PLAYING] = ''
+            return None
+
+        self.restart_times.append(now)
+        self.restarts += 1
+        self.chan_restarts[chan_name] = self.chan_restarts.get(chan_name, 0) + 1
+        delay = self.backoff
+        self.backoff = min(self.backoff * 2, RESTART_BACKOFF_MAX)
+        print(f'Warning, player failed on { chan_name }, restarting in { delay }s')
+        return delay
+
+    async def run(self):
+        ''' the supervisor task '''
+
+        global GLOBALS
+
+        restart_at = None
+        while True:
+            timeout = SUPERVISOR_POLL_SECS
+            if restart_at is not None:
+                timeout = max(0, min(timeout, restart_at - time.monotonic()))
+            try:
+                command = await asyncio.wait_for(self.commands.get(), timeout)
+            except asyncio.TimeoutError:
+                command = None
+
+            # keys may change the target whilst a player call is in progress
+            target = self.target
+            if command is None:
+                if restart_at is not None:
+                    if time.monotonic() >= restart_at:
+                        restart_at = None
+                        if target is not None:
+                            await asyncio.to_thread(self.start_player, *target)
+                elif target is not None:
+                    if not await asyncio.to_thread(GLOBALS[G_PLAYER].is_playing):
+                        delay = self.player_failed(target[0])
+                        if delay is not None:
+                            restart_at = time.monotonic() + delay
+                    else:
+                        lighter = self.lighter_profile()
+                        if lighter is not None:
+                            print(f'Warning, { target[0] } keeps stalling with profile { self.profile }, '
+                                  f'switching to { lighter }')
+                            await asyncio.to_thread(self.start_player, *target, lighter)
+
+            elif command[0] == 'play':
+                restart_at = None
+                self.backoff = RESTART_BACKOFF_MIN
+                self.restart_times = []
+                await asyncio.to_thread(self.start_player, command[1], command[2])
+
+            elif command[0] == 'stop':
+                restart_at = None
+                await asyncio.to_thread(self.stop_player)
+
+            elif command[0] == 'audio':
+                if target is not None and restart_at is None:
+                    await asyncio.to_thread(self.change_audio)
+
+            elif command[0] == 'quit':
+                await asyncio.to_thread(self.stop_player)
+                await asyncio.to_thread(GLOBALS[G_PLAYER].close)
+                break
+
+            # what's playing may have changed, and the stream health changes anyway
+            publish_status()
+
+
+##########################################################################################
+class StatusBlock:
+    ''' publishes the app's state in a small memory mapped file, so other
+        programs can poll it as often as they like without sockets or parsing
+        output; only the event loop writes it, using a sequence lock rather than
+        a lock readers would have to take: the sequence is made odd, the body is
+        written, then the sequence is made even again '''
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.sequence = 0
+        self.fields = {'updated': 0.0, 'player_pid': 0, 'kbps': 0, 'cc_errors': 0, 'stalled_ms': 0,
+                       'play_mode': '', 'chan_tag': '', 'playing': '', 'future': '', }
+        self.last_fields = None
+
+        block_size = STATUS_HEADER.size + STATUS_BODY.size
+        with open(file_name, 'a+b') as status_handle:
+            status_handle.truncate(block_size)
+        self.status_fd = os.open(file_name, os.O_RDWR)
+        self.block = mmap.mmap(self.status_fd, block_size)
+        STATUS_HEADER.pack_into(self.block, 0, STATUS_MAGIC, STATUS_VERSION, STATUS_BODY.size,
+                                self.sequence)
+
+    def publish(self, **changes):
+        ''' updates some fields and writes the block, if anything changed '''
+
+        self.fields.update(changes)
+        # everything but the update time, which would always differ
+        current_fields = tuple(self.fields[field] for field in STATUS_FIELDS[1:])
+        if current_fields == self.last_fields:
+            return
+        self.last_fields = current_fields
+        self.fields['updated'] = time.time()
+        body = self.pack()
+
+        # the sequence is written as one aligned word, the rest of the header never changes
+        sequence_at = STATUS_HEADER.size - STATUS_SEQUENCE.size
+        self.sequence += 1
+        self.block[sequence_at:STATUS_HEADER.size] = STATUS_SEQUENCE.pack(self.sequence & 0xffffffff)
+        self.block[STATUS_HEADER.size:] = body
+        self.sequence += 1
+        self.block[sequence_at:STATUS_HEADER.size] = STATUS_SEQUENCE.pack(self.sequence & 0xffffffff)
+
+    def pack(self):
+        ''' returns the body for the fields '''
+
+        def text(field, size):
+            # cut on a character boundary, so the reader can always decode it
+            return self.fields[field].encode('utf-8')[:size].decode('utf-8', errors='ignore').encode('utf-8')
+
+        return STATUS_BODY.pack(self.fields['updated'], self.fields['player_pid'], self.fields['kbps'],
+                                self.fields['cc_errors'], self.fields['stalled_ms'],
+                                text('play_mode', 8), text('chan_tag', 64),
+                                text('playing', 128), text('future', 128))
+
+    def close(self):
+        ''' marks nothing as playing and unmaps the file, which is left for
+            readers to find '''
+
+        self.publish(player_pid=0, kbps=0, stalled_ms=0, playing='')
+        self.block.close()
+        os.close(self.status_fd)
+
+
+def publish_status(**changes):
+    ''' writes the current state to the status block, with any changes the
+        caller knows about which aren't in GLOBALS '''
+
+    global GLOBALS
+
+    if GLOBALS[G_STATUS] is None:
+        return
+    quality = playing_quality()
+    if quality is not None:
+        changes.update(kbps=quality['kbps'], cc_errors=quality['cc_errors'],
+                       stalled_ms=int(quality['stalled_secs'] * 1000))
+    GLOBALS[G_STATUS].publish(player_pid=GLOBALS[G_PLAYER_PID], play_mode=GLOBALS[G_PLAY_MODE],
+                              playing=GLOBALS[G_CHAN_NAME_PLAYING],
+                              future=GLOBALS[G_CHAN_NAME_FUTURE], **changes)
+
+
+def read_status(file_name):
+    ''' the reader for other programs; reads the status block without any lock,
+        retrying if the block was being written at the time
+        returns a dict of the fields, or None if there's no valid status block '''
+
+    try:
+        with open(file_name, 'rb') as status_handle:
+            block = mmap.mmap(status_handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        for _ in range(STATUS_READ_TRIES):
+            (magic, version, body_size, sequence) = STATUS_HEADER.unpack_from(block, 0)
+            if magic != STATUS_MAGIC or version != STATUS_VERSION or body_size != STATUS_BODY.size:
+                return None
+            if sequence & 1:
+                time.sleep(0)
+                continue
+            body = STATUS_BODY.unpack_from(block, STATUS_HEADER.size)
+            if STATUS_SEQUENCE.unpack_from(block, STATUS_HEADER.size - STATUS_SEQUENCE.size)[0] == sequence:
+                status = dict(zip(STATUS_FIELDS, body))
+                for field in STATUS_FIELDS[5:]:
+                    status[field] = status[field].rstrip(b'\0').decode('utf-8')
+                return status
+            time.sleep(0)
+        return None
+    except struct.error:
+        return None
+    finally:
+        block.close()
 
-    print('play_channel exiting')
-    GLOBALS[G_CHAN_NAME_PLAYING] = ''
 
 ##########################################################################################
 # SIGINT/ctrl-c handler
-def sigint_handler(_signal_number, _frame):
+def sigint_handler():
     ''' called when signal 2 or CTRL-C hits process, simply flags request to quit '''
 
     global GLOBALS
 
     print('\nCTRL-C QUIT')
     GLOBALS[G_QUIT_FLAG] = True
-    GLOBALS[G_EVENT].set()
+    GLOBALS[G_EVENTS].put_nowait(('quit', ))
+
+
+##########################################################################################
+def run_in_background(func, *args):
+    ''' runs a blocking function in a worker thread, without waiting for it,
+        so it can't hold up the keyboard '''
+
+    global GLOBALS
+
+    task = asyncio.create_task(asyncio.to_thread(func, *args))
+    # the loop only keeps weak references to tasks
+    GLOBALS[G_BG_TASKS].add(task)
+    task.add_done_callback(GLOBALS[G_BG_TASKS].discard)
+
+
+##########################################################################################
+def run_in_daemon_thread(func, *args):
+    ''' like asyncio.to_thread, but in a daemon thread, for calls such as long
+        polls which shouldn't delay quitting whilst they finish
+        returns a future for the result '''
+
+    global GLOBALS
+
+    loop = GLOBALS[G_LOOP]
+    future = loop.create_future()
+
+    def set_result(result, exception):
+        if not future.done():
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
+
+    def runner():
+        try:
+            (result, exception) = (func(*args), None, )
+        except Exception as func_exc:   # pylint:disable=broad-except
+            (result, exception) = (None, func_exc, )
+        try:
+            loop.call_soon_threadsafe(set_result, result, exception)
+        except RuntimeError:
+            pass    # the loop has closed, we're quitting
+
+    Thread(target=runner, daemon=True).start()
+    return future
 
 
 ##########################################################################################
-def keyboard_listen_thread():
-    ''' keyboard listening thread, sets raw input and uses sockets to
-        get single key strokes without waiting, triggering an event. '''
+def keyboard_start():
+    ''' sets the terminal to cbreak, so single key strokes arrive without waiting
+        for return, and has the event loop read them as they arrive, rather than
+        a thread polling for them
+        returns the old terminal settings for keyboard_stop '''
 
     global GLOBALS
 
     # set term to raw, so doesn't wait for return
     old_settings = termios.tcgetattr(sys.stdin)
     tty.setcbreak(sys.stdin.fileno())
+    GLOBALS[G_LOOP].add_reader(sys.stdin.fileno(), keyboard_read)
+    return old_settings
+
+
+def keyboard_read():
+    ''' called by the event loop when keys can be read, queues them as events '''
+
+    global GLOBALS
+
+    # read directly from the fd, as sys.stdin's buffer could hide keys from the loop
+    keys = os.read(sys.stdin.fileno(), 64).decode('utf-8', errors='ignore')
+    if not keys:
+        # end of input, there'll never be another key
+        GLOBALS[G_LOOP].remove_reader(sys.stdin.fileno())
+        return
+    for key in keys:
+        GLOBALS[G_EVENTS].put_nowait(('key', key, ))
+
 
-    while GLOBALS[G_QUIT_FLAG] == 0:
-        # a bit ugly, but use a timeout just to occasionally check QUIT_FLAG
-        readable_sockets, _o, _e = select.select([sys.stdin], [], [], KEYBOARD_POLL_TIMEOUT)
-        if readable_sockets:
-            GLOBALS[G_KEY_STROKE] = sys.stdin.read(1)
-            GLOBALS[G_EVENT].set()
+def keyboard_stop(old_settings):
+    ''' stops reading keys and sets the terminal back to how it was '''
+
+    global GLOBALS
 
+    GLOBALS[G_LOOP].remove_reader(sys.stdin.fileno())
     # set term back to cooked
     termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_settings)
 
@@ -781,242 +3969,502 @@ def keyboard_listen_thread():
 
 
 ##########################################################################################
-def radio_app():
-    '''this runs the radio appliance'''
+async def run_startup(steps):
+    ''' runs the start up steps as a dependency graph, each step starting as soon
+        as the steps it needs have finished, so steps which don't depend on each
+        other, like reading local files and asking the server things, overlap
+
+        steps is a list of (name, names of the steps it needs, function), where the
+        function is given the dict of results so far and returns an awaitable;
+        a step must come after the steps it needs
+        returns the dict of step name => result '''
 
     global GLOBALS
 
-    # read the streams file into a boringly simple dict
-    streams_chan_map = read_list_file(os.path.join(os.environ['HOME'],
-                                                   SETTINGS_DIR))
+    started = time.monotonic()
+    results = {}
+    timings = {}                        # step name => (start, end) seconds after started
+    tasks = {}
+
+    async def run_step(name, needs, step_func):
+        await asyncio.gather(*(tasks[need] for need in needs))
+        step_start = time.monotonic() - started
+        results[name] = await step_func(results)
+        timings[name] = (step_start, time.monotonic() - started, )
+
+    for (name, needs, step_func) in steps:
+        tasks[name] = asyncio.create_task(run_step(name, needs, step_func))
+    try:
+        await asyncio.gather(*tasks.values())
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+    if GLOBALS[G_DBG_LEVEL]:
+        for (name, (step_start, step_end)) in sorted(timings.items(), key=lambda timing: timing[1]):
+            print(f'Debug, start up step { name } ran from { round(step_start, 3) }s '
+                  f'to { round(step_end, 3) }s')
+        # walk back from the last step to finish, through whichever step it
+        # needed finished last
+        needs_of = {name: needs for (name, needs, step_func) in steps}
+        path = [max(timings, key=lambda name: timings[name][1])]
+        while needs_of[path[-1]]:
+            path.append(max(needs_of[path[-1]], key=lambda name: timings[name][1]))
+        print(f'Debug, start up took { round(timings[path[0]][1], 3) }s, critical path '
+              f'{ " -> ".join(f"{ name } { round(timings[name][1] - timings[name][0], 3) }s" for name in reversed(path)) }')
+
+    return results
+
+
+async def startup_fetch_logos(results):
+    ''' start up step which starts fetching the logos of the channels '''
 
-    if streams_chan_map:
-        print(f'There are { len(streams_chan_map) } streams')
+    global GLOBALS
 
-    # get the favourites; if favourites are empty change the default
-    # mode to TVH from favourites
-    #favourites_chan_map = read_list_file(os.path.join(os.environ['HOME'],
-    #                                                  SETTINGS_DIR, FAVOURITES_LIST))
-    #if favourites_chan_map:
-    #    print(f'There are { len(favourites_chan_map) } favourites')
-    else:
-        GLOBALS[G_RADIO_MODE] = RM_TVH
-
-    # get the TVH channel map into the same format dict as the streams and favourites
-    tvh_chan_map = get_tvh_chan_urls()
-
-    #if GLOBALS[G_RADIO_MODE] == RM_TVH:
-    #    print('tvh radio mode')
-    #    chan_map = tvh_chan_map
-    #elif GLOBALS[G_RADIO_MODE] == RM_STR:
-    #    print('streaming radio mode')
-    #    chan_map = streams_chan_map
-    #elif GLOBALS[G_RADIO_MODE] == RM_FAV:
-    #    print('favourites radio mode')
-    #    chan_map = favourites_chan_map
-    #else:
-    #    print('Error, invalid radio mode')
-    #    sys.exit(1)
-
-    # sort and count channels for whatever mode we're in
-    chan_names = list(tvh_chan_map.keys())  # get an indexable array
-    max_chan = len(tvh_chan_map)            # max channel number
-
-    chan_num = 0                        # start at first channel
-    GLOBALS[G_CHAN_NUM_FUTURE] = chan_num
-    GLOBALS[G_CHAN_NAME_FUTURE] = chan_names[chan_num]
-
-    ####
-    # now we have the data, lets do the radio thing!
+    GLOBALS[G_LOGOS] = results['logo index']
+    GLOBALS[G_LOGOS].fetch(results['channels'].icons)
 
-    # trap ctrl-x/sigint so we can clean up
-    signal.signal(signal.SIGINT, sigint_handler)
-
-    # handles on the threads
-    threads = {}
-
-    # start a thread to listen to the keyboard
-    threads['KB'] = Thread(target=keyboard_listen_thread)
-    threads['KB'].start()
-
-    # do we need to start a thread to act as the web server?
-    #if GLOBALS[G_MY_SETTINGS].get(SETTINGS_SECTION) == '1':
-    #    bind_host = ''
-    #else:
-    #    bind_host = 'localhost'
-    #wport = GLOBALS[G_MY_SETTINGS].get(SETTINGS_SECTION, WEB_PORT)
-    #if wport and wport != '' and wport.isnumeric():
-    #    httpd = HTTPServer((bind_host, int(wport)), MyHTTPRequestHandler)
-    #    threads['WWW'] = Thread(target=start_web_listener, args=(httpd, ))
-    #    threads['WWW'].start()
-
-    #print('Playing next: %s' % (GLOBALS[G_CHAN_NAME_FUTURE], ))
-    # SIGINT and keyboard strokes and (one day) GPIO events all get funnelled here
-    while not GLOBALS[G_QUIT_FLAG]:
-        GLOBALS[G_EVENT].wait() # Blocks until the flag becomes true.
-        if GLOBALS[G_KEY_STROKE] != '':
-            if GLOBALS[G_KEY_STROKE] == 'A':   # secret key code :-)
-                api_test_func()
-
-            elif GLOBALS[G_KEY_STROKE] in ('?', 'h'):
-                print_help()
-
-            #elif GLOBALS[G_KEY_STROKE] == 'l':
-                #GLOBALS[G_DBG_LEVEL] and print('list')
-                #print('list')
-                #print(', '.join(chan_names))
-
-            elif GLOBALS[G_KEY_STROKE] == 'd':
-                #GLOBALS[G_DBG_LEVEL] and print('down')
-                if GLOBALS[G_DBG_LEVEL]: print('down')
-                if chan_num > 0:
-                    chan_num = chan_num - 1
-
-            elif GLOBALS[G_KEY_STROKE] == 'e':
-                if GLOBALS[G_DBG_LEVEL]: print('e')
-                #streams_editor()
-
-            elif GLOBALS[G_KEY_STROKE] == 'E':
-                if GLOBALS[G_DBG_LEVEL]: print('E')
-                #channel_editor(chan_map)
-                #max_chan = len(chan_map)
-                #chan_names = list(chan_map.keys())  # get an indexable array
-
-            elif GLOBALS[G_KEY_STROKE] == 'f':
-                if GLOBALS[G_DBG_LEVEL]: print('favourite')
-                #if chan_names[chan_num] in favourites_chan_map:
-                #    print('Removing channel %s to favourites' % (chan_names[chan_num], ))
-                #    del favourites_chan_map[chan_names[chan_num]]
-                #else:
-                #    print(f'Adding channel { chan_names[chan_num] } to favourites')
-                #    favourites_chan_map[chan_names[chan_num]] = chan_map[chan_names[chan_num]]
-                #    favourites_chan_map = dict(sorted(favourites_chan_map.items()))
-                # re-count the channels
-                #if GLOBALS[G_RADIO_MODE] == RM_FAV:
-                #    max_chan = len(chan_map)
-                #    chan_names = list(chan_map.keys())  # get an indexable array
 
-                #save_favourites(favourites_chan_map)
+async def startup_keys(startup):
+    ''' handles the keyboard whilst starting up; help and quit work straight
+        away, other keys are kept for when there are channels to act on
+        returns the kept events, or None if asked to quit '''
 
-            elif GLOBALS[G_KEY_STROKE] == 'F':
-                if GLOBALS[G_DBG_LEVEL]: print('F')
-                #if favourites_chan_map:
-                #    print('Favourites:')
-                #    print_channel_list('\t', favourites_chan_map)
-                else:
-                    print('Warning, no favourites set')
+    global GLOBALS
+
+    early_events = []
+    while not startup.done():
+        next_event = asyncio.create_task(GLOBALS[G_EVENTS].get())
+        await asyncio.wait((startup, next_event, ), return_when=asyncio.FIRST_COMPLETED)
+        # cancelling fails if an event arrived at the same time
+        if next_event.cancel():
+            continue
+        event = next_event.result()
+        if event == ('key', 'q', ) or event[0] == 'quit':
+            print('Quit!')
+            GLOBALS[G_QUIT_FLAG] = True
+            startup.cancel()
+            return None
+        if event[0] == 'key' and event[1] in ('?', 'h'):
+            print_help()
+        else:
+            early_events.append(event)
 
+    return early_events
 
-            #elif GLOBALS[G_KEY_STROKE] == 'm':
-            #    if GLOBALS[G_DBG_LEVEL]: print('mode')
-                # if changing mode, kill a running player
-            #    while GLOBALS[G_PLAYER_PID] != 0:
-            #        print('Waiting to stop playback before changing mode')
-            #        GLOBALS[G_STOP_PLAYBACK] = True
-            #        time.sleep(1)
 
-                # cycle between modes and choose the channel map for new mode
-                if GLOBALS[G_RADIO_MODE] == RM_TVH:
-                    #GLOBALS[G_RADIO_MODE] = RM_STR
-                    chan_map = streams_chan_map
+##########################################################################################
+async def radio_app():
+    '''this runs the radio appliance, everything it waits for, keys, signals,
+       the server and the timers, is an event on the one asyncio loop'''
 
-                #elif GLOBALS[G_RADIO_MODE] == RM_STR:
-                #    GLOBALS[G_RADIO_MODE] = RM_FAV
-                #    chan_map = favourites_chan_map
+    global GLOBALS
 
-                #elif GLOBALS[G_RADIO_MODE] == RM_FAV:
-                #    GLOBALS[G_RADIO_MODE] = RM_TVH
-                #    chan_map = tvh_chan_map
-                else:
-                    print('Error, mode change went wrong!')
-
-                print(f'Debug, mode is now { GLOBALS[G_RADIO_MODE] }')
-                chan_num = 0                        # start at first channel
-                chan_names = list(chan_map.keys())  # get an indexable array
-                max_chan = len(chan_map)            # max channel number
-
-
-            elif GLOBALS[G_KEY_STROKE] == 'p':
-                if GLOBALS[G_DBG_LEVEL]: print('play')
-                if GLOBALS[G_PLAYER_PID] != 0:
-                    print('Setting STOP_PLAYBACK true')
-                    GLOBALS[G_STOP_PLAYBACK] = True
-                    # wait for the sub process to finish, ugly polling hack!
-                    while GLOBALS[G_PLAYER_PID] != 0:
-                        print('Info, waiting to stop playback')
-                        time.sleep(1)
-                    # playback has finished
-                    threads['PB'].join()
-                    del threads['PB']
-                else:
-                    GLOBALS[G_CHAN_NAME_PLAYING] = chan_names[chan_num]
-                    print('attempting to play channel %d/%s' % (chan_num, chan_names[chan_num],))
-                    stream_url = tvh_chan_map[chan_names[chan_num]]
-                    threads['PB'] = Thread(target=play_channel, args=(stream_url, ))
-                    threads['PB'].start()
-
-            elif GLOBALS[G_KEY_STROKE] == 'q':
-                print('Quit!')
-                GLOBALS[G_QUIT_FLAG] = 1
-                GLOBALS[G_STOP_PLAYBACK] = True
-                if GLOBALS[G_PLAYER_PID] != 0:
-                    # wait for the sub process to finish, ugly polling hack!
-                    while GLOBALS[G_PLAYER_PID] != 0:
-                        print('Info, waiting to stop playback')
-                        time.sleep(1)
-                    # playback has finished
-                    threads['PB'].join()
-                    del threads['PB']
-
-            elif GLOBALS[G_KEY_STROKE] == 's':
-                if GLOBALS[G_CHAN_NAME_PLAYING]:
-                    tts_file = chan_data_to_tts_file(GLOBALS[G_CHAN_NAME_PLAYING])
-                    play_file(tts_file)
-                else:
-                    print('Debug, not playing a channel so not speaking it\'s name')
+    GLOBALS[G_LOOP] = asyncio.get_running_loop()
+    GLOBALS[G_EVENTS] = asyncio.Queue()
 
-            elif GLOBALS[G_KEY_STROKE] == 'S':
-                print(f'Debug, speaking future channel name { GLOBALS[G_CHAN_NAME_FUTURE]}')
-                tts_file = chan_data_to_tts_file(GLOBALS[G_CHAN_NAME_FUTURE])
-                play_file(tts_file)
+    settings_dir = os.path.join(os.environ['HOME'], SETTINGS_DIR)
 
-            elif GLOBALS[G_KEY_STROKE] == 't':
-                play_time()
+    # trap ctrl-x/sigint so we can clean up
+    GLOBALS[G_LOOP].add_signal_handler(signal.SIGINT, sigint_handler)
+
+    # listen to the keyboard straight away, keys pressed whilst starting up are
+    # kept until there's a channel list for them to act on
+    old_term_settings = keyboard_start()
+
+    # handles on the tasks, cancelled when quitting
+    tasks = {}
+
+    try:
+        # start up steps which don't depend on each other run at the same time,
+        # those asking the server in daemon threads so quitting needn't wait for them
+        startup = asyncio.create_task(run_startup([
+            # read the streams file into a boringly simple dict
+            ('streams', (), lambda results: asyncio.to_thread(read_list_file, settings_dir)),
+            # get the TVH channel map into the same format dict as the streams and favourites
+            ('channels', (), lambda results: run_in_daemon_thread(get_tvh_chan_urls)),
+            # find which stream profiles the server has, to check the configured ones
+            ('profiles', (), lambda results: run_in_daemon_thread(get_tvh_profiles)),
+            # the players use the persistent auth token, so find out now if it's wrong
+            ('auth', (), lambda results: run_in_daemon_thread(check_tvh_pauth)),
+            ('logo index', (), lambda results: asyncio.to_thread(
+                LogoCache, os.path.join(settings_dir, LOGO_DIR),
+                GLOBALS[G_CONFIG].logo_cache_bytes, GLOBALS[G_CONFIG].logo_fetchers,
+                GLOBALS[G_CONFIG].logo_thumb_size)),
+            # per channel stream quality, recorded by players which see the stream data
+            ('quality', (), lambda results: asyncio.to_thread(
+                QualityLog, os.path.join(settings_dir, QUALITY_FILE))),
+            # fetch the channel logos in the background
+            ('logos', ('channels', 'logo index', ), startup_fetch_logos),
+        ]))
+        early_events = await startup_keys(startup)
+        if early_events is None:
+            return
+        startup_results = startup.result()
+
+        streams_chan_map = startup_results['streams']
+        if streams_chan_map:
+            print(f'There are { len(streams_chan_map) } streams')
+
+        # get the favourites; if favourites are empty change the default
+        # mode to TVH from favourites
+        #favourites_chan_map = read_list_file(os.path.join(os.environ['HOME'],
+        #                                                  SETTINGS_DIR, FAVOURITES_LIST))
+        #if favourites_chan_map:
+        #    print(f'There are { len(favourites_chan_map) } favourites')
+        else:
+            GLOBALS[G_RADIO_MODE] = RM_TVH
+
+        tvh_chan_map = startup_results['channels']
+        GLOBALS[G_PROFILES] = startup_results['profiles']
+        warn_missing_profiles()
+        GLOBALS[G_QUALITY] = startup_results['quality']
+        GLOBALS[G_PLAY_MODE] = GLOBALS[G_CONFIG].play_mode
+
+        #if GLOBALS[G_RADIO_MODE] == RM_TVH:
+        #    print('tvh radio mode')
+        #    chan_map = tvh_chan_map
+        #elif GLOBALS[G_RADIO_MODE] == RM_STR:
+        #    print('streaming radio mode')
+        #    chan_map = streams_chan_map
+        #elif GLOBALS[G_RADIO_MODE] == RM_FAV:
+        #    print('favourites radio mode')
+        #    chan_map = favourites_chan_map
+        #else:
+        #    print('Error, invalid radio mode')
+        #    sys.exit(1)
+
+        # the table is already sorted, so start with a view of all channels
+        if len(tvh_chan_map) == 0:
+            print('Error, no channels, check the settings and the TVH server')
+            return
+
+        GLOBALS[G_CHAN_TAG] = ''            # all channels
+        chan_view = tvh_chan_map.view(GLOBALS[G_CHAN_TAG])
+        view_pos = 0                        # position in the view
+        chan_num = chan_view[view_pos]      # start at first channel
+        GLOBALS[G_CHAN_NUM_FUTURE] = chan_num
+        GLOBALS[G_CHAN_NAME_FUTURE] = tvh_chan_map.name(chan_num)
+
+        # the player backend lives as long as the app, so a persistent player
+        # can switch channels without being restarted
+        GLOBALS[G_PLAYER] = make_player_backend(settings_dir)
+        print(f'Info, using the { GLOBALS[G_PLAYER].name } player backend')
+        GLOBALS[G_SUPERVISOR] = PlaybackSupervisor(settings_dir)
+        GLOBALS[G_WARMUP] = TunerWarmup()
+        direction = 1                       # which way u and d last moved through the channels
+
+        # share one server stream per channel between the player and the LAN
+        if GLOBALS[G_CONFIG].relay_port:
+            try:
+                GLOBALS[G_RELAY] = StreamRelay(GLOBALS[G_CONFIG].relay_port, GLOBALS[G_CONFIG].relay_public)
+                GLOBALS[G_RELAY].chan_table = tvh_chan_map
+                print(f'Info, relaying streams on port { GLOBALS[G_RELAY].port }')
+            except OSError as relay_err:
+                print(f'Warning, no stream relay: { relay_err }')
+
+        # publish the state for other programs
+        try:
+            GLOBALS[G_STATUS] = StatusBlock(os.path.join(settings_dir, STATUS_FILE))
+            publish_status(chan_tag=tvh_chan_map.tag_name(GLOBALS[G_CHAN_TAG]))
+        except (OSError, ValueError) as status_err:
+            print(f'Warning, no status block for other programs: { status_err }')
+
+        ####
+        # now we have the data, lets do the radio thing!
+
+        # the playback supervisor task, is waited for by its quit()
+        GLOBALS[G_SUPERVISOR].start()
+
+        # apply edits to the settings file
+        tasks['CFG'] = asyncio.create_task(
+            config_watch(os.path.join(settings_dir, SETTINGS_FILE)))
+
+        # follow channel changes
+        tasks['COMET'] = asyncio.create_task(comet_listen())
+
+        # index the programme guide for searching
+        tasks['EPG'] = asyncio.create_task(epg_watch())
+
+        # do we need to start a thread to act as the web server?
+        #if GLOBALS[G_MY_SETTINGS].get(SETTINGS_SECTION) == '1':
+        #    bind_host = ''
+        #else:
+        #    bind_host = 'localhost'
+        #wport = GLOBALS[G_MY_SETTINGS].get(SETTINGS_SECTION, WEB_PORT)
+        #if wport and wport != '' and wport.isnumeric():
+        #    httpd = HTTPServer((bind_host, int(wport)), MyHTTPRequestHandler)
+        #    threads['WWW'] = Thread(target=start_web_listener, args=(httpd, ))
+        #    threads['WWW'].start()
+
+        #print('Playing next: %s' % (GLOBALS[G_CHAN_NAME_FUTURE], ))
+        # SIGINT and keyboard strokes and (one day) GPIO events all get funnelled here
+        while not GLOBALS[G_QUIT_FLAG]:
+            if early_events:
+                event = early_events.pop(0)
+            else:
+                event = await GLOBALS[G_EVENTS].get()
+            if event[0] == 'quit':
+                break
+
+            # apply channel changes pushed by the server
+            if event[0] == 'chan_updates':
+                if GLOBALS[G_CHAN_UPDATES].empty():
+                    continue    # already applied along with an earlier event
+                (tvh_chan_map, chan_num, chan_view, view_pos) = apply_chan_updates(tvh_chan_map, chan_num,
+                                                                                  view_pos)
+                if GLOBALS[G_RELAY] is not None:
+                    GLOBALS[G_RELAY].chan_table = tvh_chan_map
+            elif event[0] == 'key' and GLOBALS[G_SEARCH_TEXT] is not None:
+                query = search_key(event[1])
+                if query:
+                    GLOBALS[G_EPG_RESULTS] = search_epg(query, tvh_chan_map)
+                continue
+            elif event[0] == 'key':
+                GLOBALS[G_KEY_STROKE] = event[1]
+
+            if GLOBALS[G_KEY_STROKE] != '':
+                if GLOBALS[G_KEY_STROKE] == 'A':   # secret key code :-)
+                    run_in_background(api_test_func,
+                                      [(TS_URL_PEG, f'{ GLOBALS[G_CONFIG].ts_url }/{ TS_URL_PEG }', False, )],
+                                      1, 1.0)
+
+                elif GLOBALS[G_KEY_STROKE] == 'a':
+                    if GLOBALS[G_DBG_LEVEL]: print('audio')
+                    GLOBALS[G_SUPERVISOR].next_audio()
+
+                elif GLOBALS[G_KEY_STROKE] in ('?', 'h'):
+                    print_help()
+
+                elif GLOBALS[G_KEY_STROKE] == '/':
+                    GLOBALS[G_SEARCH_TEXT] = ''
+
+                elif GLOBALS[G_KEY_STROKE] in '123456789':
+                    result_pos = int(GLOBALS[G_KEY_STROKE]) - 1
+                    if result_pos < len(GLOBALS[G_EPG_RESULTS]):
+                        found_num = tvh_chan_map.find(GLOBALS[G_EPG_RESULTS][result_pos])
+                        if found_num is None:
+                            print('Warning, that channel has been deleted')
+                        else:
+                            chan_num = found_num
+                            view_pos = tvh_chan_map.view_position(chan_view, chan_num)
+                            if view_pos is None:
+                                # the channel isn't in the tag, so go back to all channels
+                                GLOBALS[G_CHAN_TAG] = ''
+                                chan_view = tvh_chan_map.view(GLOBALS[G_CHAN_TAG])
+                                view_pos = tvh_chan_map.view_position(chan_view, chan_num)
+                            print('attempting to play channel %d/%s' % (chan_num, tvh_chan_map.name(chan_num),))
+                            GLOBALS[G_SUPERVISOR].play(tvh_chan_map.name(chan_num), tvh_chan_map.uuid(chan_num))
+                    else:
+                        print(f'Warning, there\'s no search result { GLOBALS[G_KEY_STROKE] }')
+
+                #elif GLOBALS[G_KEY_STROKE] == 'l':
+                    #GLOBALS[G_DBG_LEVEL] and print('list')
+                    #print('list')
+                    #print(', '.join(chan_names))
+
+                elif GLOBALS[G_KEY_STROKE] == 'd':
+                    #GLOBALS[G_DBG_LEVEL] and print('down')
+                    if GLOBALS[G_DBG_LEVEL]: print('down')
+                    direction = -1
+                    if view_pos > 0:
+                        view_pos = view_pos - 1
+                        chan_num = chan_view[view_pos]
+
+                elif GLOBALS[G_KEY_STROKE] == 'i':
+                    print(f'Playing: { GLOBALS[G_CHAN_NAME_PLAYING] or "nothing" }, '
+                          f'{ GLOBALS[G_PLAYER].name } player pid { GLOBALS[G_PLAYER_PID] }, '
+                          f'play mode { GLOBALS[G_PLAY_MODE] }')
+                    print(f'Supervisor: { GLOBALS[G_SUPERVISOR].status() }')
+                    quality = playing_quality()
+                    if quality is not None:
+                        print(f'Stream quality: { format_quality(quality) }')
+                    if GLOBALS[G_RELAY] is not None:
+                        print(f'Relay: { GLOBALS[G_RELAY].status() }')
+                    if GLOBALS[G_CONFIG].warmup_max or GLOBALS[G_WARMUP].started:
+                        print(f'Warm-up: { GLOBALS[G_WARMUP].status() }')
+                    history = GLOBALS[G_QUALITY].describe(GLOBALS[G_CHAN_NAME_PLAYING])
+                    if history is not None:
+                        print(f'Channel quality: { history }')
+
+                elif GLOBALS[G_KEY_STROKE] == 'e':
+                    if GLOBALS[G_DBG_LEVEL]: print('e')
+                    #streams_editor()
+
+                elif GLOBALS[G_KEY_STROKE] == 'E':
+                    if GLOBALS[G_DBG_LEVEL]: print('E')
+                    #channel_editor(chan_map)
+                    #max_chan = len(chan_map)
+                    #chan_names = list(chan_map.keys())  # get an indexable array
+
+                elif GLOBALS[G_KEY_STROKE] == 'f':
+                    if GLOBALS[G_DBG_LEVEL]: print('favourite')
+                    #if chan_names[chan_num] in favourites_chan_map:
+                    #    print('Removing channel %s to favourites' % (chan_names[chan_num], ))
+                    #    del favourites_chan_map[chan_names[chan_num]]
+                    #else:
+                    #    print(f'Adding channel { chan_names[chan_num] } to favourites')
+                    #    favourites_chan_map[chan_names[chan_num]] = chan_map[chan_names[chan_num]]
+                    #    favourites_chan_map = dict(sorted(favourites_chan_map.items()))
+                    # re-count the channels
+                    #if GLOBALS[G_RADIO_MODE] == RM_FAV:
+                    #    max_chan = len(chan_map)
+                    #    chan_names = list(chan_map.keys())  # get an indexable array
+
+                    #save_favourites(favourites_chan_map)
+
+                elif GLOBALS[G_KEY_STROKE] == 'F':
+                    if GLOBALS[G_DBG_LEVEL]: print('F')
+                    #if favourites_chan_map:
+                    #    print('Favourites:')
+                    #    print_channel_list('\t', favourites_chan_map)
+                    #else:
+                    print('Warning, no favourites set')
 
-            elif GLOBALS[G_KEY_STROKE] == 'u':
-                if GLOBALS[G_DBG_LEVEL]: print('up')
-                if chan_num < max_chan - 1:
-                    chan_num = chan_num + 1
 
-            #elif GLOBALS[G_KEY_STROKE] == 'm':
-            #    if GLOBALS[G_RADIO_MODE] == RM_TVH:
-            #        GLOBALS[G_RADIO_MODE] = RM_STR
-            #    else:
-            #        GLOBALS[G_RADIO_MODE] = RM_TVH
-            #        get_tvh_chan_urls()
-            #    print(f'Mode now { GLOBALS[G_RADIO_MODE] }')
+                #elif GLOBALS[G_KEY_STROKE] == 'm':
+                #    if GLOBALS[G_DBG_LEVEL]: print('mode')
+                    # if changing mode, kill a running player
+                #    while GLOBALS[G_PLAYER_PID] != 0:
+                #        print('Waiting to stop playback before changing mode')
+                #        GLOBALS[G_STOP_PLAYBACK] = True
+                #        time.sleep(1)
 
-            else:
-                print('Unknown key')
+                    # cycle between modes and choose the channel map for new mode
+                #    if GLOBALS[G_RADIO_MODE] == RM_TVH:
+                        #GLOBALS[G_RADIO_MODE] = RM_STR
+                #        chan_map = streams_chan_map
 
-            GLOBALS[G_KEY_STROKE] = ''
-        else:
-            print(f'Error, unknown command key "{ GLOBALS[G_KEY_STROKE] }"')
+                    #elif GLOBALS[G_RADIO_MODE] == RM_STR:
+                    #    GLOBALS[G_RADIO_MODE] = RM_FAV
+                    #    chan_map = favourites_chan_map
 
-        GLOBALS[G_CHAN_NUM_FUTURE] = chan_num
-        GLOBALS[G_CHAN_NAME_FUTURE] = chan_names[chan_num]
-        GLOBALS[G_EVENT].clear() # Resets the flag.
-        print(f'Current channel: { G_CHAN_NAME_PLAYING }')
-        print(f'Future channel: { GLOBALS[G_CHAN_NAME_FUTURE] }')
+                    #elif GLOBALS[G_RADIO_MODE] == RM_FAV:
+                    #    GLOBALS[G_RADIO_MODE] = RM_TVH
+                    #    chan_map = tvh_chan_map
+                #    else:
+                #        print('Error, mode change went wrong!')
 
-    #if httpd:
-    #    print('Waiting for web service to shut down')
-    #    httpd.shutdown()
-    #    time.sleep(1)
+                #    print(f'Debug, mode is now { GLOBALS[G_RADIO_MODE] }')
+                #    chan_num = 0                        # start at first channel
+                #    chan_names = list(chan_map.keys())  # get an indexable array
+                #    max_chan = len(chan_map)            # max channel number
+
+                elif GLOBALS[G_KEY_STROKE] == 'm':
+                    if GLOBALS[G_DBG_LEVEL]: print('mode')
+                    # cycle through all channels then each channel tag
+                    tag_order = [''] + tvh_chan_map.tag_order()
+                    tag_pos = tag_order.index(GLOBALS[G_CHAN_TAG]) + 1
+                    GLOBALS[G_CHAN_TAG] = tag_order[tag_pos % len(tag_order)]
+                    chan_view = tvh_chan_map.view(GLOBALS[G_CHAN_TAG])
+
+                    # stay on the same channel if it's in the tag, else go to the first
+                    view_pos = tvh_chan_map.view_position(chan_view, chan_num)
+                    if view_pos is None:
+                        view_pos = 0
+                        chan_num = chan_view[view_pos]
+                    print(f'Tag now { tvh_chan_map.tag_name(GLOBALS[G_CHAN_TAG]) }, '
+                          f'{ len(chan_view) } channels')
+
+                elif GLOBALS[G_KEY_STROKE] == 'p':
+                    if GLOBALS[G_DBG_LEVEL]: print('play')
+                    if GLOBALS[G_SUPERVISOR].target is not None:
+                        print('Info, stopping playback')
+                        GLOBALS[G_SUPERVISOR].stop()
+                    else:
+                        print('attempting to play channel %d/%s' % (chan_num, tvh_chan_map.name(chan_num),))
+                        GLOBALS[G_SUPERVISOR].play(tvh_chan_map.name(chan_num), tvh_chan_map.uuid(chan_num))
+
+                elif GLOBALS[G_KEY_STROKE] == 'q':
+                    print('Quit!')
+                    GLOBALS[G_QUIT_FLAG] = 1
+
+                elif GLOBALS[G_KEY_STROKE] == 's':
+                    if GLOBALS[G_CHAN_NAME_PLAYING]:
+                        tts_file = chan_data_to_tts_file(GLOBALS[G_CHAN_NAME_PLAYING])
+                        run_in_background(play_file, tts_file)
+                    else:
+                        print('Debug, not playing a channel so not speaking it\'s name')
+
+                elif GLOBALS[G_KEY_STROKE] == 'S':
+                    print(f'Debug, speaking future channel name { GLOBALS[G_CHAN_NAME_FUTURE]}')
+                    tts_file = chan_data_to_tts_file(GLOBALS[G_CHAN_NAME_FUTURE])
+                    run_in_background(play_file, tts_file)
+
+                elif GLOBALS[G_KEY_STROKE] == 't':
+                    play_time()
+
+                elif GLOBALS[G_KEY_STROKE] == 'u':
+                    if GLOBALS[G_DBG_LEVEL]: print('up')
+                    direction = 1
+                    if view_pos < len(chan_view) - 1:
+                        view_pos = view_pos + 1
+                        chan_num = chan_view[view_pos]
+
+                elif GLOBALS[G_KEY_STROKE] == 'v':
+                    if GLOBALS[G_PLAY_MODE] == PM_RADIO:
+                        GLOBALS[G_PLAY_MODE] = PM_TV
+                    else:
+                        GLOBALS[G_PLAY_MODE] = PM_RADIO
+                    print(f'Play mode now { GLOBALS[G_PLAY_MODE] }, '
+                          f'profiles { ", ".join(mode_profiles(GLOBALS[G_PLAY_MODE])) }')
+
+                #elif GLOBALS[G_KEY_STROKE] == 'm':
+                #    if GLOBALS[G_RADIO_MODE] == RM_TVH:
+                #        GLOBALS[G_RADIO_MODE] = RM_STR
+                #    else:
+                #        GLOBALS[G_RADIO_MODE] = RM_TVH
+                #        get_tvh_chan_urls()
+                #    print(f'Mode now { GLOBALS[G_RADIO_MODE] }')
 
-    for thread_name in threads:
-        print(f'Debug, joining thread { thread_name } to this')
-        threads[thread_name].join()
+                else:
+                    print('Unknown key')
+
+                GLOBALS[G_KEY_STROKE] = ''
+
+            # get the server tuning where the user is heading
+            if chan_num != GLOBALS[G_CHAN_NUM_FUTURE] and GLOBALS[G_CONFIG].warmup_max:
+                GLOBALS[G_WARMUP].schedule(warmup_candidates(tvh_chan_map, chan_view, view_pos, direction))
+            GLOBALS[G_CHAN_NUM_FUTURE] = chan_num
+            GLOBALS[G_CHAN_NAME_FUTURE] = tvh_chan_map.name(chan_num)
+            print(f'Current channel: { GLOBALS[G_CHAN_NAME_PLAYING] }')
+            print(f'Future channel: { GLOBALS[G_CHAN_NAME_FUTURE] }')
+            # showing the logo also keeps it from being evicted
+            future_logo = GLOBALS[G_LOGOS].path(tvh_chan_map.icon(chan_num))
+            if GLOBALS[G_DBG_LEVEL]:
+                print(f'Debug, future channel logo { future_logo }')
+            publish_status(chan_tag=tvh_chan_map.tag_name(GLOBALS[G_CHAN_TAG]))
+
+            # prompt last, so the search is typed after it
+            if GLOBALS[G_SEARCH_TEXT] is not None:
+                print('Search: ', end='', flush=True)
+
+    finally:
+        #if httpd:
+        #    print('Waiting for web service to shut down')
+        #    httpd.shutdown()
+        #    time.sleep(1)
+
+        # whether quitting by key or by signal, stop playing and tidy up
+        keyboard_stop(old_term_settings)
+        GLOBALS[G_LOOP].remove_signal_handler(signal.SIGINT)
+        if GLOBALS[G_SUPERVISOR] is not None:
+            await GLOBALS[G_SUPERVISOR].quit()
+        if GLOBALS[G_WARMUP] is not None:
+            GLOBALS[G_WARMUP].close()
+        if GLOBALS[G_RELAY] is not None:
+            await asyncio.to_thread(GLOBALS[G_RELAY].close)
+            GLOBALS[G_RELAY] = None
+        if GLOBALS[G_LOGOS] is not None:
+            GLOBALS[G_LOGOS].close()
+        if GLOBALS[G_STATUS] is not None:
+            GLOBALS[G_STATUS].close()
+            GLOBALS[G_STATUS] = None
+
+        for task_name in tasks:
+            if GLOBALS[G_DBG_LEVEL]: print(f'Debug, cancelling task { task_name }')
+            tasks[task_name].cancel()
+        await asyncio.gather(*tasks.values(), *GLOBALS[G_BG_TASKS], return_exceptions=True)
 
 
 ##########################################################################################
@@ -1035,13 +4483,41 @@ def main():
                         action="store_true", help='increase the debug level')
     parser.add_argument('-s', '--setup', required=False,
                         action="store_true", help='run the setup process')
+    parser.add_argument('-l', '--load-test', required=False,
+                        action="store_true", help='load test the TVH server instead of running the radio')
+    parser.add_argument('--clients', required=False, type=int, default=LOAD_TEST_CLIENTS,
+                        help=f'load test concurrent clients, default { LOAD_TEST_CLIENTS }')
+    parser.add_argument('--duration', required=False, type=float, default=LOAD_TEST_SECS,
+                        help=f'load test seconds, default { LOAD_TEST_SECS }')
+    parser.add_argument('--endpoint', required=False, action='append',
+                        help=f'load test API path, may be repeated, default { TS_URL_PEG }')
+    parser.add_argument('--streams', required=False, type=int, default=0,
+                        help='load test also opens the first N channel streams')
+    parser.add_argument('--url', required=False,
+                        help='load test this server URL instead of the one in the settings')
+    parser.add_argument('--status', required=False, action='store_true',
+                        help='print the status of the running radio and exit')
     args = parser.parse_args()
 
+    if args.status:
+        status = read_status(os.path.join(settings_dir, STATUS_FILE))
+        if status is None:
+            print('Error, no status, is the radio running?')
+            sys.exit(1)
+        for (field, value) in status.items():
+            print(f'{ field }={ value }')
+        sys.exit(0)
+
     if args.debug:
         GLOBALS[G_DBG_LEVEL] += 1
         print(f'Debug, increased debug level to { GLOBALS[G_DBG_LEVEL] }')
 
-    if args.setup or config_bad < 0:
+    if args.load_test and not args.setup and (config_bad == 0 or args.url):
+        # a server given on the command line needs no settings file, e.g. in tests
+        if config_bad != 0:
+            GLOBALS[G_CONFIG] = Config(configparser.ConfigParser())
+        load_test_main(args)
+    elif args.setup or config_bad < 0:
         if config_bad < -1:
             print('Error, severe problem with settings, please fix and restart program')
             print(f'{ error_text}')
@@ -1050,7 +4526,7 @@ def main():
             print(f'{ error_text}')
         settings_editor(settings_file)
     else:
-        radio_app()
+        asyncio.run(radio_app())
 
 
 ##########################################################################################
@@ -1060,14 +4536,33 @@ if __name__ == "__main__":
     # initialise all globals
     GLOBALS[G_CHAN_NUM_FUTURE]  = 0         # the channel chosen but not playing
     GLOBALS[G_CHAN_NAME_PLAYING] = ''       # the channel currently playing
+    GLOBALS[G_CHAN_TAG]         = ''        # the channel tag being zapped, '' for all
+    GLOBALS[G_CHAN_UPDATES]     = queue.Queue() # channel changes for radio_app to apply
+    GLOBALS[G_CONFIG]           = None      # parsed settings, made by check_load_config_file
     GLOBALS[G_DBG_LEVEL]        = 0         #
-    GLOBALS[G_EVENT]            = Event()   # global event handler
+    GLOBALS[G_EPG]              = None      # programme guide index, made by epg_watch
+    GLOBALS[G_EPG_CHANGES]      = None      # guide changes kept whilst epg_watch fetches it
+    GLOBALS[G_EPG_RESULTS]      = []        # channel uuids of the last search's results
+    GLOBALS[G_EVENTS]           = None      # event queue of the loop, made by radio_app
+    GLOBALS[G_LOOP]             = None      # the asyncio event loop everything runs on
+    GLOBALS[G_BG_TASKS]         = set()     # references to fire and forget tasks
     GLOBALS[G_KEY_STROKE]       = ''        # no key been pressed
+    GLOBALS[G_LOGOS]            = None      # logo cache, made by radio_app
     GLOBALS[G_MY_SETTINGS]      = configparser.ConfigParser() # configuration are global
+    GLOBALS[G_PLAYER]           = None      # player backend, made by radio_app
     GLOBALS[G_PLAYER_PID]       = 0         # not playing
+    GLOBALS[G_PLAY_MODE]        = PM_TV     # radio or tv stream profiles
+    GLOBALS[G_PROFILES]         = []        # stream profiles the server has
+    GLOBALS[G_PROFILE_STATS]    = {}        # profile => measured throughput
+    GLOBALS[G_QUALITY]          = None      # stream quality log, made by radio_app
     GLOBALS[G_QUIT_FLAG]        = False     # quit not triggered
+    GLOBALS[G_RELAY]            = None      # stream relay, made by radio_app if wanted
+    GLOBALS[G_SEARCH_TEXT]      = None      # the search being typed, None if not searching
+    GLOBALS[G_STATUS]           = None      # status block for other programs, made by radio_app
 #    GLOBALS[G_RADIO_MODE]       = RM_FAV    # default
     GLOBALS[G_STOP_PLAYBACK]    = False     # playback stop triggered
+    GLOBALS[G_SUPERVISOR]       = None      # playback supervisor, made by radio_app
+    GLOBALS[G_WARMUP]           = None      # tuner warm-ups, made by radio_app
 
     main()
 